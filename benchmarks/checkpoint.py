@@ -0,0 +1,61 @@
+"""Exploring the elections that follow a leader crash, by replaying from scratch against forking a checkpoint.
+
+A five node cluster commits a log of entries and loses its leader. Each continuation reseeds the global random and
+runs until a new leader is elected; replaying rebuilds the cluster and its log first, forking starts from a
+checkpoint taken just after the crash. Run with `python -m benchmarks.checkpoint`.
+"""
+
+import argparse
+import random
+import time
+
+from src.faults import FaultyServer
+from src.raft import Node
+from src.state_machine import KeyValueStateMachine
+
+NODES = 5
+ENTRIES = 20_000
+CONTINUATIONS = 200
+
+
+def build(entries):
+    random.seed(0)
+    server = FaultyServer(seed=0)
+    for _ in range(NODES):
+        server.add_node(Node(server, state_machine=KeyValueStateMachine()))
+    server.run_until(lambda: server.leader() is not None)
+    futures = server.leader().propose_many(("set", i % 100, i) for i in range(entries))
+    server.run_until(futures[-1].done)
+    server.crash(server.leader().node_id)
+    return server
+
+
+def elect(server, seed):
+    random.seed(seed)
+    server.run_until(lambda: server.leader() is not None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=ENTRIES)
+    parser.add_argument("--continuations", type=int, default=CONTINUATIONS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    replays = 10
+    for seed in range(replays):
+        elect(build(args.entries), seed)
+    replay_seconds = (time.perf_counter() - started) / replays
+
+    checkpoint = build(args.entries).checkpoint()
+    started = time.perf_counter()
+    for seed in range(args.continuations):
+        elect(checkpoint.fork(), seed)
+    fork_seconds = (time.perf_counter() - started) / args.continuations
+
+    print(f"replaying from scratch  {replay_seconds * 1000:10.2f} ms per continuation")
+    print(f"forking a checkpoint    {fork_seconds * 1000:10.2f} ms per continuation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Election and replication performance of the simulated cluster against cluster size and log size.
+
+Every run is seeded, so two runs of the same commit take the same number of ticks and send the same messages; only
+the wall clock numbers vary. Results go to JSON so that commits can be compared:
+
+    python -m benchmarks.cluster --output before.json
+    python -m benchmarks.cluster --output after.json
+    python -m benchmarks.cluster --compare before.json after.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+from src.raft import Node, Role
+from src.server import Server
+from src.storage import MemoryStorage
+
+CLUSTER_SIZES = (3, 5, 11, 25, 51, 101)
+ENTRY_COUNTS = (100, 1000)
+REPEAT = 3
+MAX_TICKS = 10_000_000
+
+# what --compare reports, and whether a bigger number is better
+METRICS = {
+    "election_ticks": False,
+    "election_seconds": False,
+    "entries_per_second": True,
+    "messages_per_entry": False,
+    "peak_memory_bytes": False,
+}
+
+
+class CountingServer(Server):
+    def __init__(self):
+        super().__init__(app_messages_limit=0)
+        self.sent = Counter()
+
+    def broadcast_message(self, message):
+        self.sent[type(message).__name__] += 1
+        super().broadcast_message(message)
+
+
+def run(cluster_size, entry_count, seed):
+    random.seed(seed)
+    server = CountingServer()
+    nodes = [Node(server, MemoryStorage(node_id=uuid.UUID(int=i))) for i in range(cluster_size)]
+    for node in nodes:
+        server.add_node(node)
+
+    started = time.perf_counter()
+    if not server.run_until(lambda: any(node.current_role is Role.LEADER for node in nodes), MAX_TICKS):
+        raise RuntimeError(f"no leader after {MAX_TICKS} ticks")
+    election_seconds = time.perf_counter() - started
+    election_ticks = server.clock
+    leader = next(node for node in nodes if node.current_role is Role.LEADER)
+
+    sent_before = sum(server.sent.values())
+    started = time.perf_counter()
+    for i in range(entry_count):
+        leader.broadcast_log_message(i)
+    # a leader change part way through is part of what is being measured, so wait on any node
+    target = len(leader.log)
+    if not server.run_until(lambda: any(node.commit_length >= target for node in nodes), MAX_TICKS):
+        raise RuntimeError(f"nothing committed after {MAX_TICKS} ticks")
+    commit_seconds = time.perf_counter() - started
+    messages = sum(server.sent.values()) - sent_before
+
+    return {
+        "cluster_size": cluster_size,
+        "entries": entry_count,
+        "seed": seed,
+        "election_ticks": election_ticks,
+        "election_seconds": election_seconds,
+        "commit_ticks": server.clock - election_ticks,
+        "commit_seconds": commit_seconds,
+        "entries_per_second": entry_count / commit_seconds,
+        "messages": messages,
+        "messages_per_entry": messages / entry_count,
+        "messages_by_type": dict(server.sent),
+    }
+
+
+def peak_memory(cluster_size, entry_count, seed):
+    # a second, identical run: tracing allocations slows everything down too much to time the first one
+    tracemalloc.start()
+    try:
+        run(cluster_size, entry_count, seed)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def best_of(repeat, cluster_size, entry_count, seed):
+    # the simulation is deterministic, only the timings differ between repeats
+    runs = [run(cluster_size, entry_count, seed) for _ in range(repeat)]
+    result = runs[0]
+    result["election_seconds"] = min(r["election_seconds"] for r in runs)
+    result["commit_seconds"] = min(r["commit_seconds"] for r in runs)
+    result["entries_per_second"] = entry_count / result["commit_seconds"]
+    return result
+
+
+def benchmark(cluster_sizes, entry_counts, seeds, repeat=REPEAT, memory=True):
+    results = []
+    for cluster_size in cluster_sizes:
+        for entry_count in entry_counts:
+            for seed in seeds:
+                result = best_of(repeat, cluster_size, entry_count, seed)
+                if memory:
+                    result["peak_memory_bytes"] = peak_memory(cluster_size, entry_count, seed)
+                print(
+                    f"{cluster_size:>5} nodes {entry_count:>7} entries seed {seed:<4}"
+                    f"{result['election_ticks']:>10} ticks to elect"
+                    f"{result['entries_per_second']:>12.0f} entries/s"
+                    f"{result['messages_per_entry']:>10.1f} msgs/entry"
+                )
+                results.append(result)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(before_path, after_path):
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    key = lambda result: (result["cluster_size"], result["entries"], result["seed"])  # noqa: E731
+    baseline = {key(result): result for result in before["results"]}
+    print(f"{before['commit']} -> {after['commit']}")
+    for result in after["results"]:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        changes = []
+        for metric, higher_is_better in METRICS.items():
+            if metric in result and old.get(metric):
+                ratio = result[metric] / old[metric]
+                worse = ratio < 1 if higher_is_better else ratio > 1
+                changes.append(f"{metric} x{ratio:.2f}{' (worse)' if worse and abs(ratio - 1) > 0.05 else ''}")
+        print(f"{result['cluster_size']:>5} nodes {result['entries']:>7} entries seed {result['seed']:<4}", *changes)
+
+
+def parse_ints(value):
+    return [int(part) for part in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_ints, default=list(CLUSTER_SIZES))
+    parser.add_argument("--entries", type=parse_ints, default=list(ENTRY_COUNTS))
+    parser.add_argument("--seeds", type=parse_ints, default=[0])
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per configuration, the fastest counts")
+    parser.add_argument("--no-memory", action="store_true", help="skip the slower peak memory runs")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = benchmark(args.sizes, args.entries, args.seeds, args.repeat, memory=not args.no_memory)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
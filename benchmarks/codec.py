@@ -0,0 +1,75 @@
+"""Encode and decode throughput of the binary codec, against pickle and the pydantic models' JSON.
+
+Run with `python -m benchmarks.codec`.
+"""
+
+import argparse
+import pickle
+import timeit
+from uuid import uuid4
+
+from src.codec import decode, encode
+from src.messages import MODELS, LogMessage, LogRequest, LogResponse, VoteRequest, VoteResponse
+
+ENTRIES = 64
+PAYLOAD_BYTES = 1024
+
+
+def messages(entries, payload_bytes):
+    leader_id, follower_id = uuid4(), uuid4()
+    # payloads that compress about as well as typical commands do, neither random nor all the same byte
+    batch = [LogMessage(7, (b"set key-%06d " % i).ljust(payload_bytes, b"v")) for i in range(entries)]
+    return {
+        "heartbeat": LogRequest(7, leader_id, [], 1 << 20, 7, 1 << 20, follower_id),
+        "response": LogResponse(follower_id, 7, True, 1 << 20, leader_id, commit_length=1 << 20),
+        "vote request": VoteRequest(leader_id, 7, 1 << 20, 6),
+        "vote response": VoteResponse(follower_id, leader_id, 7, True),
+        f"{entries} x {payload_bytes}B entries": LogRequest(7, leader_id, batch, 1 << 20, 7, 1 << 20, follower_id),
+    }
+
+
+def to_json(message):
+    fields = message._asdict()
+    if isinstance(message, LogRequest):
+        fields["entries"] = [entry._asdict() for entry in message.entries]
+    return MODELS[type(message)](**fields).json()
+
+
+def from_json(data, kind):
+    return MODELS[kind].parse_raw(data)
+
+
+def per_call_us(call, number):
+    return min(timeit.repeat(call, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=ENTRIES)
+    parser.add_argument("--payload-bytes", type=int, default=PAYLOAD_BYTES)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    codecs = {
+        "binary": (encode, lambda data, kind: decode(data)),
+        "binary+zlib": (lambda message: encode(message, compress_over=4096), lambda data, kind: decode(data)),
+        "pickle": (
+            lambda message: pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL),
+            lambda data, kind: pickle.loads(data),
+        ),
+        "pydantic json": (to_json, from_json),
+    }
+    print(f"{'message':<24}{'codec':<16}{'bytes':>8}{'encode (us)':>14}{'decode (us)':>14}{'decode MB/s':>14}")
+    for name, message in messages(args.entries, args.payload_bytes).items():
+        for codec, (dump, load) in codecs.items():
+            data = dump(message)
+            encode_us = per_call_us(lambda: dump(message), args.number)
+            decode_us = per_call_us(lambda: load(data, type(message)), args.number)
+            print(
+                f"{name:<24}{codec:<16}{len(data):>8}{encode_us:>14.2f}{decode_us:>14.2f}"
+                f"{len(data) / decode_us:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
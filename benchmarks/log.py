@@ -0,0 +1,86 @@
+"""Memory per entry and the cost of appending, batching and truncating a one-million-entry log.
+
+Compares the columnar MemoryLog with the list of LogMessage tuples it replaced. Run with `python -m benchmarks.log`.
+"""
+
+import argparse
+import time
+import tracemalloc
+from array import array
+
+from src.messages import LogMessage
+from src.storage import LogEntries, MemoryLog
+
+ENTRIES = 1_000_000
+BATCH_ENTRIES = 64
+BATCH_BYTES = 64 * 1024
+
+
+def payloads(count):
+    # small ints are cached by the interpreter, so every log shares the same payload objects
+    return [i % 256 for i in range(count)]
+
+
+def measure(build):
+    # timed without tracemalloc, which slows allocation down several times over
+    started = time.perf_counter()
+    build()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    log = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return log, size, seconds
+
+
+def build_list(messages):
+    return [LogMessage(term=i // 1000 + 1, message=message) for i, message in enumerate(messages)]
+
+
+def build_columns(messages):
+    log = MemoryLog()
+    for i, message in enumerate(messages):
+        log.append(LogMessage(term=i // 1000 + 1, message=message))
+    return log
+
+
+def build_columns_bulk(messages):
+    log = MemoryLog()
+    for start in range(0, len(messages), 1000):
+        chunk = messages[start : start + 1000]
+        log.extend(LogEntries(array("q", [start // 1000 + 1]) * len(chunk), chunk))
+    return log
+
+
+def batches(log, count):
+    started = time.perf_counter()
+    position = 0
+    while position < count:
+        position += len(log.batch(position, BATCH_ENTRIES, BATCH_BYTES))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=ENTRIES)
+    args = parser.parse_args()
+    messages = payloads(args.entries)
+
+    entries, list_bytes, list_seconds = measure(lambda: build_list(messages))
+    print(f"list of LogMessage  {list_bytes / args.entries:6.1f} bytes/entry, built in {list_seconds:.2f}s")
+    del entries
+    log, column_bytes, column_seconds = measure(lambda: build_columns(messages))
+    print(f"MemoryLog.append    {column_bytes / args.entries:6.1f} bytes/entry, built in {column_seconds:.2f}s")
+    del log
+    log, _, bulk_seconds = measure(lambda: build_columns_bulk(messages))
+    print(f"MemoryLog.extend    {' ' * 18}built in {bulk_seconds:.2f}s")
+
+    print(f"batching the whole log took {batches(log, args.entries):.2f}s")
+    started = time.perf_counter()
+    for length in range(args.entries - 1000, 0, -args.entries // 10):
+        log.truncate(length)
+    print(f"10 truncations took {(time.perf_counter() - started) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Per-message construction and dispatch cost, with and without pydantic validation.
+
+Run with `python -m benchmarks.messages`.
+"""
+
+import random
+import timeit
+from uuid import uuid4
+
+from src.messages import LogMessage, LogRequest, LogResponse, VoteRequest, validate_message
+from src.raft import Node, Role
+from src.server import Server
+
+NUMBER = 5000
+
+
+def build_messages(leader_id, follower_id, entries):
+    return [
+        LogRequest(
+            term=1,
+            leader_id=leader_id,
+            entries=entries,
+            previous_log_index=0,
+            previous_log_term=0,
+            commit_length=0,
+            to_node=follower_id,
+        ),
+        LogResponse(node_id=follower_id, term=1, success=True, acknowledged=len(entries), to_node=leader_id),
+        VoteRequest(candidate_id=leader_id, term=1, last_log_index=0, last_log_term=0),
+    ]
+
+
+def per_call_us(statement, number=NUMBER):
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1e6
+
+
+def construction(strict, entry_count):
+    leader_id, follower_id = uuid4(), uuid4()
+    entries = [LogMessage(term=1, message=f"entry {i}") for i in range(entry_count)]
+    if strict:
+        return per_call_us(lambda: [validate_message(m) for m in build_messages(leader_id, follower_id, entries)])
+    return per_call_us(lambda: build_messages(leader_id, follower_id, entries))
+
+
+def dispatch(strict):
+    # a leader and a follower exchanging heartbeats: one LogRequest and one LogResponse per round
+    random.seed(0)
+    server = Server(strict=strict)
+    leader, follower = Node(server), Node(server)
+    server.add_node(leader)
+    server.add_node(follower)
+    leader.current_role = Role.LEADER
+    leader.current_leader = leader.node_id
+    leader.current_term = follower.current_term = 1
+    leader.heartbeat_timeout = follower.heartbeat_timeout = float("inf")
+
+    def round_trip():
+        leader.replicate_log(leader.node_id, follower.node_id)
+        server.iterate()
+        server.iterate()
+
+    return per_call_us(round_trip) / 2
+
+
+def main():
+    print(f"{'benchmark':<40}{'fast (us)':>12}{'strict (us)':>14}")
+    for entry_count in (0, 16):
+        name = f"construct 3 messages, {entry_count} entries"
+        print(f"{name:<40}{construction(False, entry_count):>12.2f}{construction(True, entry_count):>14.2f}")
+    print(f"{'dispatch per message':<40}{dispatch(False):>12.2f}{dispatch(True):>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
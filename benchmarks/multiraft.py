@@ -0,0 +1,84 @@
+"""Elections and idle heartbeat traffic of a Multi-Raft cluster against the number of groups it hosts.
+
+Every group has three replicas placed round-robin on the members. Once every group has a leader the cluster is left
+idle, and the batches and group messages sent over that window are counted per member pair and heartbeat interval.
+Run with `python -m benchmarks.multiraft`.
+"""
+
+import argparse
+import random
+import time
+
+from src.multiraft import MEMBER_HEARTBEAT_TICKS, Member, add_groups
+from src.raft import Role
+from src.server import Server
+
+GROUP_COUNTS = (100, 1000, 10_000)
+MEMBERS = 5
+IDLE_INTERVALS = 50
+MAX_TICKS = 1_000_000
+
+
+class CountingServer(Server):
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+        self.group_messages = 0
+
+    def broadcast_message(self, message):
+        self.batches += 1
+        self.group_messages += len(message.messages)
+        super().broadcast_message(message)
+
+
+def run(groups, members, quiesce, seed=0):
+    random.seed(seed)
+    server = CountingServer()
+    hosts = [Member(server, quiesce=quiesce) for _ in range(members)]
+    for member in hosts:
+        server.add_node(member)
+    placement = add_groups(hosts, range(groups))
+    started = time.perf_counter()
+    # checking for leaders costs as much as a few ticks per group, so only do it now and then
+    while server.clock < MAX_TICKS:
+        server.run_for(MEMBER_HEARTBEAT_TICKS)
+        if all(any(replica.current_role is Role.LEADER for replica in replicas) for replicas in placement.values()):
+            break
+    election_ticks, election_seconds = server.clock, time.perf_counter() - started
+    # let the last elections' traffic settle before measuring
+    server.run_for(10 * MEMBER_HEARTBEAT_TICKS)
+    server.batches = server.group_messages = 0
+    started = time.perf_counter()
+    server.run_for(IDLE_INTERVALS * MEMBER_HEARTBEAT_TICKS)
+    pairs = members * (members - 1)
+    return {
+        "election_ticks": election_ticks,
+        "election_seconds": election_seconds,
+        "idle_batches_per_pair_interval": server.batches / pairs / IDLE_INTERVALS,
+        "idle_group_messages_per_interval": server.group_messages / IDLE_INTERVALS,
+        "idle_seconds_per_interval": (time.perf_counter() - started) / IDLE_INTERVALS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, nargs="+", default=GROUP_COUNTS)
+    parser.add_argument("--members", type=int, default=MEMBERS)
+    args = parser.parse_args()
+    print(
+        f"{'groups':>7} {'quiesce':>7} {'elect ticks':>11} {'elect s':>8} {'batches/pair':>12} "
+        f"{'group msgs':>10} {'idle ms':>8}"
+    )
+    for groups in args.groups:
+        for quiesce in (False, True):
+            result = run(groups, args.members, quiesce)
+            print(
+                f"{groups:>7} {str(quiesce):>7} {result['election_ticks']:>11} {result['election_seconds']:>8.2f} "
+                f"{result['idle_batches_per_pair_interval']:>12.2f} "
+                f"{result['idle_group_messages_per_interval']:>10.1f} "
+                f"{result['idle_seconds_per_interval'] * 1000:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""How the sweep runner's throughput scales with worker processes.
+
+Runs the same sweep of independent simulations with 1, 2, 4, ... processes up to the number of cores and reports
+runs per second and the speedup over one process. Run with `python -m benchmarks.sweep`.
+"""
+
+import argparse
+import os
+import time
+
+from src.sweep import SimulationConfig, run_sweep
+
+RUNS_PER_PROCESS = 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=5000)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_processes:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_processes:
+        counts.append(args.max_processes)
+    config = SimulationConfig(ticks=args.ticks, crash_every=args.ticks // 4)
+    baseline = None
+    print(f"{'processes':>10}{'runs':>8}{'runs/s':>10}{'speedup':>10}")
+    for processes in counts:
+        runs = RUNS_PER_PROCESS * processes
+        started = time.perf_counter()
+        for _ in run_sweep([config], range(runs), processes=processes):
+            pass
+        rate = runs / (time.perf_counter() - started)
+        baseline = baseline or rate
+        print(f"{processes:>10}{runs:>8}{rate:>10.2f}{rate / baseline:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
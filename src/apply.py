@@ -0,0 +1,60 @@
+import asyncio
+from collections import deque
+
+# committed entries a stream holds for its consumer before the node stops applying
+APPLY_STREAM_CAPACITY = 1024
+
+
+class ApplyStream:
+    """
+    A node's committed entries as (index, message) pairs in log order, for an application that consumes them at its
+    own pace: with take(), by iterating, which stops once the stream is empty, or with `async for`, which waits for
+    more. No-op and configuration entries are left out.
+
+    The node applies an entry to its state machine as it puts it in the stream and stops applying while the stream
+    is full, so a consumer that falls behind holds back the node's last_applied instead of growing a buffer. With
+    Node.max_unapplied_entries set, that in turn caps how far the log runs ahead: the leader turns proposals away
+    and followers stop accepting entries. Installing a snapshot skips the entries it covers.
+    """
+
+    def __init__(self, capacity=APPLY_STREAM_CAPACITY):
+        self.capacity = capacity
+        self.entries = deque()
+        # called whenever a consumer makes room, the node then applies what it held back
+        self.on_room = None
+        self.waiter = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def room(self):
+        return self.capacity - len(self.entries)
+
+    def put(self, index, message):
+        self.entries.append((index, message))
+        if self.waiter is not None:
+            self.waiter.set()
+
+    def take(self, max_entries=None) -> list:
+        count = len(self.entries) if max_entries is None else min(max_entries, len(self.entries))
+        taken = [self.entries.popleft() for _ in range(count)]
+        if taken and self.on_room is not None:
+            self.on_room()
+        return taken
+
+    def clear(self):
+        # what the consumer hadn't taken when its node crashed, the node puts it in again as it reapplies
+        self.entries.clear()
+
+    def __iter__(self):
+        while self.entries:
+            yield from self.take()
+
+    async def __aiter__(self):
+        while True:
+            while not self.entries:
+                self.waiter = asyncio.Event()
+                await self.waiter.wait()
+            self.waiter = None
+            for entry in self.take():
+                yield entry
@@ -0,0 +1,67 @@
+import copy
+import random
+from concurrent.futures import Future
+
+
+class Checkpoint:
+    """
+    The whole state of a simulated cluster at one moment: the server, its nodes (crashed ones too) and the messages in
+    flight, and the global random state the nodes draw their timeouts from. fork() hands out an independent copy to
+    run on, as many times as wanted, so a fuzzer can branch from an interesting state, such as just before an
+    election, instead of replaying up to it every time.
+
+    Copying is deep except for what never changes: node ids, the payloads of log entries and app messages, and the
+    entries messages carry are shared, and MemoryLogs share their columns copy-on-write, so a fork costs about the
+    nodes' volatile state and their state machines rather than their logs. Pending proposals and reads get their own
+    futures in every fork, and its own metrics. Only clusters on MemoryStorage can be checkpointed.
+    """
+
+    def __init__(self, server):
+        self.random_state = random.getstate()
+        self.server = fork_server(server)
+
+    def fork(self):
+        # every fork starts from the same random state, reseed after forking (a FaultyServer's own Random too) to
+        # explore different continuations
+        random.setstate(self.random_state)
+        return fork_server(self.server)
+
+
+def fork_server(server):
+    # the app messages are payloads of committed entries, which are shared like the ones in the logs
+    memo = {id(server.app_messages): copy.copy(server.app_messages)}
+    for node in nodes(server):
+        memo[id(node.node_id)] = node.node_id
+        for future in pending_futures(node):
+            memo[id(future)] = fork_future(future)
+    return copy.deepcopy(server, memo)
+
+
+def nodes(server):
+    # Multi-Raft members are forked through their replicas
+    for node in list(server.nodes) + list(getattr(server, "crashed", {}).values()):
+        groups = getattr(node, "groups", None)
+        yield node
+        if groups is not None:
+            yield from groups.values()
+
+
+def pending_futures(node):
+    for future in getattr(node, "configuration_futures", ()):
+        yield future
+    for requests in (getattr(node, "proposal_futures", ()), getattr(node, "pending_reads", ())):
+        for request in requests:
+            yield request[-1]
+    for _, future in getattr(node, "proposal_buffer", ()):
+        if future is not None:
+            yield future
+
+
+def fork_future(future):
+    fork = Future()
+    if future.done():
+        if future.exception() is None:
+            fork.set_result(future.result())
+        else:
+            fork.set_exception(future.exception())
+    return fork
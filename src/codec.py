@@ -0,0 +1,363 @@
+"""
+A compact binary encoding of the Raft messages, for transports that shouldn't trust their peers with pickle.
+
+A message is a version byte and a type byte followed by its fields in order: node ids as their 16 raw bytes, ints
+as unsigned LEB128 varints, bools as a byte. A LogRequest's entries follow its other fields as a flags byte, an
+entry count and a block of (term, payload kind, payload length, payload) records, zlib-compressed when encode()
+is asked to and the block is big enough to be worth it. Decoding doesn't copy payloads: the entries of a decoded
+LogRequest are LogEntries whose payloads are memoryview slices of the buffer (or of the decompressed block), so the
+buffer must not be reused while they are alive.
+
+Entry payloads have to be bytes-like, apart from the None of a no-op entry and membership Configurations.
+"""
+
+import zlib
+from array import array
+from uuid import UUID
+
+from src.membership import Configuration
+from src.messages import InstallSnapshot, LogRequest, LogResponse, VoteRequest, VoteResponse
+from src.storage import LogEntries
+
+VERSION = 1
+
+LOG_REQUEST, LOG_RESPONSE, VOTE_REQUEST, VOTE_RESPONSE, INSTALL_SNAPSHOT = range(5)
+
+# payload kinds of a log entry
+RAW, NOOP, CONFIGURATION = range(3)
+
+# entry block flags
+COMPRESSED = 1
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def put_varint(buffer: bytearray, value: int):
+    if value < 0:
+        raise ValueError(f"can't encode negative int {value}")
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def get_varint(view, offset):
+    value = shift = 0
+    while True:
+        byte = view[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def put_uuid(buffer: bytearray, node_id: UUID):
+    buffer += node_id.bytes
+
+
+def get_uuid(view, offset):
+    end = offset + 16
+    if end > len(view):
+        raise DecodeError("truncated node id")
+    return UUID(bytes=bytes(view[offset:end])), end
+
+
+def put_ids(buffer: bytearray, node_ids):
+    put_varint(buffer, len(node_ids))
+    for node_id in sorted(node_ids):
+        put_uuid(buffer, node_id)
+
+
+def get_ids(view, offset):
+    count, offset = get_varint(view, offset)
+    node_ids = []
+    for _ in range(count):
+        node_id, offset = get_uuid(view, offset)
+        node_ids.append(node_id)
+    return frozenset(node_ids), offset
+
+
+def put_configuration(buffer: bytearray, configuration: Configuration):
+    put_ids(buffer, configuration.voters)
+    put_ids(buffer, configuration.learners)
+    buffer.append(configuration.old_voters is not None)
+    if configuration.old_voters is not None:
+        put_ids(buffer, configuration.old_voters)
+
+
+def get_configuration(view, offset):
+    voters, offset = get_ids(view, offset)
+    learners, offset = get_ids(view, offset)
+    old_voters = None
+    if view[offset]:
+        old_voters, offset = get_ids(view, offset + 1)
+    else:
+        offset += 1
+    return Configuration(voters, learners, old_voters), offset
+
+
+def put_entries(buffer: bytearray, entries):
+    for term, payload in entries:
+        if term < 0x80:
+            buffer.append(term)
+        else:
+            put_varint(buffer, term)
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            buffer.append(RAW)
+            length = len(payload)
+            if length < 0x80:
+                buffer.append(length)
+            else:
+                put_varint(buffer, length)
+            buffer += payload
+        elif payload is None:
+            buffer.append(NOOP)
+            buffer.append(0)
+        elif isinstance(payload, Configuration):
+            encoded = bytearray()
+            put_configuration(encoded, payload)
+            buffer.append(CONFIGURATION)
+            put_varint(buffer, len(encoded))
+            buffer += encoded
+        else:
+            raise TypeError(f"can't encode a {type(payload).__name__} entry payload, encode it to bytes first")
+
+
+def get_entries(view, offset, count):
+    # the varints are read inline when they fit in a byte, which terms and small payloads' lengths always do
+    terms = array("q")
+    payloads = []
+    size = len(view)
+    for _ in range(count):
+        term = view[offset]
+        if term < 0x80:
+            offset += 1
+        else:
+            term, offset = get_varint(view, offset)
+        kind = view[offset]
+        length = view[offset + 1]
+        if length < 0x80:
+            offset += 2
+        else:
+            length, offset = get_varint(view, offset + 1)
+        end = offset + length
+        if end > size:
+            raise DecodeError("truncated entry payload")
+        if kind == RAW:
+            payloads.append(view[offset:end])
+        elif kind == NOOP:
+            payloads.append(None)
+        elif kind == CONFIGURATION:
+            payloads.append(get_configuration(view[:end], offset)[0])
+        else:
+            raise DecodeError(f"unknown payload kind {kind}")
+        terms.append(term)
+        offset = end
+    return LogEntries(terms, payloads), offset
+
+
+def get_compressed_entries(view, offset, count):
+    # the rest of the message is the compressed block, which must inflate to exactly its declared length and hold
+    # exactly `count` entries; asking for a byte more than that is how a block that inflates further gets caught
+    # without inflating it any further
+    length, offset = get_varint(view, offset)
+    decompressor = zlib.decompressobj()
+    try:
+        block = decompressor.decompress(view[offset:], length + 1)
+    except zlib.error as error:
+        raise DecodeError(f"corrupt entries: {error}") from None
+    if len(block) != length or not decompressor.eof or decompressor.unused_data:
+        raise DecodeError("compressed entries don't match their declared length")
+    entries, end = get_entries(memoryview(block), 0, count)
+    if end != length:
+        raise DecodeError(f"{length - end} bytes after the last compressed entry")
+    return entries, len(view)
+
+
+def encode(message, compress_over=None, compress_level=1) -> bytes:
+    """
+    Encodes one message. A LogRequest whose entries take `compress_over` bytes or more has them compressed, at
+    zlib level `compress_level`; by default nothing is.
+    """
+    buffer = bytearray((VERSION,))
+    kind = type(message)
+    if kind is LogRequest:
+        buffer.append(LOG_REQUEST)
+        put_varint(buffer, message.term)
+        put_uuid(buffer, message.leader_id)
+        put_varint(buffer, message.previous_log_index)
+        put_varint(buffer, message.previous_log_term)
+        put_varint(buffer, message.commit_length)
+        put_uuid(buffer, message.to_node)
+        put_varint(buffer, message.read_round)
+        block = bytearray()
+        put_entries(block, message.entries)
+        if compress_over is not None and len(block) >= compress_over:
+            buffer.append(COMPRESSED)
+            put_varint(buffer, len(message.entries))
+            put_varint(buffer, len(block))
+            buffer += zlib.compress(block, compress_level)
+        else:
+            buffer.append(0)
+            put_varint(buffer, len(message.entries))
+            buffer += block
+    elif kind is LogResponse:
+        buffer.append(LOG_RESPONSE)
+        put_uuid(buffer, message.node_id)
+        put_varint(buffer, message.term)
+        buffer.append(message.success)
+        put_varint(buffer, message.acknowledged)
+        buffer.append(message.to_node is not None)
+        if message.to_node is not None:
+            put_uuid(buffer, message.to_node)
+        put_varint(buffer, message.read_round)
+        put_varint(buffer, message.conflict_term)
+        put_varint(buffer, message.conflict_index)
+        put_varint(buffer, message.commit_length)
+        put_varint(buffer, message.snapshot_offset)
+    elif kind is VoteRequest:
+        buffer.append(VOTE_REQUEST)
+        put_uuid(buffer, message.candidate_id)
+        put_varint(buffer, message.term)
+        put_varint(buffer, message.last_log_index)
+        put_varint(buffer, message.last_log_term)
+        buffer.append(message.pre_vote)
+    elif kind is VoteResponse:
+        buffer.append(VOTE_RESPONSE)
+        put_uuid(buffer, message.node_id)
+        put_uuid(buffer, message.candidate_id)
+        put_varint(buffer, message.term)
+        buffer.append(message.vote_granted)
+        buffer.append(message.pre_vote)
+    elif kind is InstallSnapshot:
+        buffer.append(INSTALL_SNAPSHOT)
+        put_varint(buffer, message.term)
+        put_uuid(buffer, message.leader_id)
+        put_varint(buffer, message.last_included_index)
+        put_varint(buffer, message.last_included_term)
+        put_varint(buffer, message.offset)
+        put_varint(buffer, len(message.data))
+        buffer += message.data
+        buffer.append(message.done)
+        put_uuid(buffer, message.to_node)
+    else:
+        raise TypeError(f"can't encode a {kind.__name__}")
+    return bytes(buffer)
+
+
+def decode(data):
+    """Decodes one message from a bytes-like object holding exactly that message, raising DecodeError if it doesn't."""
+    view = memoryview(data)
+    try:
+        message, offset = decode_fields(view)
+    except IndexError:
+        raise DecodeError("truncated message") from None
+    if offset != len(view):
+        raise DecodeError(f"{len(view) - offset} trailing bytes")
+    return message
+
+
+def decode_fields(view):
+    if len(view) < 2:
+        raise DecodeError("truncated message")
+    if view[0] != VERSION:
+        raise DecodeError(f"unsupported codec version {view[0]}")
+    decoder = DECODERS.get(view[1])
+    if decoder is None:
+        raise DecodeError(f"unknown message type {view[1]}")
+    return decoder(view, 2)
+
+
+def get_log_request(view, offset):
+    term, offset = get_varint(view, offset)
+    leader_id, offset = get_uuid(view, offset)
+    previous_log_index, offset = get_varint(view, offset)
+    previous_log_term, offset = get_varint(view, offset)
+    commit_length, offset = get_varint(view, offset)
+    to_node, offset = get_uuid(view, offset)
+    read_round, offset = get_varint(view, offset)
+    flags, offset = view[offset], offset + 1
+    count, offset = get_varint(view, offset)
+    if flags & COMPRESSED:
+        entries, offset = get_compressed_entries(view, offset, count)
+    else:
+        entries, offset = get_entries(view, offset, count)
+    message = LogRequest(
+        term, leader_id, entries, previous_log_index, previous_log_term, commit_length, to_node, read_round
+    )
+    return message, offset
+
+
+def get_log_response(view, offset):
+    node_id, offset = get_uuid(view, offset)
+    term, offset = get_varint(view, offset)
+    success, offset = bool(view[offset]), offset + 1
+    acknowledged, offset = get_varint(view, offset)
+    to_node = None
+    if view[offset]:
+        to_node, offset = get_uuid(view, offset + 1)
+    else:
+        offset += 1
+    read_round, offset = get_varint(view, offset)
+    conflict_term, offset = get_varint(view, offset)
+    conflict_index, offset = get_varint(view, offset)
+    commit_length, offset = get_varint(view, offset)
+    snapshot_offset, offset = get_varint(view, offset)
+    message = LogResponse(
+        node_id,
+        term,
+        success,
+        acknowledged,
+        to_node,
+        read_round,
+        conflict_term,
+        conflict_index,
+        commit_length,
+        snapshot_offset,
+    )
+    return message, offset
+
+
+def get_vote_request(view, offset):
+    candidate_id, offset = get_uuid(view, offset)
+    term, offset = get_varint(view, offset)
+    last_log_index, offset = get_varint(view, offset)
+    last_log_term, offset = get_varint(view, offset)
+    return VoteRequest(candidate_id, term, last_log_index, last_log_term, bool(view[offset])), offset + 1
+
+
+def get_vote_response(view, offset):
+    node_id, offset = get_uuid(view, offset)
+    candidate_id, offset = get_uuid(view, offset)
+    term, offset = get_varint(view, offset)
+    return VoteResponse(node_id, candidate_id, term, bool(view[offset]), bool(view[offset + 1])), offset + 2
+
+
+def get_install_snapshot(view, offset):
+    term, offset = get_varint(view, offset)
+    leader_id, offset = get_uuid(view, offset)
+    last_included_index, offset = get_varint(view, offset)
+    last_included_term, offset = get_varint(view, offset)
+    snapshot_offset, offset = get_varint(view, offset)
+    length, offset = get_varint(view, offset)
+    if offset + length > len(view):
+        raise DecodeError("truncated snapshot data")
+    snapshot_data, offset = bytes(view[offset : offset + length]), offset + length
+    done, offset = bool(view[offset]), offset + 1
+    to_node, offset = get_uuid(view, offset)
+    message = InstallSnapshot(
+        term, leader_id, last_included_index, last_included_term, snapshot_offset, snapshot_data, done, to_node
+    )
+    return message, offset
+
+
+DECODERS = {
+    LOG_REQUEST: get_log_request,
+    LOG_RESPONSE: get_log_response,
+    VOTE_REQUEST: get_vote_request,
+    VOTE_RESPONSE: get_vote_response,
+    INSTALL_SNAPSHOT: get_install_snapshot,
+}
@@ -0,0 +1,131 @@
+import random
+from heapq import heappop, heappush
+from typing import NamedTuple
+
+from src.raft import Role
+from src.server import Server
+
+
+class LinkFaults(NamedTuple):
+    """How one direction of a link misbehaves. Delays are in ticks, a reordered message is held back further."""
+
+    drop: float = 0.0
+    duplicate: float = 0.0
+    min_delay: int = 0
+    max_delay: int = 0
+    reorder: float = 0.0
+    reorder_delay: int = 50
+
+
+RELIABLE = LinkFaults()
+
+
+class FaultyServer(Server):
+    """
+    A Server whose network drops, delays, duplicates and reorders messages per link, can be partitioned, and whose
+    nodes can crash and restart (a restarted node keeps its storage as it stands and loses the rest, see
+    Node.handle_crash).
+
+    Faults are drawn from the server's own Random, so a run is reproducible from `seed` and the global random seed
+    the nodes draw their timeouts from.
+    """
+
+    def __init__(self, seed=0, faults=RELIABLE, **kwargs):
+        super().__init__(**kwargs)
+        self.random = random.Random(seed)
+        self.faults = faults
+        self.link_faults = {}
+        self.blocked = set()
+        self.crashed = {}
+        # (due, sequence, node, message) for every delayed message
+        self.in_flight = []
+        self.sequence = 0
+
+    def set_link_faults(self, source, destination, faults):
+        self.link_faults[(source, destination)] = faults
+
+    def partition(self, *groups):
+        # nodes in different groups can't reach each other, nodes left out of every group are unaffected
+        self.blocked = {
+            (source, destination)
+            for group in groups
+            for other in groups
+            if other is not group
+            for source in group
+            for destination in other
+        }
+
+    def heal(self):
+        self.blocked = set()
+
+    def crash(self, node_id):
+        node = self.node_index[node_id]
+        self.nodes.remove(node)
+        self.crashed[node_id] = node
+
+    def restart(self, node_id):
+        node = self.crashed.pop(node_id)
+        node.handle_crash()
+        self.nodes.append(node)
+
+    def deliver(self, node, message):
+        source, destination = message.source, node.node_id
+        if destination in self.crashed or (source, destination) in self.blocked:
+            return
+        faults = RELIABLE if source == destination else self.link_faults.get((source, destination), self.faults)
+        if faults is RELIABLE:
+            node.handle_message(message)
+            return
+        if faults.drop and self.random.random() < faults.drop:
+            return
+        copies = 2 if faults.duplicate and self.random.random() < faults.duplicate else 1
+        for _ in range(copies):
+            delay = self.random.randint(faults.min_delay, faults.max_delay)
+            if faults.reorder and self.random.random() < faults.reorder:
+                delay += self.random.randint(1, faults.reorder_delay)
+            if delay == 0:
+                node.handle_message(message)
+            else:
+                heappush(self.in_flight, (self.clock + delay, self.sequence, node, message))
+                self.sequence += 1
+
+    def ticks_until_delivery(self):
+        ticks = super().ticks_until_delivery()
+        if ticks is None and self.in_flight:
+            ticks = max(0, self.in_flight[0][0] - self.clock)
+        return ticks
+
+    def iterate(self):
+        while self.in_flight and self.in_flight[0][0] <= self.clock:
+            _, _, node, message = heappop(self.in_flight)
+            if node.node_id not in self.crashed:
+                node.handle_message(message)
+        super().iterate()
+
+    def leader(self):
+        leaders = [node for node in self.nodes if node.current_role is Role.LEADER]
+        return max(leaders, key=lambda node: node.current_term) if leaders else None
+
+
+def run_clients(server, history, ticks, clients=5, keys=5, read_ratio=0.5, rng=None, on_tick=None):
+    """
+    Drives `clients` closed-loop clients for `ticks` ticks, each with at most one read or write outstanding, sent to
+    whichever node currently looks like the leader. `on_tick(server)` is called at the start of every tick, before
+    the clients look for the leader, to inject faults or take measurements.
+    """
+    rng = random.Random(0) if rng is None else rng
+    outstanding = [None] * clients
+    end = server.clock + ticks
+    while server.clock < end:
+        if on_tick is not None:
+            on_tick(server)
+        leader = server.leader()
+        if leader is not None:
+            for client in range(clients):
+                if outstanding[client] is None or outstanding[client].done():
+                    key = rng.randrange(keys)
+                    if rng.random() < read_ratio:
+                        outstanding[client] = history.read(client, leader, key)
+                    else:
+                        outstanding[client] = history.write(client, leader, key, history.time)
+        server.iterate()
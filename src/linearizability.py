@@ -0,0 +1,166 @@
+"""
+Checks histories of reads and writes against a key-value store for linearizability.
+
+The search is the Wing & Gong algorithm with Lowe's memoization, as in Porcupine: operations are kept in a doubly
+linked list of call and return events; an operation whose call comes before the first pending return may be
+linearized next, and a (set of linearized operations, state) pair that was already explored is never explored
+again. Keys are independent registers, so each is checked on its own.
+
+Sets of linearized operations are remembered by a 128 bit Zobrist hash (the xor of a random number per operation)
+rather than a bitset, which keeps each memo entry small however long the history is; the odds of two different
+sets colliding are negligible.
+"""
+
+import math
+import random
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Any, List, NamedTuple
+
+
+class Operation(NamedTuple):
+    client: int
+    call: int
+    ret: float  # math.inf when the outcome is unknown
+    kind: str  # "read" or "write"
+    key: Any
+    value: Any  # what a write wrote or a read returned
+
+
+def event_list(operations: List[Operation]):
+    # the call and return events as a doubly linked list in time order: node 0 is the head, node k + 1 holds the
+    # k-th event, and each node knows its operation and, for a call, the node of its return
+    events = sorted(
+        [(op.call, 0, i) for i, op in enumerate(operations)] + [(op.ret, 1, i) for i, op in enumerate(operations)]
+    )
+    size = len(events) + 1
+    previous = list(range(-1, size - 1))
+    following = list(range(1, size + 1))
+    following[-1] = -1
+    operation = [-1] * size
+    matching = [-1] * size
+    calls = [0] * len(operations)
+    for node, (_, is_return, i) in enumerate(events, start=1):
+        operation[node] = i
+        if is_return:
+            matching[calls[i]] = node
+        else:
+            calls[i] = node
+    return previous, following, operation, matching
+
+
+def lift(previous, following, node, match):
+    # take a call and its return out of the list
+    following[previous[node]] = following[node]
+    previous[following[node]] = previous[node]
+    following[previous[match]] = following[match]
+    if following[match] != -1:
+        previous[following[match]] = previous[match]
+
+
+def unlift(previous, following, node, match):
+    # put them back where lift took them from
+    following[previous[match]] = match
+    if following[match] != -1:
+        previous[following[match]] = match
+    following[previous[node]] = node
+    previous[following[node]] = node
+
+
+def step(op: Operation, state):
+    # whether the operation can take effect on the register holding `state`, and what the register holds after it
+    if op.kind == "write":
+        return True, op.value
+    return op.value == state, state
+
+
+def check_register(operations: List[Operation], initial=None) -> bool:
+    previous, following, operation, matching = event_list(operations)
+    rng = random.Random(len(operations))
+    zobrist = [rng.getrandbits(128) for _ in operations]
+    state = initial
+    linearized = 0
+    seen = set()
+    stack = []
+    node = following[0]
+    while following[0] != -1:
+        match = matching[node]
+        if match != -1:
+            ok, new_state = step(operations[operation[node]], state)
+            new_linearized = linearized ^ zobrist[operation[node]]
+            if ok and (new_linearized, new_state) not in seen:
+                seen.add((new_linearized, new_state))
+                stack.append((node, state))
+                state, linearized = new_state, new_linearized
+                lift(previous, following, node, match)
+                node = following[0]
+                continue
+            node = following[node]
+        else:
+            # a return with its call still pending: whatever was linearized last has to go
+            if not stack:
+                return False
+            node, state = stack.pop()
+            linearized ^= zobrist[operation[node]]
+            unlift(previous, following, node, matching[node])
+            node = following[node]
+    return True
+
+
+def check_history(operations: List[Operation], initial=None) -> bool:
+    by_key = defaultdict(list)
+    for op in operations:
+        by_key[op.key].append(op)
+    return all(check_register(ops, initial) for ops in by_key.values())
+
+
+class History:
+    """
+    Records reads and writes made through Node.read and Node.propose against a KeyValueStateMachine, stamped with
+    a logical clock that advances on every call and completion so that real-time order is exact.
+    """
+
+    def __init__(self):
+        self.time = 0
+        self.pending = []
+        self.completed = []
+
+    def now(self):
+        self.time += 1
+        return self.time
+
+    def write(self, client, node, key, value) -> Future:
+        return self.record(client, "write", key, value, node.propose(("set", key, value)))
+
+    def read(self, client, node, key) -> Future:
+        return self.record(client, "read", key, None, node.read(key))
+
+    def record(self, client, kind, key, value, future):
+        call = self.now()
+        if future.done() and future.exception() is not None:
+            # turned away before anything happened
+            return future
+        entry = [client, call, kind, key, value]
+        self.pending.append(entry)
+        future.add_done_callback(lambda done: self.complete(entry, done))
+        return future
+
+    def complete(self, entry, future):
+        self.pending.remove(entry)
+        client, call, kind, key, value = entry
+        if future.exception() is None:
+            if kind == "read":
+                value = future.result()
+            self.completed.append(Operation(client, call, self.now(), kind, key, value))
+        elif kind == "write":
+            # the entry may or may not have committed
+            self.completed.append(Operation(client, call, math.inf, kind, key, value))
+
+    def operations(self) -> List[Operation]:
+        # reads that never returned had no effect, writes might have
+        unknown = [
+            Operation(client, call, math.inf, kind, key, value)
+            for client, call, kind, key, value in self.pending
+            if kind == "write"
+        ]
+        return self.completed + unknown
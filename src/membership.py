@@ -0,0 +1,54 @@
+import pickle
+from typing import FrozenSet, NamedTuple, Optional
+
+
+class Configuration(NamedTuple):
+    """
+    Who is in a cluster, stored in the log as an entry of its own and in effect from the moment it is appended.
+
+    Voters elect leaders and make up quorums, learners only receive the log. While `old_voters` is set the cluster is
+    in joint consensus (Raft paper, section 6): elections and commits need a majority of the old voters and a majority
+    of the new ones, so a change of voters never lets two disjoint majorities decide.
+    """
+
+    voters: FrozenSet
+    learners: FrozenSet = frozenset()
+    old_voters: Optional[FrozenSet] = None
+
+    @property
+    def joint(self):
+        return self.old_voters is not None
+
+    def voter_sets(self):
+        return (self.voters,) if self.old_voters is None else (self.voters, self.old_voters)
+
+    def is_voter(self, node_id):
+        return any(node_id in voters for voters in self.voter_sets())
+
+    def members(self):
+        return self.voters | self.learners | (self.old_voters or frozenset())
+
+    def final(self):
+        # the configuration a joint one moves on to once it has committed
+        return Configuration(self.voters, self.learners)
+
+    def quorum_length(self, lengths):
+        # largest log length (or read round) acknowledged by a majority of every set of voters
+        return min(majority_value(voters, lengths) for voters in self.voter_sets())
+
+    def has_quorum(self, node_ids):
+        return all(len(voters & node_ids) > len(voters) // 2 for voters in self.voter_sets())
+
+
+def majority_value(voters, lengths):
+    values = sorted(lengths.get(voter, 0) for voter in voters)
+    return values[(len(values) - 1) // 2] if values else 0
+
+
+def pack_snapshot(configuration, data):
+    # a snapshot replaces the log entries it covers, configuration changes among them, so it carries the last one
+    return pickle.dumps((configuration, data), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_snapshot(snapshot):
+    return pickle.loads(snapshot)
@@ -0,0 +1,212 @@
+import uuid
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, StrictBool, StrictBytes, StrictInt
+
+# Messages are plain tuples so that building and dispatching them on the hot path costs next to nothing.
+# The pydantic models below describe the same messages and are only used when validation is switched on.
+
+
+class LogMessage(NamedTuple):
+    term: int
+    message: Any
+
+
+class LogRequest(NamedTuple):
+    term: int
+    leader_id: uuid.UUID
+    entries: List[LogMessage]
+    previous_log_index: int
+    previous_log_term: int
+    commit_length: int
+    to_node: uuid.UUID
+    read_round: int = 0
+
+    @property
+    def destination(self):
+        return self.to_node
+
+    @property
+    def source(self):
+        return self.leader_id
+
+
+class LogResponse(NamedTuple):
+    node_id: uuid.UUID
+    term: int
+    success: bool
+    acknowledged: int
+    to_node: Optional[uuid.UUID] = None
+    read_round: int = 0
+    # on a rejection, where the follower's log stops agreeing: the term of its entry at previous_log_index - 1 and
+    # the index of its first entry with that term, or no term and the follower's log length if its log is shorter
+    conflict_term: int = 0
+    conflict_index: int = 0
+    # the follower's commit length, for leaders that stop heartbeating once everyone is up to date
+    commit_length: int = 0
+    # while a snapshot comes in chunk by chunk, how much of the one at `acknowledged` the follower has so far
+    snapshot_offset: int = 0
+
+    @property
+    def destination(self):
+        return self.to_node
+
+    @property
+    def source(self):
+        return self.node_id
+
+
+class VoteRequest(NamedTuple):
+    candidate_id: uuid.UUID
+    term: int
+    last_log_index: int
+    last_log_term: int
+    # a pre-vote asks whether the node would vote for the candidate at `term`, without anyone's term changing
+    pre_vote: bool = False
+
+    @property
+    def destination(self):
+        return None
+
+    @property
+    def source(self):
+        return self.candidate_id
+
+
+class VoteResponse(NamedTuple):
+    node_id: uuid.UUID
+    candidate_id: uuid.UUID
+    term: int
+    vote_granted: bool
+    pre_vote: bool = False
+
+    @property
+    def destination(self):
+        return self.candidate_id
+
+    @property
+    def source(self):
+        return self.node_id
+
+
+class InstallSnapshot(NamedTuple):
+    term: int
+    leader_id: uuid.UUID
+    last_included_index: int
+    last_included_term: int
+    offset: int
+    data: bytes
+    done: bool
+    to_node: uuid.UUID
+
+    @property
+    def destination(self):
+        return self.to_node
+
+    @property
+    def source(self):
+        return self.leader_id
+
+
+class Batch(NamedTuple):
+    """Every message one member of a Multi-Raft cluster sends another in a tick, as (group id, message) pairs."""
+
+    member_id: uuid.UUID
+    to_node: uuid.UUID
+    messages: List[Tuple[Any, Any]]
+
+    @property
+    def destination(self):
+        return self.to_node
+
+    @property
+    def source(self):
+        return self.member_id
+
+
+class LogMessageModel(BaseModel):
+    term: StrictInt
+    message: Any
+
+
+class LogRequestModel(BaseModel):
+    term: StrictInt
+    leader_id: uuid.UUID
+    entries: List[LogMessageModel]
+    previous_log_index: StrictInt
+    previous_log_term: StrictInt
+    commit_length: StrictInt
+    to_node: uuid.UUID
+    read_round: StrictInt = 0
+
+
+class LogResponseModel(BaseModel):
+    node_id: uuid.UUID
+    term: StrictInt
+    success: StrictBool
+    acknowledged: StrictInt
+    to_node: Optional[uuid.UUID] = None
+    read_round: StrictInt = 0
+    conflict_term: StrictInt = 0
+    conflict_index: StrictInt = 0
+    commit_length: StrictInt = 0
+    snapshot_offset: StrictInt = 0
+
+
+class VoteRequestModel(BaseModel):
+    candidate_id: uuid.UUID
+    term: StrictInt
+    last_log_index: StrictInt
+    last_log_term: StrictInt
+    pre_vote: StrictBool = False
+
+
+class VoteResponseModel(BaseModel):
+    node_id: uuid.UUID
+    candidate_id: uuid.UUID
+    term: StrictInt
+    vote_granted: StrictBool
+    pre_vote: StrictBool = False
+
+
+class InstallSnapshotModel(BaseModel):
+    term: StrictInt
+    leader_id: uuid.UUID
+    last_included_index: StrictInt
+    last_included_term: StrictInt
+    offset: StrictInt
+    data: StrictBytes
+    done: StrictBool
+    to_node: uuid.UUID
+
+
+class BatchModel(BaseModel):
+    member_id: uuid.UUID
+    to_node: uuid.UUID
+    messages: List[Tuple[Any, Any]]
+
+
+MODELS = {
+    LogMessage: LogMessageModel,
+    LogRequest: LogRequestModel,
+    LogResponse: LogResponseModel,
+    VoteRequest: VoteRequestModel,
+    VoteResponse: VoteResponseModel,
+    InstallSnapshot: InstallSnapshotModel,
+    Batch: BatchModel,
+}
+
+
+def validate_message(message):
+    """Checks a message against its pydantic model, raising pydantic.ValidationError when it is malformed."""
+    model = MODELS.get(type(message))
+    if model is None:
+        raise TypeError(f"not a raft message: {message!r}")
+    fields = message._asdict()
+    if isinstance(message, LogRequest):
+        fields["entries"] = [validate_message(entry)._asdict() for entry in message.entries]
+    elif isinstance(message, Batch):
+        for _, inner in message.messages:
+            validate_message(inner)
+    model(**fields)
+    return message
@@ -0,0 +1,150 @@
+import time
+from bisect import bisect_left
+
+
+def exponential_buckets(start, factor, count):
+    return tuple(start * factor**i for i in range(count))
+
+
+TICK_BUCKETS = exponential_buckets(1, 2, 24)
+SECONDS_BUCKETS = exponential_buckets(1e-6, 4, 14)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    # either set() explicitly or read from `function` whenever a snapshot is taken
+    def __init__(self, function=None):
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value, count=1):
+        self.counts[bisect_left(self.bounds, value)] += count
+        self.count += count
+        self.sum += value * count
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation, inf when it overflowed the last bucket
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank and seen > 0:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip([*self.bounds, float("inf")], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    A registry of named counters, gauges and histograms. Instruments are created on first use and kept, so hot
+    paths look them up once and hold on to them.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.instruments = {}
+
+    def get(self, name, factory):
+        instrument = self.instruments.get(name)
+        if instrument is None:
+            instrument = self.instruments[name] = factory()
+        return instrument
+
+    def counter(self, name) -> Counter:
+        return self.get(name, Counter)
+
+    def gauge(self, name, function=None) -> Gauge:
+        return self.get(name, lambda: Gauge(function))
+
+    def histogram(self, name, bounds=TICK_BUCKETS) -> Histogram:
+        return self.get(name, lambda: Histogram(bounds))
+
+    def snapshot(self):
+        return {name: instrument.snapshot() for name, instrument in sorted(self.instruments.items())}
+
+
+class NullInstrument:
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value, count=1):
+        pass
+
+
+class NullMetrics:
+    """What nodes and servers use unless given a Metrics: every instrument is the same do-nothing object."""
+
+    enabled = False
+    instrument = NullInstrument()
+
+    def counter(self, name):
+        return self.instrument
+
+    def gauge(self, name, function=None):
+        return self.instrument
+
+    def histogram(self, name, bounds=TICK_BUCKETS):
+        return self.instrument
+
+    def snapshot(self):
+        return {}
+
+
+NULL_METRICS = NullMetrics()
+
+
+def profile(target, method_names, metrics):
+    """
+    Times every call of the named methods of `target` into wall clock histograms. The wrappers are set on the
+    instance, so nothing is paid for profiling until this is called.
+    """
+    for name in method_names:
+        setattr(target, name, Timed(getattr(target, name), metrics.histogram(f"{name}_seconds", SECONDS_BUCKETS)))
+
+
+class Timed:
+    # an object rather than a closure, so that a deepcopy of the target times its own methods
+    def __init__(self, method, histogram):
+        self.method = method
+        self.histogram = histogram
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.method(*args, **kwargs)
+        finally:
+            self.histogram.observe(time.perf_counter() - started)
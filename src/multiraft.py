@@ -0,0 +1,309 @@
+from heapq import heappop, heappush
+from uuid import uuid4
+
+from src.messages import Batch, LogResponse, VoteRequest
+from src.metrics import NULL_METRICS
+from src.raft import HEARTBEAT_INTERVAL, Node, Role
+from src.storage import MemoryStorage
+from src.transport import Transport
+
+# how often a member makes sure each of its peers hears from it, and so how often its leaders heartbeat
+MEMBER_HEARTBEAT_TICKS = HEARTBEAT_INTERVAL
+
+# a quiesced leader's heartbeat timeout: it sleeps until it has something to send
+QUIESCED_TIMEOUT = 1 << 40
+
+
+class GroupTransport(Transport):
+    """What a replica of one group sees of the network: the members hosting the group and its member's outbox."""
+
+    def __init__(self, member, group_id, member_ids):
+        self.member = member
+        self.group_id = group_id
+        self.member_ids = list(member_ids)
+
+    def node_ids(self):
+        return self.member_ids
+
+    def broadcast_message(self, message):
+        destination = message.destination
+        if destination is not None:
+            self.member.post(destination, self.group_id, message)
+            return
+        for member_id in self.member_ids:
+            if member_id != self.member.node_id:
+                self.member.post(member_id, self.group_id, message)
+
+    def add_app_msgs(self, messages):
+        self.member.server.add_app_msgs([(self.group_id, message) for message in messages])
+
+
+class GroupNode(Node):
+    """
+    A replica of one group. Its node id is its member's id, so that messages can be routed member to member.
+
+    Leaders heartbeat on their member's heartbeat ticks, so every group's heartbeats to a peer go out in the same
+    Batch. With quiescence on, a leader whose followers have acknowledged its whole log and caught up with its
+    commit skips its heartbeat, and a follower doesn't start an election while it keeps hearing from its leader's
+    member, so idle groups cost nothing beyond the members' own heartbeats.
+    """
+
+    def __init__(self, server: GroupTransport, storage=None, state_machine=None, metrics=None):
+        self.member = server.member
+        super().__init__(server, storage=storage, state_machine=state_machine, metrics=metrics)
+        # each follower's commit length as of its last response
+        self.follower_commits = {}
+
+    def set_heartbeat_timeout(self):
+        if self.current_role is Role.LEADER:
+            self.heartbeat_timeout = self.member.ticks_until_heartbeat()
+        else:
+            super().set_heartbeat_timeout()
+            self.heartbeat_timeout = self.member.align_to_heartbeat(self.heartbeat_timeout)
+
+    def set_election_timeout(self):
+        super().set_election_timeout()
+        self.election_timeout = self.member.align_to_heartbeat(self.election_timeout)
+
+    def quiesced(self):
+        # the timeout keeps counting down while the replica sleeps
+        return self.heartbeat_timeout > QUIESCED_TIMEOUT // 2
+
+    def replicate_log(self, leader_id, follower_id):
+        super().replicate_log(leader_id, follower_id)
+        if self.quiesced():
+            # woken up by a proposal or read, heartbeat again until everyone has caught up
+            self.set_heartbeat_timeout()
+
+    def broadcast_heartbeat(self):
+        if self.lease_ticks or not self.member.quiesce:
+            super().broadcast_heartbeat()
+            return
+        behind = [
+            follower_id
+            for follower_id in self.peer_ids()
+            if self.acked_length.get(follower_id, -1) < len(self.log)
+            or self.follower_commits.get(follower_id, -1) < self.commit_length
+        ]
+        for follower_id in behind:
+            self.replicate_log(self.node_id, follower_id)
+        self.set_heartbeat_timeout()
+        if not behind:
+            self.heartbeat_timeout = QUIESCED_TIMEOUT
+
+    def member_is_live(self, member_id):
+        # heard from within our shortest election timeout
+        return self.member.is_live(member_id, self.election_timeout_range[0])
+
+    def handle_heartbeat_timeout_or_election_timeout(self):
+        if (
+            self.current_role is Role.FOLLOWER
+            and self.member.quiesce
+            and self.current_leader not in (None, self.node_id)
+            and self.member_is_live(self.current_leader)
+        ):
+            self.set_heartbeat_timeout()
+            return
+        super().handle_heartbeat_timeout_or_election_timeout()
+
+    def heard_from_quorum(self):
+        # a quiesced leader hears nothing from its followers, their members' heartbeats count instead
+        if self.member.quiesce:
+            return self.has_vote_quorum(
+                {self.node_id} | {node_id for node_id in self.peer_ids() if self.member_is_live(node_id)}
+            )
+        return super().heard_from_quorum()
+
+    def heard_from_leader(self):
+        # and a quiesced leader's followers hear from its member
+        if (
+            self.member.quiesce
+            and self.current_leader not in (None, self.node_id)
+            and self.member_is_live(self.current_leader)
+        ):
+            return True
+        return super().heard_from_leader()
+
+    def handle_vote_request(self, message: VoteRequest):
+        if message.candidate_id == self.current_leader:
+            # our leader's replica lost its leadership, by restarting or stepping down, while its member stayed live
+            self.current_leader = None
+        super().handle_vote_request(message)
+
+    def handle_log_response(self, message: LogResponse):
+        if message.success and message.term == self.current_term:
+            self.follower_commits[message.node_id] = message.commit_length
+        super().handle_log_response(message)
+
+    def handle_message(self, message):
+        super().handle_message(message)
+        if self.current_role is not Role.LEADER and self.quiesced():
+            # deposed while asleep
+            self.set_heartbeat_timeout()
+
+    def handle_crash(self):
+        super().handle_crash()
+        self.follower_commits = {}
+        self.set_heartbeat_timeout()
+
+
+class Member:
+    """
+    One process of a Multi-Raft cluster, hosting a replica of each of many groups. To a Server it looks like a Node:
+    everything it sends a peer in a tick goes out as one Batch, and its replicas are ticked by a single timer heap,
+    so a replica only runs when one of its timeouts is due or a message arrives for it rather than on every tick.
+    """
+
+    def __init__(self, server: Transport, member_id=None, quiesce=True, metrics=None):
+        self.server = server
+        self.node_id = uuid4() if member_id is None else member_id
+        self.quiesce = quiesce
+        self.groups = {}
+        self.clock = 0
+        self.heartbeat_ticks = MEMBER_HEARTBEAT_TICKS
+        # (due, group id) for every replica's next timeout; entries that no longer match `due` are stale
+        self.timers = []
+        self.due = {}
+        # member id -> [(group id, message)] to go out in the next batch
+        self.outbox = {}
+        self.unflushed = set()
+        self.last_contact = {}
+        self.metrics = NULL_METRICS if metrics is None else metrics
+        self.group_messages_counter = self.metrics.counter("group_messages")
+        self.group_ticks_counter = self.metrics.counter("group_ticks")
+        self.metrics.gauge("groups", self.gauge_groups)
+
+    def gauge_groups(self):
+        return len(self.groups)
+
+    def add_group(self, group_id, member_ids, storage=None, state_machine=None, metrics=None) -> GroupNode:
+        storage = MemoryStorage(node_id=self.node_id) if storage is None else storage
+        if storage.node_id != self.node_id:
+            raise ValueError("a replica's storage must carry its member's id")
+        node = GroupNode(
+            GroupTransport(self, group_id, member_ids), storage=storage, state_machine=state_machine, metrics=metrics
+        )
+        node.clock = self.clock
+        node.set_heartbeat_timeout()  # spread the groups' first elections out
+        self.groups[group_id] = node
+        self.schedule(group_id)
+        return node
+
+    def group(self, group_id) -> GroupNode:
+        # a replica's clock only catches up when it runs, bring it up to date before anyone looks at it
+        node = self.groups[group_id]
+        if node.clock < self.clock:
+            node.advance_clock(self.clock - node.clock)
+        return node
+
+    def propose(self, group_id, message):
+        future = self.group(group_id).propose(message)
+        self.touch(group_id)
+        return future
+
+    def read(self, group_id, query):
+        future = self.group(group_id).read(query)
+        self.touch(group_id)
+        return future
+
+    def post(self, member_id, group_id, message):
+        self.outbox.setdefault(member_id, []).append((group_id, message))
+
+    def schedule(self, group_id):
+        node = self.groups[group_id]
+        due = node.clock + node.ticks_until_timeout()
+        if self.due.get(group_id) != due:
+            self.due[group_id] = due
+            heappush(self.timers, (due, group_id))
+
+    def touch(self, group_id):
+        self.schedule(group_id)
+        if self.groups[group_id].pending_messages:
+            self.unflushed.add(group_id)
+
+    def is_live(self, member_id, window):
+        # whether we heard from the member in the last `window` ticks
+        return self.clock - self.last_contact.get(member_id, -window) < window
+
+    def ticks_until_heartbeat(self):
+        return self.heartbeat_ticks - self.clock % self.heartbeat_ticks
+
+    def align_to_heartbeat(self, ticks):
+        # replicas' elections are timed to fire on heartbeat ticks too, so that their messages share batches
+        return ticks + (-(self.clock + ticks)) % self.heartbeat_ticks
+
+    def handle_message(self, batch: Batch):
+        self.last_contact[batch.member_id] = self.clock
+        for group_id, message in batch.messages:
+            if group_id in self.groups:
+                self.group(group_id).handle_message(message)
+                self.touch(group_id)
+
+    def tick(self):
+        self.clock += 1
+        while self.timers and self.timers[0][0] <= self.clock:
+            due, group_id = heappop(self.timers)
+            if self.due.get(group_id) != due:
+                continue
+            del self.due[group_id]
+            node = self.groups[group_id]
+            node.advance_clock(self.clock - 1 - node.clock)
+            node.tick()
+            self.group_ticks_counter.inc()
+            self.touch(group_id)
+        if self.clock % self.heartbeat_ticks == 0:
+            for member_id in self.server.node_ids():
+                if member_id != self.node_id:
+                    self.outbox.setdefault(member_id, [])
+
+    def ticks_until_timeout(self):
+        while self.timers and self.due.get(self.timers[0][1]) != self.timers[0][0]:
+            heappop(self.timers)
+        ticks = self.ticks_until_heartbeat()
+        if self.timers:
+            ticks = min(ticks, self.timers[0][0] - self.clock)
+        return max(1, ticks)
+
+    def advance_clock(self, ticks):
+        # replicas catch up lazily, see group()
+        self.clock += ticks
+
+    @property
+    def pending_messages(self):
+        return bool(self.outbox or self.unflushed)
+
+    def flush(self):
+        unflushed, self.unflushed = self.unflushed, set()
+        for group_id in unflushed:
+            node = self.groups[group_id]
+            if node.pending_messages:
+                node.flush()
+                self.schedule(group_id)
+        outbox, self.outbox = self.outbox, {}
+        for member_id, messages in outbox.items():
+            self.group_messages_counter.inc(len(messages))
+            self.server.broadcast_message(Batch(member_id=self.node_id, to_node=member_id, messages=messages))
+
+    def handle_crash(self):
+        self.outbox = {}
+        self.unflushed = set()
+        self.last_contact = {}
+        for group_id in self.groups:
+            self.group(group_id).handle_crash()
+            self.schedule(group_id)
+
+
+def add_groups(members, group_ids, replication=3, state_machine=None) -> dict:
+    """
+    Places each group on `replication` consecutive members, round-robin, and returns {group id: [replicas]}.
+    `state_machine` is called with no arguments to make each replica's state machine.
+    """
+    placement = {}
+    for i, group_id in enumerate(group_ids):
+        hosts = [members[(i + j) % len(members)] for j in range(replication)]
+        member_ids = [member.node_id for member in hosts]
+        placement[group_id] = [
+            member.add_group(group_id, member_ids, state_machine=None if state_machine is None else state_machine())
+            for member in hosts
+        ]
+    return placement
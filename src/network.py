@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import json
+import pickle
+import sys
+from collections import deque
+from struct import Struct
+
+from src.messages import validate_message
+from src.raft import Node, Role
+from src.storage import MemoryStorage
+from src.transport import Transport
+
+FRAME_HEADER = Struct("<I")
+
+# wall clock seconds per Node tick, and how often the event loop catches the node's clock up
+TICK_SECONDS = 0.001
+TIMER_SECONDS = 0.005
+
+# frames kept for a peer we can't reach before giving up on them, raft resends whatever was lost
+MAX_BUFFER_BYTES = 16 * 1024 * 1024
+RECONNECT_SECONDS = 0.1
+
+
+def encode_frame(message) -> bytes:
+    # pickle, so every peer has to be trusted
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return pickle.loads(await reader.readexactly(length))
+
+
+class PeerConnection:
+    """A persistent outgoing connection to one peer. Frames queued between flushes go out in a single write."""
+
+    def __init__(self, address):
+        self.address = address
+        self.writer = None
+        self.connecting = None
+        self.retry_at = 0
+        self.buffer = bytearray()
+
+    def send(self, frame):
+        if len(self.buffer) + len(frame) > MAX_BUFFER_BYTES:
+            self.buffer = bytearray()
+        self.buffer += frame
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.writer is None or self.writer.is_closing():
+            self.writer = None
+            loop = asyncio.get_running_loop()
+            if self.connecting is None and loop.time() >= self.retry_at:
+                self.connecting = loop.create_task(self.connect())
+            return
+        # hand the transport our buffer rather than a copy of it and start a new one
+        data, self.buffer = self.buffer, bytearray()
+        self.writer.write(data)
+
+    async def connect(self):
+        try:
+            _, self.writer = await asyncio.open_connection(*self.address)
+        except OSError:
+            self.buffer = bytearray()
+            self.retry_at = asyncio.get_running_loop().time() + RECONNECT_SECONDS
+        finally:
+            self.connecting = None
+        self.flush()
+
+    def close(self):
+        if self.connecting is not None:
+            self.connecting.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class TcpTransport(Transport):
+    """
+    Runs a single Node on an asyncio event loop and connects it to its peers over TCP.
+
+    `addresses` maps every node id in the cluster, this node's included, to a (host, port) pair. Messages are
+    length-prefixed frames sent over one pooled connection per peer; everything a node sends while handling a
+    batch of incoming messages or a timer is written in one go at the end of the loop iteration, right after the
+    node's storage is flushed.
+    """
+
+    def __init__(self, addresses, tick_seconds=TICK_SECONDS, strict=False, app_messages_limit=None):
+        self.addresses = dict(addresses)
+        self.tick_seconds = tick_seconds
+        self.strict = strict
+        self.app_messages = [] if app_messages_limit is None else deque(maxlen=app_messages_limit)
+        self.node = None
+        self.peers = {}
+        self.listener = None
+        self.timer = None
+        self.started_at = 0
+        self.flush_scheduled = False
+
+    def node_ids(self):
+        return self.addresses.keys()
+
+    def add_node(self, node):
+        self.node = node
+        self.peers = {
+            node_id: PeerConnection(address) for node_id, address in self.addresses.items() if node_id != node.node_id
+        }
+
+    def broadcast_message(self, message):
+        if self.strict:
+            validate_message(message)
+        destination = message.destination
+        if destination is None or destination == self.node.node_id:
+            asyncio.get_running_loop().call_soon(self.deliver, message)
+        if destination is None:
+            frame = encode_frame(message)
+            for peer in self.peers.values():
+                peer.send(frame)
+        elif destination in self.peers:
+            self.peers[destination].send(encode_frame(message))
+        self.schedule_flush()
+
+    def add_app_msgs(self, messages):
+        self.app_messages += messages
+
+    def propose(self, message):
+        future = asyncio.wrap_future(self.node.propose(message))
+        self.schedule_flush()
+        return future
+
+    def read(self, query):
+        future = asyncio.wrap_future(self.node.read(query))
+        self.schedule_flush()
+        return future
+
+    def deliver(self, message):
+        self.node.handle_message(message)
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        if self.node.pending_messages:
+            self.node.flush()
+        for peer in self.peers.values():
+            peer.flush()
+
+    def on_timer(self):
+        # fire every timeout that came due since the last call at the tick it was due, as Server.run_for would
+        loop = asyncio.get_running_loop()
+        target = int((loop.time() - self.started_at) / self.tick_seconds)
+        while self.node.clock < target:
+            step = min(target - self.node.clock, self.node.ticks_until_timeout())
+            self.node.advance_clock(step - 1)
+            self.node.tick()
+        self.schedule_flush()
+        self.timer = loop.call_later(TIMER_SECONDS, self.on_timer)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                message = await read_frame(reader)
+                if self.strict:
+                    validate_message(message)
+                self.deliver(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        host, port = self.addresses[self.node.node_id]
+        self.listener = await asyncio.start_server(self.handle_connection, host, port)
+        loop = asyncio.get_running_loop()
+        self.started_at = loop.time() - self.node.clock * self.tick_seconds
+        self.timer = loop.call_later(TIMER_SECONDS, self.on_timer)
+
+    async def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        for peer in self.peers.values():
+            peer.close()
+        if self.listener is not None:
+            self.listener.close()
+            await self.listener.wait_closed()
+
+
+def parse_address(value):
+    node_id, _, address = value.partition("=")
+    host, _, port = address.rpartition(":")
+    return node_id, (host, int(port))
+
+
+async def run_node(node_id, addresses, count, tick_seconds=TICK_SECONDS, linger=1.0):
+    # the leader proposes 0..count-1 once, every node stops after applying `count` entries
+    transport = TcpTransport(addresses, tick_seconds=tick_seconds)
+    node = Node(transport, MemoryStorage(node_id=node_id))
+    transport.add_node(node)
+    await transport.start()
+    proposed = False
+    try:
+        while len(transport.app_messages) < count:
+            if not proposed and node.current_role is Role.LEADER:
+                node.propose_many(range(count))
+                transport.schedule_flush()
+                proposed = True
+            await asyncio.sleep(TIMER_SECONDS)
+        # keep answering for a while so the others can catch up before we disappear
+        await asyncio.sleep(linger)
+    finally:
+        await transport.close()
+    return list(transport.app_messages)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one node of a raft cluster over TCP.")
+    parser.add_argument("node_id")
+    parser.add_argument("--peer", action="append", type=parse_address, required=True, help="ID=HOST:PORT, one each")
+    parser.add_argument("--count", type=int, default=10, help="entries to commit before exiting")
+    parser.add_argument("--tick-seconds", type=float, default=TICK_SECONDS)
+    parser.add_argument("--linger", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    applied = asyncio.run(run_node(args.node_id, dict(args.peer), args.count, args.tick_seconds, args.linger))
+    json.dump(applied, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
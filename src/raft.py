@@ -1,15 +1,37 @@
+import math
 import random
-import uuid
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from concurrent.futures import Future
 from enum import Enum
-from typing import List, Any
-from uuid import uuid4
+from typing import List
 
-from pydantic import BaseModel
+from src.membership import Configuration, pack_snapshot, unpack_snapshot
+from src.messages import InstallSnapshot, LogMessage, LogRequest, LogResponse, VoteRequest, VoteResponse
+from src.metrics import NULL_METRICS, SECONDS_BUCKETS, profile
+from src.server import Server  # noqa: F401 (re-exported, tests and callers import it from here)
+from src.state_machine import StateMachine
+from src.storage import LogEntries, MemoryStorage
+from src.transport import Transport
 
-from src.server import Server
+# a leader heartbeats every HEARTBEAT_INTERVAL ticks. A follower that hears from no leader for a random number of
+# ticks in ELECTION_TIMEOUT_RANGE stands for election, as does a candidate whose election takes that long. Neither
+# depends on the size of the cluster
+HEARTBEAT_INTERVAL = 400
+ELECTION_TIMEOUT_RANGE = (2000, 4000)
 
-HEARTBEAT_TIMEOUT = 400
-ELECTION_TIMEOUT = 100
+# replication flow control, per follower
+MAX_ENTRIES_PER_REQUEST = 64
+MAX_BYTES_PER_REQUEST = 64 * 1024
+MAX_INFLIGHT_REQUESTS = 4
+
+# leases are cut short by this fraction to allow for clocks running at slightly different rates
+CLOCK_DRIFT = 0.1
+
+# entries applied since the last snapshot before a new one is taken and the log prefix dropped
+SNAPSHOT_THRESHOLD = 1024
 
 
 class Role(Enum):
@@ -18,76 +40,296 @@ class Role(Enum):
     LEADER = "LEADER"
 
 
-class LogMessage(BaseModel):
-    term: int
-    message: Any
+class MatchIndex(dict):
+    """Maps node ids to acknowledged log lengths and keeps the lengths sorted for quorum lookups."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sorted_lengths = sorted(self.values())
 
+    def __setitem__(self, node_id, length):
+        if node_id in self:
+            del self.sorted_lengths[bisect_left(self.sorted_lengths, self[node_id])]
+        super().__setitem__(node_id, length)
+        insort(self.sorted_lengths, length)
 
-class LogRequest(BaseModel):
-    term: int
-    leader_id: uuid.UUID
-    entries: List[LogMessage]
-    previous_log_index: int
-    previous_log_term: int
-    commit_length: int
-    to_node: uuid.UUID
+    def __delitem__(self, node_id):
+        del self.sorted_lengths[bisect_left(self.sorted_lengths, self[node_id])]
+        super().__delitem__(node_id)
 
+    def __reduce__(self):
+        # rebuilt from the lengths alone, copying sorted_lengths as well would count every length twice
+        return MatchIndex, (dict(self),)
 
-class LogResponse(BaseModel):
-    node_id: uuid.UUID
-    term: int
-    success: bool
-    acknowledged: int
+    def quorum_length(self, quorum):
+        # largest length acknowledged by at least `quorum` nodes
+        if len(self.sorted_lengths) < quorum:
+            return 0
+        return self.sorted_lengths[-quorum]
 
 
-class VoteRequest(BaseModel):
-    candidate_id: uuid.UUID
-    term: int
-    last_log_index: int
-    last_log_term: int
+class NotLeaderError(Exception):
+    def __init__(self, leader_id):
+        super().__init__(f"not the leader, try {leader_id}")
+        self.leader_id = leader_id
 
 
-class VoteResponse(BaseModel):
-    node_id: uuid.UUID
-    candidate_id: uuid.UUID
-    term: int
-    vote_granted: bool
+class OverloadedError(Exception):
+    def __init__(self, backlog):
+        super().__init__(f"{backlog} entries waiting to be applied, try again later")
+        self.backlog = backlog
 
 
 class Node:
-    def __init__(self, server: Server):
+    def __init__(
+        self, server: Transport, storage=None, state_machine=None, metrics=None, joining=False, apply_stream=None
+    ):
         self.server = server
-        self.current_term = 0
-        self.voted_for = None
-        self.log: List[LogMessage] = []
+        # the log, current term, vote and snapshot live in storage, the rest of the state is volatile
+        self.storage = MemoryStorage() if storage is None else storage
+        self.log = self.storage.log
+        self.node_id = self.storage.node_id
+        self.state_machine = StateMachine() if state_machine is None else state_machine
+        # committed entries go to the apply stream when there is one and to the transport's add_app_msgs otherwise
+        self.apply_stream = apply_stream
+        if apply_stream is not None:
+            apply_stream.on_room = self.apply_committed
+        self.pending_messages = []
         self.commit_length = 0
+        self.last_applied = 0
+        self.incoming_snapshot = None
+        # the leader's term and the index of the snapshot coming in, so that a duplicate first chunk doesn't restart it
+        self.incoming_snapshot_key = None
         self.current_role = Role.FOLLOWER
         self.current_leader = None
         self.votes_received = {}
         self.sent_length = {}
         self.acked_length = {}
-        self.node_id = uuid4()
+        self.inflight = {}
+        self.probing = set()
+        # per follower we are sending a snapshot to: its index, how much of it was acked and how much was sent
+        self.snapshot_offsets = {}
+
+        # instruments are fetched once here; with metrics off they are all the same no-op object
+        self.metrics = NULL_METRICS if metrics is None else metrics
+        self.elections_counter = self.metrics.counter("elections")
+        self.leaderships_counter = self.metrics.counter("leaderships")
+        self.term_changes_counter = self.metrics.counter("term_changes")
+        self.pre_votes_counter = self.metrics.counter("pre_votes")
+        self.step_downs_counter = self.metrics.counter("quorum_step_downs")
+        self.rejections_counter = self.metrics.counter("log_responses_rejected")
+        self.backoffs_counter = self.metrics.counter("sent_length_backoffs")
+        self.snapshots_counter = self.metrics.counter("snapshots")
+        self.commit_ticks_histogram = self.metrics.histogram("commit_latency_ticks")
+        self.commit_seconds_histogram = self.metrics.histogram("commit_latency_seconds", SECONDS_BUCKETS)
+        # bound methods rather than lambdas, which a deepcopy (see checkpoint.py) would leave reading this node
+        self.metrics.gauge("term", self.gauge_term)
+        self.metrics.gauge("is_leader", self.gauge_is_leader)
+        self.metrics.gauge("log_length", self.gauge_log_length)
+        self.metrics.gauge("commit_length", self.gauge_commit_length)
+        self.metrics.gauge("last_applied", self.gauge_last_applied)
+        self.metrics.gauge("unapplied_entries", self.gauge_unapplied_entries)
+        # (end of batch, clock, wall clock, batch size) for every batch proposed while collecting metrics
+        self.proposal_times = deque()
+
+        # linearizable reads: a read waits for a heartbeat round started after it to be acknowledged by a quorum,
+        # or with a lease (lease_ticks > 0) is served straight away while the last such round is recent enough
+        self.pending_reads = deque()
+        self.read_round = 0
+        self.read_round_clocks = {}
+        self.read_acks = MatchIndex()
+        self.term_start = 0
+        self.lease_ticks = 0
+        self.lease_expiry = 0
+        self.last_leader_contact = None
+
+        # client proposals: futures resolve once their entry commits, and with batch_ticks > 0 proposals are held
+        # for up to that many ticks (or until batch_size of them arrive) and then replicated together
+        self.proposal_futures = deque()
+        self.proposal_buffer = []
+        self.batch_ticks = 0
+        self.batch_size = MAX_ENTRIES_PER_REQUEST
+        self.batch_deadline = 0
+
+        # replication flow control
+        self.max_entries_per_request = MAX_ENTRIES_PER_REQUEST
+        self.max_bytes_per_request = MAX_BYTES_PER_REQUEST
+        self.max_inflight_requests = MAX_INFLIGHT_REQUESTS
+        self.snapshot_threshold = SNAPSHOT_THRESHOLD
+        # with a limit the log runs at most this many entries ahead of last_applied, see ApplyStream
+        self.max_unapplied_entries = None
+
+        # membership: (index, configuration) for every configuration entry in the log, starting with the one in
+        # effect at the snapshot. Until there is one (the first leader appends it) every node on the transport votes,
+        # except a joining node, which waits to learn a configuration that includes it
+        self.configurations = []
+        self.initial_configuration = Configuration(frozenset()) if joining else None
+        self.configuration_futures = []
+
+        # elections: with pre_vote a node only stands once a quorum says it would vote for it, so a node that was
+        # cut off can't depose a healthy leader when it comes back, and with check_quorum a leader that hasn't heard
+        # from a quorum for the shortest election timeout steps down rather than take requests it can't commit
+        self.pre_vote = True
+        self.check_quorum = True
+        self.pre_votes_received = None
+        # follower id -> clock of its last response to us as leader
+        self.last_heard = {}
 
         # time tracking
         self.clock = 0
-        self.heartbeat_timeout = HEARTBEAT_TIMEOUT
-        self.election_timeout = ELECTION_TIMEOUT
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.election_timeout_range = ELECTION_TIMEOUT_RANGE
+        self.set_heartbeat_timeout()
+        self.set_election_timeout()
+
+        # what a restart without a snapshot starts the state machine from
+        self.initial_state = self.state_machine.snapshot()
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        # the state machine and configurations as of the snapshot in storage, and the ones in the log after it
+        configuration, data = None, self.initial_state
+        self.commit_length = self.last_applied = 0
+        snapshot = self.storage.load_snapshot()
+        if snapshot is not None:
+            configuration, data = unpack_snapshot(snapshot[2])
+            self.commit_length = self.last_applied = snapshot[0]
+        self.state_machine.restore(data)
+        self.configurations = [] if configuration is None else [(snapshot[0] - 1, configuration)]
+        self.record_configurations(self.log.snapshot_index, self.log[self.log.snapshot_index :])
+
+    @property
+    def current_term(self):
+        return self.storage.current_term
+
+    @current_term.setter
+    def current_term(self, term):
+        if term != self.storage.current_term:
+            self.term_changes_counter.inc()
+        self.storage.save_state(term, self.storage.voted_for)
+
+    @property
+    def voted_for(self):
+        return self.storage.voted_for
+
+    @voted_for.setter
+    def voted_for(self, node_id):
+        self.storage.save_state(self.storage.current_term, node_id)
+
+    @property
+    def acked_length(self):
+        return self._acked_length
+
+    @acked_length.setter
+    def acked_length(self, value):
+        self._acked_length = MatchIndex(value)
+
+    def quorum_size(self):
+        return len(self.server.node_ids()) // 2 + 1
+
+    @property
+    def configuration(self):
+        return self.configurations[-1][1] if self.configurations else self.initial_configuration
+
+    def is_voter(self):
+        configuration = self.configuration
+        return configuration is None or configuration.is_voter(self.node_id)
+
+    def quorum_length(self, lengths: MatchIndex):
+        configuration = self.configuration
+        if configuration is None:
+            return lengths.quorum_length(self.quorum_size())
+        return configuration.quorum_length(lengths)
+
+    def has_vote_quorum(self, node_ids):
+        configuration = self.configuration
+        if configuration is None:
+            return len(node_ids) >= self.quorum_size()
+        return configuration.has_quorum(node_ids)
+
+    def record_configurations(self, start, entries):
+        payloads = entries.payloads if isinstance(entries, LogEntries) else [entry.message for entry in entries]
+        for offset, payload in enumerate(payloads):
+            if type(payload) is Configuration:
+                self.configurations.append((start + offset, payload))
+
+    def truncate_configurations(self, length):
+        while self.configurations and self.configurations[-1][0] >= length:
+            self.configurations.pop()
+
+    def configuration_at(self, length):
+        # the configuration in effect for a log of `length` entries
+        for index, configuration in reversed(self.configurations):
+            if index < length:
+                return configuration
+        return None
+
+    def send(self, message):
+        # a message may only leave once the state it reflects is durable, so hold it until the next flush
+        if self.pending_messages or self.storage.dirty:
+            self.pending_messages.append(message)
+        else:
+            self.server.broadcast_message(message)
+
+    def flush(self):
+        self.storage.sync()
+        messages, self.pending_messages = self.pending_messages, []
+        for message in messages:
+            self.server.broadcast_message(message)
+        if self.current_role is Role.LEADER:
+            self.commit_log_entries()
 
     def set_heartbeat_timeout(self):
-        self.heartbeat_timeout = HEARTBEAT_TIMEOUT * random.randint(1, len(self.server.nodes) * 10)
         if self.current_role is Role.LEADER:
-            self.heartbeat_timeout /= 2
+            self.heartbeat_timeout = self.heartbeat_interval
+        else:
+            self.heartbeat_timeout = random.randint(*self.election_timeout_range)
 
     def set_election_timeout(self):
-        self.election_timeout = ELECTION_TIMEOUT * random.randint(1, len(self.server.nodes) * 10)
+        self.election_timeout = random.randint(*self.election_timeout_range)
+
+    def peer_ids(self):
+        configuration = self.configuration
+        if configuration is None:
+            return [node_id for node_id in self.server.node_ids() if node_id != self.node_id]
+        members = configuration.members()
+        if self.configurations and self.configurations[-1][0] >= self.commit_length:
+            # keep replicating to whoever the uncommitted configuration drops, so they learn they were removed
+            previous = self.configuration_at(self.configurations[-1][0])
+            members |= set(self.server.node_ids()) if previous is None else previous.members()
+        # in the transport's order rather than the set's, which changes with the node ids, so that seeded runs repeat
+        return [node_id for node_id in self.server.node_ids() if node_id in members and node_id != self.node_id]
+
+    def start_replication(self, follower_id):
+        # nothing is known about the follower yet: probe backwards from the end of our log
+        self.sent_length[follower_id] = len(self.log)
+        self.acked_length[follower_id] = 0
+        self.inflight[follower_id] = 0
+        self.snapshot_offsets.pop(follower_id, None)
+        if len(self.log) > 0:
+            self.probing.add(follower_id)
+        # a follower that a membership change adds gets as long to respond as the others did when we were elected
+        self.last_heard.setdefault(follower_id, self.clock)
+
+    def replication_window(self, follower_id):
+        return 1 if follower_id in self.probing else self.max_inflight_requests
+
+    def next_entries(self, start):
+        return self.log.batch(start, self.max_entries_per_request, self.max_bytes_per_request)
 
     def replicate_log(self, leader_id, follower_id):
+        if follower_id not in self.sent_length:
+            self.start_replication(follower_id)
         previous_log_index = self.sent_length[follower_id]
-        entries = self.log[previous_log_index:]
-        prefix_term = 0
-        if previous_log_index > 0:
-            prefix_term = self.log[previous_log_index - 1].term
-        self.server.broadcast_message(
+        if previous_log_index < self.log.snapshot_index:
+            # the entries the follower needs are gone, it has to start from our snapshot
+            self.send_snapshot(follower_id)
+            return
+        entries = []
+        if self.inflight.get(follower_id, 0) < self.replication_window(follower_id):
+            entries = self.next_entries(previous_log_index)
+        prefix_term = self.log.term_at(previous_log_index - 1)
+        self.send(
             LogRequest(
                 leader_id=leader_id,
                 term=self.current_term,
@@ -96,46 +338,159 @@ class Node:
                 commit_length=self.commit_length,
                 entries=entries,
                 to_node=follower_id,
+                read_round=self.read_round,
             )
         )
+        self.inflight[follower_id] = self.inflight.get(follower_id, 0) + 1
+        if follower_id not in self.probing:
+            # optimistic: later requests are pipelined behind this one instead of resending the suffix
+            self.sent_length[follower_id] = previous_log_index + len(entries)
 
-    def broadcast_heartbeat(self):
-        # this is hacky and can be fundamentally fixed by allowing more direct message sending
-        for node in self.get_follower_nodes():
-            # node.set_heartbeat_timeout()
-            self.server.broadcast_message(
-                LogRequest(
-                    term=self.current_term,
-                    leader_id=self.node_id,
-                    entries=[],
-                    previous_log_index=len(self.log),
-                    previous_log_term=0 if len(self.log) == 0 else self.log[-1].term,
-                    to_node=node.node_id,
-                    commit_length=self.commit_length,
-                )
+    def send_snapshot(self, follower_id):
+        # chunks go out as the replication window allows, and the next ones as they are acked. With the window full,
+        # as on a heartbeat, the first chunk the follower hasn't acked goes out again in case it was lost
+        index, term, data = self.storage.load_snapshot()
+        snapshot_index, acked, sent = self.snapshot_offsets.get(follower_id, (index, 0, 0))
+        if snapshot_index != index:
+            # we took a newer snapshot since, the follower gets that one from the start
+            acked = sent = 0
+        chunks = list(range(sent, max(len(data), 1), self.max_bytes_per_request))
+        chunks = chunks[: max(0, self.replication_window(follower_id) - self.inflight.get(follower_id, 0))] or [acked]
+        for offset in chunks:
+            self.send_snapshot_chunk(follower_id, index, term, data, offset)
+            sent = max(sent, offset + self.max_bytes_per_request)
+        self.snapshot_offsets[follower_id] = (index, acked, sent)
+        if sent >= len(data) and follower_id not in self.probing:
+            self.sent_length[follower_id] = index
+
+    def send_snapshot_chunk(self, follower_id, index, term, data, offset):
+        self.send(
+            InstallSnapshot(
+                term=self.current_term,
+                leader_id=self.node_id,
+                last_included_index=index,
+                last_included_term=term,
+                offset=offset,
+                data=data[offset : offset + self.max_bytes_per_request],
+                done=offset + self.max_bytes_per_request >= len(data),
+                to_node=follower_id,
             )
+        )
+        self.inflight[follower_id] = self.inflight.get(follower_id, 0) + 1
+
+    def handle_snapshot_ack(self, follower_id, message: LogResponse):
+        index, acked, sent = self.snapshot_offsets.get(follower_id, (None, 0, 0))
+        if message.acknowledged != index or message.snapshot_offset < acked:
+            # about a snapshot we no longer send, or overtaken by a later ack
+            return
+        if message.snapshot_offset == acked:
+            # no further than before: the chunk after it was lost, everything we sent past it is resent
+            sent = acked
+            self.inflight[follower_id] = 0
+        acked = message.snapshot_offset
+        if acked == sent:
+            # everything we sent has arrived, requests still counted as in flight were lost
+            self.inflight[follower_id] = 0
+        self.snapshot_offsets[follower_id] = (index, acked, sent)
+        if self.sent_length[follower_id] < self.log.snapshot_index:
+            self.send_snapshot(follower_id)
+
+    def send_pending_entries(self, follower_id):
+        while self.sent_length[follower_id] < len(self.log) and self.inflight.get(
+            follower_id, 0
+        ) < self.replication_window(follower_id):
+            self.replicate_log(self.node_id, follower_id)
+
+    def broadcast_heartbeat(self):
+        if self.lease_ticks:
+            # every heartbeat round renews the lease
+            self.start_read_round()
+            return
+        for follower_id in self.peer_ids():
+            self.replicate_log(self.node_id, follower_id)
         self.set_heartbeat_timeout()
 
     def broadcast_log_message(self, message):
         if self.current_role is Role.LEADER:
-            message_to_send = LogMessage(term=self.current_term, message=message)
-            self.log.append(message_to_send)
-            self.acked_length[self.node_id] = len(self.log)
-            for follower in self.get_follower_nodes():
-                if follower.node_id == self.node_id:
-                    continue
-                self.replicate_log(self.node_id, follower.node_id)
+            self.submit_proposals([(message, None)])
+
+    def propose(self, message) -> Future:
+        return self.propose_many([message])[0]
+
+    def propose_many(self, messages) -> List[Future]:
+        """
+        Appends `messages` to the log, replicating them together. Each future resolves with its entry's index once
+        it commits, or fails with NotLeaderError if this node isn't (or stops being) the leader first, in which
+        case the entry may or may not still commit.
+        """
+        messages = list(messages)
+        futures = [Future() for _ in messages]
+        if self.current_role is not Role.LEADER:
+            for future in futures:
+                future.set_exception(NotLeaderError(self.current_leader))
+        elif self.max_unapplied_entries is not None and (
+            len(self.log) + len(self.proposal_buffer) + len(futures) - self.last_applied > self.max_unapplied_entries
+        ):
+            error = OverloadedError(len(self.log) + len(self.proposal_buffer) - self.last_applied)
+            for future in futures:
+                future.set_exception(error)
+        elif futures:
+            self.submit_proposals(list(zip(messages, futures)))
+        return futures
+
+    def submit_proposals(self, proposals):
+        if not self.batch_ticks:
+            self.append_proposals(proposals)
+            return
+        if not self.proposal_buffer:
+            self.batch_deadline = self.clock + self.batch_ticks
+        self.proposal_buffer += proposals
+        if len(self.proposal_buffer) >= self.batch_size:
+            self.flush_proposals()
+
+    def flush_proposals(self):
+        proposals, self.proposal_buffer = self.proposal_buffer, []
+        self.append_proposals(proposals)
 
-    def append_entries(self, previous_log_index, leader_commit, entries: List[LogMessage]):
+    def append_proposals(self, proposals):
+        start = len(self.log)
+        entries = LogEntries(array("q", [self.current_term]) * len(proposals), [message for message, _ in proposals])
+        self.log.extend(entries)
+        self.record_configurations(start, entries)
+        for i, (_, future) in enumerate(proposals):
+            if future is not None:
+                self.proposal_futures.append((self.current_term, start + i, future))
+        if self.metrics.enabled:
+            self.proposal_times.append((len(self.log), self.clock, time.perf_counter(), len(proposals)))
+        for follower_id in self.peer_ids():
+            if follower_id not in self.sent_length:
+                self.start_replication(follower_id)
+            self.send_pending_entries(follower_id)
+        self.commit_log_entries()
+
+    def append_entries(self, previous_log_index, leader_commit, entries: List[LogMessage]) -> int:
+        # returns how much of the leader's log we now hold
+        if previous_log_index < self.log.snapshot_index:
+            # our snapshot already covers the start of these
+            entries = entries[self.log.snapshot_index - previous_log_index :]
+            previous_log_index = self.log.snapshot_index
+        if self.max_unapplied_entries is not None:
+            # the leader sends the rest again, on a later heartbeat, once we have applied more
+            entries = entries[: max(0, self.last_applied + self.max_unapplied_entries - previous_log_index)]
         if len(entries) > 0 and len(self.log) > previous_log_index:
             index = min(len(self.log), previous_log_index + len(entries)) - 1
-            if self.log[index].term != entries[index - previous_log_index].term:
-                self.log = self.log[: previous_log_index - 1]
+            if self.log.term_at(index) != entries[index - previous_log_index].term:
+                del self.log[previous_log_index:]
+                self.truncate_configurations(previous_log_index)
         if previous_log_index + len(entries) > len(self.log):
-            self.log += entries[len(self.log) - previous_log_index :]
+            start = len(self.log)
+            new_entries = entries[start - previous_log_index :]
+            self.log.extend(new_entries)
+            self.record_configurations(start, new_entries)
         if leader_commit > self.commit_length:
-            self.server.add_app_msgs(self.log[self.commit_length : leader_commit - 1])
-        self.commit_length = leader_commit
+            self.commit_length = max(self.commit_length, min(leader_commit, previous_log_index + len(entries)))
+            self.apply_committed()
+        return previous_log_index + len(entries)
 
     def handle_log_request(self, message: LogRequest):
         if message.term > self.current_term:
@@ -146,36 +501,151 @@ class Node:
             self.current_role = Role.FOLLOWER  # effectively pauses election timer
             self.set_election_timeout()  # actually reset election timer
             self.current_leader = message.leader_id
+            self.last_leader_contact = self.clock
+            self.pre_votes_received = None
+            self.set_heartbeat_timeout()  # the leader is alive, hold off the next election
         log_ok = (len(self.log) >= message.previous_log_index) and (
-            message.previous_log_index == 0
-            or self.log[message.previous_log_index - 1].term == message.previous_log_term
+            message.previous_log_index < self.log.snapshot_index
+            or self.log.term_at(message.previous_log_index - 1) == message.previous_log_term
         )
         if message.term == self.current_term and log_ok:
-            self.append_entries(message.previous_log_index, message.commit_length, message.entries)
-            ack = message.previous_log_index + len(message.entries)
-            self.server.broadcast_message(
-                LogResponse(node_id=self.node_id, term=self.current_term, acknowledged=ack, success=True)
+            ack = self.append_entries(message.previous_log_index, message.commit_length, message.entries)
+            self.send(
+                LogResponse(
+                    node_id=self.node_id,
+                    term=self.current_term,
+                    acknowledged=ack,
+                    success=True,
+                    to_node=message.leader_id,
+                    read_round=message.read_round,
+                    commit_length=self.commit_length,
+                )
             )
         else:
-            self.server.broadcast_message(
-                LogResponse(node_id=self.node_id, term=self.current_term, acknowledged=0, success=False)
+            if len(self.log) < message.previous_log_index:
+                conflict_term, conflict_index = 0, len(self.log)
+            elif message.previous_log_index <= self.log.snapshot_index:
+                # the terms of our snapshotted entries are gone, but they are all committed
+                conflict_term, conflict_index = 0, self.log.snapshot_index
+            else:
+                conflict_term = self.log.term_at(message.previous_log_index - 1)
+                conflict_index = self.log.first_index_of(conflict_term)
+            self.send(
+                LogResponse(
+                    node_id=self.node_id,
+                    term=self.current_term,
+                    acknowledged=0,
+                    success=False,
+                    to_node=message.leader_id,
+                    read_round=message.read_round,
+                    conflict_term=conflict_term,
+                    conflict_index=conflict_index,
+                )
             )
 
-    def handle_vote_request(self, message: VoteRequest):
+    def handle_install_snapshot(self, message: InstallSnapshot):
         if message.term > self.current_term:
             self.current_term = message.term
-            self.current_role = Role.FOLLOWER
             self.voted_for = None
-        last_term = 0
-        if len(self.log) > 0:
-            last_term = self.log[-1].term
+        if message.term < self.current_term:
+            self.send(
+                LogResponse(
+                    node_id=self.node_id,
+                    term=self.current_term,
+                    acknowledged=0,
+                    success=False,
+                    to_node=message.leader_id,
+                )
+            )
+            return
+        self.current_role = Role.FOLLOWER
+        self.current_leader = message.leader_id
+        self.last_leader_contact = self.clock
+        self.pre_votes_received = None
+        self.set_election_timeout()
+        self.set_heartbeat_timeout()
+        key = (message.term, message.last_included_index)
+        if message.offset == 0 and self.incoming_snapshot_key != key:
+            self.incoming_snapshot, self.incoming_snapshot_key = bytearray(), key
+        if self.incoming_snapshot_key != key:
+            # we have nothing of this snapshot to resume from, the leader starts over once it hears about it
+            self.send(
+                LogResponse(
+                    node_id=self.node_id,
+                    term=self.current_term,
+                    acknowledged=0,
+                    success=False,
+                    to_node=message.leader_id,
+                )
+            )
+            return
+        accepted = message.offset == len(self.incoming_snapshot)
+        if accepted:
+            self.incoming_snapshot += message.data
+        if not (accepted and message.done):
+            # a chunk on the way, one we already had or one after a lost one: the leader learns how far we got and
+            # sends what comes next
+            self.send(
+                LogResponse(
+                    node_id=self.node_id,
+                    term=self.current_term,
+                    acknowledged=message.last_included_index,
+                    success=True,
+                    to_node=message.leader_id,
+                    commit_length=self.commit_length,
+                    snapshot_offset=len(self.incoming_snapshot),
+                )
+            )
+            return
+        data, self.incoming_snapshot, self.incoming_snapshot_key = bytes(self.incoming_snapshot), None, None
+        if message.last_included_index > self.commit_length:
+            index = message.last_included_index
+            configuration, state = unpack_snapshot(data)
+            self.state_machine.restore(state)
+            self.storage.save_snapshot(index, message.last_included_term, data)
+            self.commit_length = self.last_applied = index
+            self.configurations = [] if configuration is None else [(index - 1, configuration)]
+            self.record_configurations(index, self.log[index:])
+        self.send(
+            LogResponse(
+                node_id=self.node_id,
+                term=self.current_term,
+                acknowledged=message.last_included_index,
+                success=True,
+                to_node=message.leader_id,
+                commit_length=self.commit_length,
+            )
+        )
+
+    def handle_vote_request(self, message: VoteRequest):
+        if self.within_leader_lease(message.candidate_id):
+            return
+        last_term = self.log.last_term
         log_ok = (message.last_log_term > last_term) or (
             message.last_log_term == last_term and message.last_log_index >= len(self.log)
         )
+        if message.pre_vote:
+            # only says whether we would vote for the candidate at message.term, nothing changes here
+            granted = message.term > self.current_term and log_ok and not self.heard_from_leader()
+            self.send(
+                VoteResponse(
+                    node_id=self.node_id,
+                    candidate_id=message.candidate_id,
+                    term=message.term if granted else self.current_term,
+                    vote_granted=granted,
+                    pre_vote=True,
+                )
+            )
+            return
+        if message.term > self.current_term:
+            self.current_term = message.term
+            self.current_role = Role.FOLLOWER
+            self.voted_for = None
 
         if message.term == self.current_term and log_ok and self.voted_for in [message.candidate_id, None]:
             self.voted_for = message.candidate_id
-            self.server.broadcast_message(
+            self.set_heartbeat_timeout()  # give the candidate we voted for a chance to win
+            self.send(
                 VoteResponse(
                     node_id=self.node_id,
                     candidate_id=message.candidate_id,
@@ -184,7 +654,7 @@ class Node:
                 )
             )
         else:
-            self.server.broadcast_message(
+            self.send(
                 VoteResponse(
                     node_id=self.node_id,
                     candidate_id=message.candidate_id,
@@ -194,21 +664,15 @@ class Node:
             )
 
     def handle_vote_response(self, message: VoteResponse):
-        if self.current_role is Role.CANDIDATE and message.term == self.current_term and message.vote_granted:
+        if message.pre_vote and message.vote_granted:
+            if self.pre_votes_received is not None and message.term == self.current_term + 1:
+                self.pre_votes_received.add(message.node_id)
+                if self.has_vote_quorum(self.pre_votes_received):
+                    self.start_election()
+        elif self.current_role is Role.CANDIDATE and message.term == self.current_term and message.vote_granted:
             self.votes_received[message.node_id] = message.vote_granted
-            if (
-                len([voter for voter in self.votes_received.keys() if self.votes_received.get(voter)])
-                >= (len(self.server.nodes) + 1) / 2
-            ):
-                self.current_role = Role.LEADER
-                self.current_leader = self.node_id
-                self.set_election_timeout()  # canceling by ensuring it's not close to 0
-                for follower in self.get_follower_nodes():
-                    if follower.node_id == self.node_id:
-                        continue
-                    self.sent_length[follower.node_id] = len(self.log)
-                    self.acked_length[follower.node_id] = 0
-                    self.replicate_log(self.node_id, follower.node_id)
+            if self.has_vote_quorum({voter for voter, granted in self.votes_received.items() if granted}):
+                self.become_leader()
         elif message.term > self.current_term:
             self.current_term = message.term
             self.current_role = Role.FOLLOWER
@@ -218,19 +682,55 @@ class Node:
 
     def handle_log_response(self, message: LogResponse):
         if message.term == self.current_term and self.current_role is Role.LEADER:
-            if message.success and message.acknowledged >= self.acked_length[message.node_id]:
-                self.sent_length[message.node_id] = message.acknowledged
-                self.acked_length[message.node_id] = message.acknowledged
-                self.commit_log_entries()
-            elif self.sent_length[message.node_id] > 0:
-                self.sent_length[message.node_id] -= 1
-                self.replicate_log(self.node_id, message.node_id)
+            follower_id = message.node_id
+            if follower_id not in self.sent_length:
+                self.start_replication(follower_id)
+            self.inflight[follower_id] = max(0, self.inflight.get(follower_id, 0) - 1)
+            self.last_heard[follower_id] = self.clock
+            if message.read_round > self.read_acks.get(follower_id, 0):
+                self.read_acks[follower_id] = message.read_round
+                self.serve_reads()
+            if message.snapshot_offset:
+                self.handle_snapshot_ack(follower_id, message)
+            elif message.success:
+                if message.acknowledged >= self.acked_length[follower_id]:
+                    self.sent_length[follower_id] = max(self.sent_length[follower_id], message.acknowledged)
+                    self.acked_length[follower_id] = message.acknowledged
+                    if message.acknowledged == self.sent_length[follower_id]:
+                        # everything we sent has arrived, requests still counted as in flight were lost
+                        self.inflight[follower_id] = 0
+                    self.probing.discard(follower_id)
+                    self.snapshot_offsets.pop(follower_id, None)
+                    self.commit_log_entries()
+                    self.send_pending_entries(follower_id)
+            else:
+                self.rejections_counter.inc()
+                self.backoffs_counter.inc(int(self.sent_length[follower_id] > self.acked_length[follower_id]))
+                # the pipeline broke: probe one request at a time from where the follower says our logs diverge,
+                # which skips the follower's whole conflicting term instead of backing off one entry at a time
+                self.probing.add(follower_id)
+                self.sent_length[follower_id] = max(
+                    self.acked_length[follower_id], min(self.sent_length[follower_id], self.conflict_length(message))
+                )
+                self.inflight[follower_id] = 0
+                # a follower that lost what it had of our snapshot gets it from the start
+                self.snapshot_offsets.pop(follower_id, None)
+                self.replicate_log(self.node_id, follower_id)
         elif message.term > self.current_term:
             self.current_term = message.term
             self.current_role = Role.FOLLOWER
             self.voted_for = None
             self.set_election_timeout()  # canceling by ensuring it's not close to 0
-        self.set_heartbeat_timeout()
+            self.set_heartbeat_timeout()
+
+    def conflict_length(self, message: LogResponse):
+        # Raft paper, section 5.3: if we have entries from the follower's conflicting term, our logs agree up to our
+        # last one of them, otherwise retry from where the follower's term started
+        if message.conflict_term:
+            end = self.log.first_index_of(message.conflict_term + 1)
+            if self.log.term_at(end - 1) == message.conflict_term:
+                return end
+        return message.conflict_index
 
     def handle_message(self, message):
         if isinstance(message, VoteRequest) and message.candidate_id != self.node_id:
@@ -241,23 +741,70 @@ class Node:
             self.handle_log_request(message)
         elif isinstance(message, LogResponse) and message.node_id != self.node_id:
             self.handle_log_response(message)
+        elif isinstance(message, InstallSnapshot) and message.to_node == self.node_id:
+            self.handle_install_snapshot(message)
 
     def handle_crash(self):
         self.current_role = Role.FOLLOWER
         self.current_leader = None
         self.votes_received = {}
-        self.sent_length = []
-        self.acked_length = []
+        self.sent_length = {}
+        self.acked_length = {}
+        self.inflight = {}
+        self.probing = set()
+        self.snapshot_offsets = {}
+        self.pre_votes_received = None
+        self.last_heard = {}
+        self.incoming_snapshot = self.incoming_snapshot_key = None
+        self.fail_requests()
+        self.lease_expiry = 0
+        # whoever we last heard from may still hold a lease we no longer remember granting
+        self.last_leader_contact = self.clock
+        # storage is all that survives: messages waiting for a sync are lost, and what was applied since the
+        # snapshot is applied again once we learn the commit length from the leader
+        self.pending_messages = []
+        self.proposal_times.clear()
+        if self.apply_stream is not None:
+            self.apply_stream.clear()
+        self.load_snapshot()
 
     def handle_heartbeat_timeout_or_election_timeout(self):
+        if not self.is_voter():
+            # learners, and nodes that have been removed or haven't joined yet, never stand for election
+            self.set_heartbeat_timeout()
+            return
+        if self.pre_vote and self.current_role is Role.FOLLOWER:
+            self.start_pre_vote()
+        else:
+            self.start_election()
+
+    def start_pre_vote(self):
+        # Raft thesis, section 9.6: the term only goes up once a quorum would grant us its votes in the next one
+        self.pre_votes_received = {self.node_id}
+        if self.has_vote_quorum(self.pre_votes_received):
+            self.start_election()
+            return
+        self.pre_votes_counter.inc()
+        self.send(
+            VoteRequest(
+                candidate_id=self.node_id,
+                term=self.current_term + 1,
+                last_log_index=len(self.log),
+                last_log_term=self.log.last_term,
+                pre_vote=True,
+            )
+        )
+        self.set_heartbeat_timeout()  # and if it doesn't, ask again
+
+    def start_election(self):
+        self.elections_counter.inc()
         self.current_term += 1
         self.current_role = Role.CANDIDATE
         self.voted_for = self.node_id
         self.votes_received = {self.node_id: True}
-        last_term = 0
-        if len(self.log) > 0:
-            last_term = self.log[-1].term
-        self.server.broadcast_message(
+        self.pre_votes_received = None
+        last_term = self.log.last_term
+        self.send(
             VoteRequest(
                 candidate_id=self.node_id,
                 term=self.current_term,
@@ -268,32 +815,288 @@ class Node:
         self.set_election_timeout()
         self.set_heartbeat_timeout()
 
+    def become_leader(self):
+        self.current_role = Role.LEADER
+        self.current_leader = self.node_id
+        self.leaderships_counter.inc()
+        self.term_start = len(self.log)
+        self.read_acks = MatchIndex()
+        self.read_round_clocks = {}
+        self.lease_expiry = 0
+        # every follower gets the shortest election timeout to respond to us before check_quorum counts it out
+        self.last_heard = dict.fromkeys(self.peer_ids(), self.clock)
+        self.set_election_timeout()  # canceling by ensuring it's not close to 0
+        self.set_heartbeat_timeout()
+        for follower_id in self.peer_ids():
+            self.start_replication(follower_id)
+        # a no-op from our term, so that whatever the previous leaders left uncommitted commits without waiting for
+        # a proposal, and reads know where the log stands. The first leader of a cluster makes it a configuration of
+        # the nodes on the transport, which stays the set of voters until a membership change, whoever joins later
+        bootstrap = Configuration(frozenset(self.server.node_ids())) if self.configuration is None else None
+        self.append_proposals([(bootstrap, None)])
+        if self.configurations:
+            # finish whatever membership change the previous leader was in the middle of
+            self.advance_configuration()
+
+    def step_down(self):
+        # check_quorum: cut off from a quorum, which may already have elected someone else
+        self.step_downs_counter.inc()
+        self.current_role = Role.FOLLOWER
+        self.current_leader = None
+        self.fail_requests()
+        self.set_heartbeat_timeout()
+
+    def heard_from_quorum(self):
+        # whether a quorum responded to us within the shortest election timeout
+        horizon = self.clock - self.election_timeout_range[0]
+        return self.has_vote_quorum(
+            {self.node_id} | {node_id for node_id, clock in self.last_heard.items() if clock > horizon}
+        )
+
+    def heard_from_leader(self):
+        # a leader we heard from within the shortest election timeout is presumed alive
+        return self.current_role is Role.LEADER or (
+            self.last_leader_contact is not None
+            and self.clock - self.last_leader_contact < self.election_timeout_range[0]
+        )
+
     def tick(self):
         self.clock += 1
+        if self.current_role is not Role.LEADER:
+            if self.pending_reads or self.proposal_futures or self.proposal_buffer:
+                self.fail_requests()
+        elif self.proposal_buffer and self.clock >= self.batch_deadline:
+            self.flush_proposals()
         self.heartbeat_timeout -= 1
         if self.current_role is Role.CANDIDATE:
             self.election_timeout -= 1
         if self.current_role is Role.LEADER and self.heartbeat_timeout <= 0:
-            self.broadcast_heartbeat()
+            if self.check_quorum and not self.heard_from_quorum():
+                self.step_down()
+            else:
+                self.broadcast_heartbeat()
         elif self.heartbeat_timeout <= 0 or (self.current_role is Role.CANDIDATE and self.election_timeout <= 0):
             self.handle_heartbeat_timeout_or_election_timeout()
 
-    def get_follower_nodes(self):
-        return [
-            node
-            for node in self.server.nodes
-            if (node.current_leader == self.node_id or node.voted_for == self.node_id)
-            and node.current_term == self.current_term
-        ]
+    def ticks_until_timeout(self):
+        if self.current_role is not Role.LEADER and (
+            self.pending_reads or self.proposal_futures or self.proposal_buffer
+        ):
+            # they fail on the next tick
+            return 1
+        ticks = self.heartbeat_timeout
+        if self.current_role is Role.CANDIDATE:
+            ticks = min(ticks, self.election_timeout)
+        if self.proposal_buffer:
+            ticks = min(ticks, self.batch_deadline - self.clock)
+        return max(1, math.ceil(ticks))
+
+    def advance_clock(self, ticks):
+        # equivalent to `ticks` calls to tick() as long as ticks < ticks_until_timeout()
+        self.clock += ticks
+        self.heartbeat_timeout -= ticks
+        if self.current_role is Role.CANDIDATE:
+            self.election_timeout -= ticks
 
     def commit_log_entries(self):
-        while self.commit_length < len(self.log):
-            acks = 0
-            for node in self.get_follower_nodes():
-                if self.acked_length[node.node_id] > self.commit_length:
-                    acks += 1
-            if acks >= (len(self.server.nodes) + 1) / 2:
-                self.server.add_app_msgs([self.log[self.commit_length].message])
-                self.commit_length += 1
-            else:
+        if not self.storage.dirty:
+            # our own entries only count towards a quorum once they are durable
+            self.acked_length[self.node_id] = len(self.log)
+        ready = self.quorum_length(self.acked_length)
+        # Raft paper, section 5.4.2: counting replicas only commits entries from our own term, the ones before them
+        # commit along with them
+        if ready > self.commit_length and self.log.term_at(ready - 1) == self.current_term:
+            self.commit_length = ready
+            self.apply_committed()
+
+    def apply_committed(self):
+        end = self.commit_length
+        if self.apply_stream is not None:
+            end = min(end, self.last_applied + self.apply_stream.room())
+        if end > self.last_applied:
+            self.apply_entries(end)
+        if self.proposal_futures:
+            self.resolve_proposals()
+        if self.proposal_times:
+            self.record_commit_latency()
+        if self.pending_reads:
+            self.serve_reads()
+        if self.last_applied - self.log.snapshot_index >= self.snapshot_threshold:
+            self.take_snapshot()
+        if self.configurations and self.current_role is Role.LEADER:
+            self.advance_configuration()
+
+    def apply_entries(self, end):
+        # None entries are the no-ops new leaders start their terms with, configurations are for us alone
+        payloads = self.log[self.last_applied : end].payloads
+        if self.apply_stream is None:
+            messages = [message for message in payloads if message is not None and type(message) is not Configuration]
+            for message in messages:
+                self.state_machine.apply(message)
+            self.server.add_app_msgs(messages)
+        else:
+            for index, message in enumerate(payloads, self.last_applied):
+                if message is not None and type(message) is not Configuration:
+                    self.state_machine.apply(message)
+                    self.apply_stream.put(index, message)
+        self.last_applied = end
+
+    def read(self, query) -> Future:
+        """
+        Answers `query` from the state machine without appending to the log, as of some point between the call and
+        the future resolving. Fails with NotLeaderError on anything but the leader, or if it stops being the leader.
+        """
+        future = Future()
+        if self.current_role is not Role.LEADER:
+            future.set_exception(NotLeaderError(self.current_leader))
+            return future
+        if (
+            self.lease_ticks
+            and self.clock < self.lease_expiry
+            and self.last_applied == self.commit_length > self.term_start
+        ):
+            future.set_result(self.state_machine.query(query))
+            return future
+        self.pending_reads.append((self.read_round + 1, self.commit_length, query, future))
+        if self.quorum_length(self.read_acks) == self.read_round:
+            self.start_read_round()
+        return future
+
+    def start_read_round(self):
+        self.read_round += 1
+        self.read_round_clocks[self.read_round] = self.clock
+        self.read_acks[self.node_id] = self.read_round
+        for follower_id in self.peer_ids():
+            self.replicate_log(self.node_id, follower_id)
+        self.set_heartbeat_timeout()
+        self.serve_reads()
+
+    def serve_reads(self):
+        confirmed = self.quorum_length(self.read_acks)
+        for read_round in [r for r in self.read_round_clocks if r <= confirmed]:
+            started = self.read_round_clocks.pop(read_round)
+            if self.lease_ticks:
+                # nobody who acknowledged this round votes for anyone else until lease_ticks after they saw it
+                self.lease_expiry = max(self.lease_expiry, started + int(self.lease_ticks * (1 - CLOCK_DRIFT)))
+        while self.pending_reads:
+            read_round, read_index, query, future = self.pending_reads[0]
+            if read_round > confirmed or self.last_applied < max(read_index, self.term_start + 1):
                 break
+            self.pending_reads.popleft()
+            future.set_result(self.state_machine.query(query))
+        if self.pending_reads and confirmed == self.read_round and self.pending_reads[-1][0] > self.read_round:
+            # reads that came in during the last round need one of their own, the others only wait to be applied
+            self.start_read_round()
+
+    def resolve_proposals(self):
+        while self.proposal_futures and self.proposal_futures[0][1] < self.commit_length:
+            term, index, future = self.proposal_futures.popleft()
+            if term == self.current_term and self.current_role is Role.LEADER:
+                future.set_result(index)
+            else:
+                # whoever committed this index may have overwritten our entry
+                future.set_exception(NotLeaderError(self.current_leader))
+
+    def record_commit_latency(self):
+        now = time.perf_counter()
+        while self.proposal_times and self.proposal_times[0][0] <= self.commit_length:
+            _, clock, started, count = self.proposal_times.popleft()
+            if self.current_role is Role.LEADER:
+                self.commit_ticks_histogram.observe(self.clock - clock, count)
+                self.commit_seconds_histogram.observe(now - started, count)
+
+    def gauge_term(self):
+        return self.current_term
+
+    def gauge_is_leader(self):
+        return int(self.current_role is Role.LEADER)
+
+    def gauge_log_length(self):
+        return len(self.log)
+
+    def gauge_commit_length(self):
+        return self.commit_length
+
+    def gauge_last_applied(self):
+        return self.last_applied
+
+    def gauge_unapplied_entries(self):
+        return self.commit_length - self.last_applied
+
+    def enable_profiling(self):
+        profile(self, ("handle_message", "tick"), self.metrics)
+
+    def fail_requests(self):
+        error = NotLeaderError(self.current_leader)
+        while self.pending_reads:
+            self.pending_reads.popleft()[-1].set_exception(error)
+        while self.proposal_futures:
+            self.proposal_futures.popleft()[-1].set_exception(error)
+        futures, self.configuration_futures = self.configuration_futures, []
+        for future in futures:
+            future.set_exception(error)
+        proposals, self.proposal_buffer = self.proposal_buffer, []
+        for _, future in proposals:
+            if future is not None:
+                future.set_exception(error)
+
+    def within_leader_lease(self, candidate_id):
+        # with leases on, a node that heard from the leader recently must not help anyone replace it
+        return (
+            self.lease_ticks > 0
+            and self.last_leader_contact is not None
+            and candidate_id != self.current_leader
+            and self.clock - self.last_leader_contact < self.lease_ticks
+        )
+
+    def take_snapshot(self):
+        self.snapshots_counter.inc()
+        term = self.log.term_at(self.last_applied - 1)
+        configuration = self.configuration_at(self.last_applied)
+        self.storage.save_snapshot(self.last_applied, term, pack_snapshot(configuration, self.state_machine.snapshot()))
+        # only the configuration the snapshot carries and the ones after it are still needed
+        covered = [entry for entry in self.configurations if entry[0] < self.last_applied]
+        self.configurations = covered[-1:] + self.configurations[len(covered) :]
+
+    def change_membership(self, voters, learners=()) -> Future:
+        """
+        Moves the cluster to the given voters and learners, through a joint configuration if the voters change, while
+        proposals carry on as usual. The future resolves with the new Configuration once it commits, or fails with
+        NotLeaderError if this node isn't (or stops being) the leader first. Raises ValueError if another change is
+        still in progress.
+        """
+        future = Future()
+        if self.current_role is not Role.LEADER:
+            future.set_exception(NotLeaderError(self.current_leader))
+            return future
+        voters = frozenset(voters)
+        if not voters:
+            raise ValueError("a cluster needs at least one voter")
+        if self.configurations and (self.configuration.joint or self.configurations[-1][0] >= self.commit_length):
+            raise ValueError("a membership change is already in progress")
+        old_voters = self.configuration.voters
+        learners = frozenset(learners) - voters
+        if voters == old_voters:
+            configuration = Configuration(voters, learners)
+        else:
+            configuration = Configuration(voters, learners, old_voters)
+        self.configuration_futures.append(future)
+        self.append_proposals([(configuration, None)])
+        return future
+
+    def advance_configuration(self):
+        # runs on the leader: a joint configuration moves on to the final one once it commits, and a final one
+        # completes the change when it commits
+        index, configuration = self.configurations[-1]
+        if index >= self.commit_length:
+            return
+        if configuration.joint:
+            self.append_proposals([(configuration.final(), None)])
+            return
+        futures, self.configuration_futures = self.configuration_futures, []
+        for future in futures:
+            future.set_result(configuration)
+        if not configuration.is_voter(self.node_id):
+            # we have been removed, the remaining voters will elect a leader among themselves
+            self.current_role = Role.FOLLOWER
+            self.current_leader = None
@@ -1,28 +1,140 @@
-class Server:
-    def __init__(self):
+from collections import deque
+
+from src.checkpoint import Checkpoint
+from src.messages import validate_message
+from src.metrics import NULL_METRICS
+from src.transport import Transport
+
+
+class Server(Transport):
+    def __init__(self, strict=False, app_messages_limit=None, metrics=None):
+        # strict validates every message against its pydantic model, which is handy when debugging but slow
+        self.strict = strict
         self.nodes = []
-        self.message_queue = []
-        self.app_messages = []
+        self.node_index = {}
+        self.message_queue = deque()
+        # with a limit only the most recent app messages are kept
+        self.app_messages = [] if app_messages_limit is None else deque(maxlen=app_messages_limit)
+        self.clock = 0
+        self.metrics = NULL_METRICS if metrics is None else metrics
+        self.message_counters = {}
+        self.iterations_counter = self.metrics.counter("iterations")
+        self.skipped_ticks_counter = self.metrics.counter("skipped_ticks")
+        self.queue_depth_histogram = self.metrics.histogram("message_queue_depth")
+        self.metrics.gauge("message_queue_length", self.gauge_message_queue_length)
+
+    def gauge_message_queue_length(self):
+        # a bound method, unlike a lambda, reads the copy in a deepcopy of the server
+        return len(self.message_queue)
+
+    def node_ids(self):
+        return self.node_index.keys()
 
     def __distribute_message(self):
         if self.message_queue:
-            message = self.message_queue.pop(0)
-            for node in self.nodes:
-                node.handle_message(message)
+            message = self.message_queue.popleft()
+            for node in self.__recipients(message):
+                self.deliver(node, message)
+
+    def deliver(self, node, message):
+        node.handle_message(message)
+
+    def ticks_until_delivery(self):
+        # how long until something in flight reaches a node, None when nothing is
+        return 0 if self.message_queue else None
+
+    def __recipients(self, message):
+        destination = message.destination
+        if destination is None:
+            return self.nodes
+        node = self.node_index.get(destination)
+        return () if node is None else (node,)
 
     def broadcast_message(self, message):
+        if self.strict:
+            validate_message(message)
+        if self.metrics.enabled:
+            self.count_message(message)
         self.message_queue.append(message)
 
+    def count_message(self, message):
+        counter = self.message_counters.get(type(message))
+        if counter is None:
+            counter = self.message_counters[type(message)] = self.metrics.counter(f"messages.{type(message).__name__}")
+        counter.inc()
+
     def __tick_clock(self):
         for node in self.nodes:
             node.tick()
 
+    def __flush_nodes(self):
+        # messages held back until their node's storage is synced go out together, one fsync per node per step
+        for node in self.nodes:
+            if node.pending_messages:
+                node.flush()
+
+    def __skip_idle_ticks(self, limit=None):
+        # with nothing in flight the only thing left to happen is the next timeout firing,
+        # so every tick before it just decrements counters and can be applied in bulk
+        self.__flush_nodes()
+        delivery = self.ticks_until_delivery()
+        if delivery == 0:
+            return
+        if self.nodes:
+            idle = min(node.ticks_until_timeout() for node in self.nodes) - 1
+        elif limit is not None:
+            idle = limit - self.clock
+        elif delivery is not None:
+            idle = delivery
+        else:
+            return
+        if limit is not None:
+            idle = min(idle, limit - self.clock)
+        if delivery is not None:
+            idle = min(idle, delivery)
+        if idle > 0:
+            for node in self.nodes:
+                node.advance_clock(idle)
+            self.clock += idle
+            self.skipped_ticks_counter.inc(idle)
+
     def iterate(self):
+        self.iterations_counter.inc()
+        self.queue_depth_histogram.observe(len(self.message_queue))
         self.__distribute_message()
         self.__tick_clock()
+        self.__flush_nodes()
+        self.clock += 1
+
+    def run_for(self, ticks):
+        end = self.clock + ticks
+        while self.clock < end:
+            self.__skip_idle_ticks(end)
+            if self.clock < end:
+                self.iterate()
+
+    def run_until(self, predicate, max_ticks=None):
+        end = None if max_ticks is None else self.clock + max_ticks
+        while not predicate():
+            if end is not None and self.clock >= end:
+                return False
+            self.__skip_idle_ticks(end)
+            if end is None or self.clock < end:
+                self.iterate()
+        return True
 
     def add_node(self, node):
         self.nodes.append(node)
+        self.node_index[node.node_id] = node
 
     def add_app_msgs(self, messages):
         self.app_messages += messages
+
+    def checkpoint(self) -> Checkpoint:
+        return Checkpoint(self)
+
+    def metrics_snapshot(self):
+        return {
+            "server": self.metrics.snapshot(),
+            "nodes": {str(node.node_id): node.metrics.snapshot() for node in self.nodes},
+        }
@@ -0,0 +1,45 @@
+import pickle
+
+
+class StateMachine:
+    """
+    What the replicated log drives: every committed message is passed to apply() exactly once, in log order.
+
+    snapshot() must capture everything applied so far as bytes and restore() must rebuild it from them; they let a
+    node discard its log prefix and bring far-behind followers up to date. This base class keeps no state.
+    """
+
+    def apply(self, message):
+        return None
+
+    def query(self, query):
+        return None
+
+    def snapshot(self) -> bytes:
+        return b""
+
+    def restore(self, data: bytes):
+        pass
+
+
+class KeyValueStateMachine(StateMachine):
+    """A dict from keys to values, written by ("set", key, value) and ("delete", key) entries and read by key."""
+
+    def __init__(self):
+        self.data = {}
+
+    def apply(self, message):
+        if isinstance(message, tuple) and message:
+            if message[0] == "set":
+                self.data[message[1]] = message[2]
+            elif message[0] == "delete":
+                self.data.pop(message[1], None)
+
+    def query(self, key):
+        return self.data.get(key)
+
+    def snapshot(self) -> bytes:
+        return pickle.dumps(self.data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, data: bytes):
+        self.data = pickle.loads(data) if data else {}
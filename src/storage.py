@@ -0,0 +1,606 @@
+import copy
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import uuid
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List
+
+from src.messages import LogMessage
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+# payload length, crc32 of the payload, term
+RECORD_HEADER = struct.Struct("<IIq")
+# last included index, last included term, crc32 of the data
+SNAPSHOT_HEADER = struct.Struct("<qqI")
+
+
+def payload_size(message) -> int:
+    if isinstance(message, (bytes, bytearray, memoryview, str)):
+        return len(message)
+    return sys.getsizeof(message)
+
+
+class LogEntries:
+    """
+    A run of log entries as a column of terms and a list of payloads, which is what slicing a log returns.
+
+    No LogMessage is built unless an entry is looked at on its own, and extending a MemoryLog with one copies the
+    two columns in bulk. Slices are copies (a memcpy of the terms and of the payload pointers) rather than views
+    into the log, so they stay valid when the log they came from is truncated or compacted.
+    """
+
+    __slots__ = ("terms", "payloads")
+
+    def __init__(self, terms=None, payloads=None):
+        self.terms = array("q") if terms is None else terms
+        self.payloads = [] if payloads is None else payloads
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LogEntries(self.terms[index], self.payloads[index])
+        return LogMessage(self.terms[index], self.payloads[index])
+
+    def __iter__(self):
+        return map(LogMessage, self.terms, self.payloads)
+
+    def __eq__(self, other):
+        if isinstance(other, LogEntries):
+            return self.terms == other.terms and self.payloads == other.payloads
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"LogEntries({list(self)!r})"
+
+    def __deepcopy__(self, memo):
+        # nothing changes a run of entries once it is built, so copies of the messages carrying it can share it
+        return self
+
+
+class MemoryLog:
+    """
+    A log of LogMessages in memory, addressed by absolute index.
+
+    Entries are stored column-wise: terms and the running total of payload sizes in typed arrays, payloads in a
+    list, so an entry costs three machine words on top of its payload and term lookups never touch the payloads.
+
+    The prefix covered by a snapshot can be dropped with compact(); snapshot_index and snapshot_term then describe
+    the last compacted entry, and reading below it raises IndexError.
+
+    copy.deepcopy() is copy-on-write: the copy shares the columns with the original, payloads included, and whichever
+    of the two changes first copies the columns (though never the payloads) before it does.
+    """
+
+    shared = False
+
+    def __init__(self, entries=()):
+        self.terms = array("q")
+        self.payloads = []
+        # ends[i] is the total payload size up to and including entry i, counted from the start of the log
+        self.ends = array("q")
+        self.compacted_bytes = 0
+        self.snapshot_index = 0
+        self.snapshot_term = 0
+        self.extend(entries)
+
+    def __len__(self):
+        return self.snapshot_index + len(self.terms)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("log slices do not support a step")
+            if start < self.snapshot_index and start < stop:
+                raise IndexError("log index is compacted")
+            start, stop = max(start - self.snapshot_index, 0), max(stop - self.snapshot_index, 0)
+            return LogEntries(self.terms[start:stop], self.payloads[start:stop])
+        if index < 0:
+            index += len(self)
+        if index < self.snapshot_index:
+            raise IndexError("log index is compacted")
+        index -= self.snapshot_index
+        return LogMessage(self.terms[index], self.payloads[index])
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.stop is not None or index.step is not None:
+            raise ValueError("only a suffix of the log can be deleted")
+        self.truncate(index.indices(len(self))[0])
+
+    def __iter__(self):
+        return map(LogMessage, self.terms, self.payloads)
+
+    def __eq__(self, other):
+        if isinstance(other, MemoryLog):
+            return (self.snapshot_index, self.terms, self.payloads) == (
+                other.snapshot_index,
+                other.terms,
+                other.payloads,
+            )
+        return self.snapshot_index == 0 and list(self) == list(other)
+
+    def __repr__(self):
+        return f"MemoryLog(snapshot_index={self.snapshot_index}, entries={list(self)!r})"
+
+    def term_at(self, index):
+        if index < 0:
+            return 0
+        if index == self.snapshot_index - 1:
+            return self.snapshot_term
+        if index < self.snapshot_index:
+            raise IndexError("log index is compacted")
+        return self.terms[index - self.snapshot_index]
+
+    @property
+    def last_term(self):
+        return self.terms[-1] if self.terms else self.snapshot_term
+
+    def first_index_of(self, term):
+        # terms never decrease along a log, so the first entry of a term can be bisected for
+        return self.snapshot_index + bisect_left(self.terms, term)
+
+    @property
+    def total_bytes(self):
+        return self.ends[-1] if self.ends else self.compacted_bytes
+
+    def unshare(self):
+        self.terms = self.terms[:]
+        self.payloads = self.payloads[:]
+        self.ends = self.ends[:]
+        self.shared = False
+
+    def __deepcopy__(self, memo):
+        fork = copy.copy(self)
+        self.shared = fork.shared = True
+        return fork
+
+    def append(self, entry: LogMessage):
+        if self.shared:
+            self.unshare()
+        self.terms.append(entry.term)
+        self.payloads.append(entry.message)
+        self.ends.append(self.total_bytes + payload_size(entry.message))
+
+    def extend(self, entries):
+        if not isinstance(entries, LogEntries):
+            for entry in entries:
+                self.append(entry)
+            return
+        if self.shared:
+            self.unshare()
+        total = self.total_bytes
+        for message in entries.payloads:
+            total += payload_size(message)
+            self.ends.append(total)
+        self.terms.extend(entries.terms)
+        self.payloads.extend(entries.payloads)
+
+    def batch(self, start, max_entries, max_bytes) -> LogEntries:
+        # entries from `start` on, as many as fit in max_entries and max_bytes but always at least one
+        first = start - self.snapshot_index
+        if first < 0:
+            raise IndexError("log index is compacted")
+        last = min(len(self.terms), first + max_entries)
+        if first >= last:
+            return LogEntries()
+        base = self.ends[first - 1] if first > 0 else self.compacted_bytes
+        stop = max(bisect_right(self.ends, base + max_bytes, first, last), first + 1)
+        return LogEntries(self.terms[first:stop], self.payloads[first:stop])
+
+    def truncate(self, length):
+        if length < self.snapshot_index:
+            raise IndexError("cannot truncate into the snapshot")
+        keep = length - self.snapshot_index
+        if self.shared:
+            self.unshare()
+        del self.terms[keep:]
+        del self.payloads[keep:]
+        del self.ends[keep:]
+
+    def compact(self, index, term):
+        # Raft paper, section 7: keep what follows the snapshot if our log agrees with it, otherwise start over
+        if index <= self.snapshot_index:
+            return
+        if self.shared:
+            self.unshare()
+        if index <= len(self) and self.term_at(index - 1) == term:
+            dropped = index - self.snapshot_index
+            self.compacted_bytes = self.ends[dropped - 1]
+            del self.terms[:dropped]
+            del self.payloads[:dropped]
+            del self.ends[:dropped]
+        else:
+            self.terms = array("q")
+            self.payloads = []
+            self.ends = array("q")
+            self.compacted_bytes = 0
+        self.snapshot_index = index
+        self.snapshot_term = term
+
+
+class MemoryStorage:
+    """Keeps the log, the hard state and the latest snapshot in memory, so nothing survives a restart."""
+
+    dirty = False
+
+    def __init__(self, node_id=None):
+        self.log = MemoryLog()
+        self.node_id = uuid.uuid4() if node_id is None else node_id
+        self.current_term = 0
+        self.voted_for = None
+        self.snapshot = None
+
+    def save_state(self, current_term, voted_for):
+        self.current_term = current_term
+        self.voted_for = voted_for
+
+    def save_snapshot(self, index, term, data):
+        self.snapshot = (index, term, data)
+        self.log.compact(index, term)
+
+    def load_snapshot(self):
+        return self.snapshot
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Segment:
+    def __init__(self, path, base_index):
+        self.path = path
+        self.base_index = base_index
+        self.file = open(path, "a+b")
+        self.size = self.file.seek(0, os.SEEK_END)
+        self.view = None
+
+    def append(self, record):
+        self.file.write(record)
+        self.size += len(record)
+
+    def read(self, offset, length):
+        if self.view is None or len(self.view) < offset + length:
+            self.unmap()
+            self.file.flush()
+            self.view = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.view[offset : offset + length]
+
+    def truncate(self, size):
+        # a mapping must not outlive the bytes it covers
+        self.unmap()
+        self.file.flush()
+        self.file.truncate(size)
+        self.size = size
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def unmap(self):
+        if self.view is not None:
+            self.view.close()
+            self.view = None
+
+    def close(self):
+        self.unmap()
+        self.file.close()
+
+
+class SegmentedLog:
+    """
+    A log of LogMessages stored in append-only segment files named after the index of their first entry.
+
+    Terms and record offsets are indexed in memory, entries are read back through mmap. Writes are buffered
+    until sync(), which fsyncs everything appended or truncated since the previous call in one go. Compaction
+    deletes the segments that lie entirely behind the snapshot.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segments: List[Segment] = []
+        self.base_indexes: List[int] = []
+        # index of the first entry still on disk, terms and offsets are relative to it
+        self.first_index = 0
+        self.terms = array("q")
+        self.offsets = array("q")
+        self.snapshot_index = 0
+        self.snapshot_term = 0
+        self.unsynced = set()
+        self.directory_changed = False
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".log"):
+                self.load_segment(os.path.join(directory, name), int(name[: -len(".log")]))
+        if not self.segments:
+            self.add_segment(0)
+        # whatever came before the first segment was compacted, its term is known to whoever kept the snapshot
+        self.snapshot_index = self.first_index
+
+    @property
+    def dirty(self):
+        return bool(self.unsynced) or self.directory_changed
+
+    def load_segment(self, path, base_index):
+        if not self.segments:
+            self.first_index = base_index
+        elif base_index != len(self):
+            # a gap means a later segment outlived a truncation that crashed halfway, it holds nothing valid
+            os.remove(path)
+            return
+        segment = Segment(path, base_index)
+        self.segments.append(segment)
+        self.base_indexes.append(base_index)
+        offset = 0
+        while offset + RECORD_HEADER.size <= segment.size:
+            length, checksum, term = RECORD_HEADER.unpack(segment.read(offset, RECORD_HEADER.size))
+            end = offset + RECORD_HEADER.size + length
+            if end > segment.size or zlib.crc32(segment.read(offset + RECORD_HEADER.size, length)) != checksum:
+                break
+            self.terms.append(term)
+            self.offsets.append(offset)
+            offset = end
+        if offset < segment.size:
+            # torn write at the tail
+            segment.truncate(offset)
+            self.unsynced.add(segment)
+
+    def add_segment(self, base_index):
+        segment = Segment(os.path.join(self.directory, f"{base_index:020d}.log"), base_index)
+        self.segments.append(segment)
+        self.base_indexes.append(base_index)
+        self.directory_changed = True
+        return segment
+
+    def remove_last_segment(self):
+        segment = self.segments.pop()
+        self.base_indexes.pop()
+        self.unsynced.discard(segment)
+        segment.close()
+        os.remove(segment.path)
+        self.directory_changed = True
+
+    def __len__(self):
+        return self.first_index + len(self.terms)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("log slices do not support a step")
+            if start < self.snapshot_index and start < stop:
+                raise IndexError("log index is compacted")
+            start = max(start, self.snapshot_index)
+            terms = self.terms[start - self.first_index : stop - self.first_index]
+            return LogEntries(terms, [self.read_payload(i) for i in range(start, stop)])
+        if index < 0:
+            index += len(self)
+        if not self.snapshot_index <= index < len(self):
+            raise IndexError("log index out of range or compacted")
+        return self.read(index)
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.stop is not None or index.step is not None:
+            raise ValueError("only a suffix of the log can be deleted")
+        self.truncate(index.indices(len(self))[0])
+
+    def __iter__(self):
+        for i in range(self.snapshot_index, len(self)):
+            yield self.read(i)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def read(self, index):
+        return LogMessage(term=self.terms[index - self.first_index], message=self.read_payload(index))
+
+    def read_payload(self, index):
+        segment = self.segments[bisect_right(self.base_indexes, index) - 1]
+        offset = self.offsets[index - self.first_index]
+        length = RECORD_HEADER.unpack(segment.read(offset, RECORD_HEADER.size))[0]
+        return pickle.loads(segment.read(offset + RECORD_HEADER.size, length))
+
+    def batch(self, start, max_entries, max_bytes) -> LogEntries:
+        if start < self.snapshot_index:
+            raise IndexError("log index is compacted")
+        stop = min(len(self), start + max_entries)
+        payloads = []
+        size = 0
+        for index in range(start, stop):
+            payload = self.read_payload(index)
+            size += payload_size(payload)
+            if payloads and size > max_bytes:
+                break
+            payloads.append(payload)
+        first = start - self.first_index
+        return LogEntries(self.terms[first : first + len(payloads)], payloads)
+
+    def term_at(self, index):
+        if index < 0:
+            return 0
+        if index == self.snapshot_index - 1:
+            return self.snapshot_term
+        if not self.snapshot_index <= index < len(self):
+            raise IndexError("log index out of range or compacted")
+        return self.terms[index - self.first_index]
+
+    @property
+    def last_term(self):
+        return self.term_at(len(self) - 1)
+
+    def first_index_of(self, term):
+        return max(self.first_index + bisect_left(self.terms, term), self.snapshot_index)
+
+    def append(self, entry: LogMessage):
+        payload = pickle.dumps(entry.message, protocol=pickle.HIGHEST_PROTOCOL)
+        segment = self.segments[-1]
+        if segment.size >= self.segment_bytes:
+            segment = self.add_segment(len(self))
+        self.terms.append(entry.term)
+        self.offsets.append(segment.size)
+        segment.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload), entry.term) + payload)
+        self.unsynced.add(segment)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def truncate(self, length):
+        if length >= len(self):
+            return
+        if length < self.snapshot_index:
+            raise IndexError("cannot truncate into the snapshot")
+        owner = bisect_right(self.base_indexes, length) - 1
+        if owner > 0 and self.base_indexes[owner] == length:
+            # the whole segment goes, the one before it stays intact
+            owner -= 1
+            keep_bytes = self.segments[owner].size
+        else:
+            keep_bytes = self.offsets[length - self.first_index]
+        while len(self.segments) > owner + 1:
+            self.remove_last_segment()
+        segment = self.segments[-1]
+        if keep_bytes < segment.size:
+            segment.truncate(keep_bytes)
+            self.unsynced.add(segment)
+        del self.terms[length - self.first_index :]
+        del self.offsets[length - self.first_index :]
+
+    def compact(self, index, term):
+        # Raft paper, section 7: keep what follows the snapshot if our log agrees with it, otherwise start over
+        if index < self.snapshot_index:
+            return
+        if index > len(self) or (index > self.first_index and self.terms[index - 1 - self.first_index] != term):
+            while self.segments:
+                self.remove_last_segment()
+            self.first_index = index
+            self.terms = array("q")
+            self.offsets = array("q")
+            self.add_segment(index)
+        else:
+            while len(self.segments) > 1 and self.base_indexes[1] <= index:
+                segment = self.segments.pop(0)
+                self.base_indexes.pop(0)
+                self.unsynced.discard(segment)
+                segment.close()
+                os.remove(segment.path)
+                self.directory_changed = True
+                dropped = self.base_indexes[0] - self.first_index
+                del self.terms[:dropped]
+                del self.offsets[:dropped]
+                self.first_index = self.base_indexes[0]
+        self.snapshot_index = index
+        self.snapshot_term = term
+
+    def sync(self):
+        for segment in self.unsynced:
+            segment.sync()
+        self.unsynced.clear()
+        if self.directory_changed:
+            sync_directory(self.directory)
+            self.directory_changed = False
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+class FileStorage:
+    """
+    Persists the log as a SegmentedLog, the node id, current term and vote in a small state file, and the latest
+    snapshot in a file of its own.
+
+    Nothing is durable until sync(); Node defers the messages that depend on new state until then, so all the
+    appends made in one step of the simulation share a single fsync (group commit).
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.state_path = os.path.join(directory, "state.json")
+        self.snapshot_path = os.path.join(directory, "snapshot")
+        self.log = SegmentedLog(os.path.join(directory, "log"), segment_bytes)
+        self.state_changed = False
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as state_file:
+                state = json.load(state_file)
+            self.node_id = uuid.UUID(state["node_id"])
+            self.current_term = state["current_term"]
+            self.voted_for = None if state["voted_for"] is None else uuid.UUID(state["voted_for"])
+        else:
+            self.node_id = uuid.uuid4()
+            self.current_term = 0
+            self.voted_for = None
+            self.state_changed = True
+            self.sync()
+        snapshot = self.load_snapshot()
+        if snapshot is not None:
+            self.log.compact(snapshot[0], snapshot[1])
+
+    @property
+    def dirty(self):
+        return self.state_changed or self.log.dirty
+
+    def save_state(self, current_term, voted_for):
+        if (current_term, voted_for) != (self.current_term, self.voted_for):
+            self.current_term = current_term
+            self.voted_for = voted_for
+            self.state_changed = True
+
+    def save_snapshot(self, index, term, data):
+        # written straight away: the log prefix it replaces is deleted right after
+        write_atomically(self.snapshot_path, SNAPSHOT_HEADER.pack(index, term, zlib.crc32(data)) + data)
+        self.log.compact(index, term)
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "rb") as snapshot_file:
+            contents = snapshot_file.read()
+        index, term, checksum = SNAPSHOT_HEADER.unpack_from(contents)
+        data = contents[SNAPSHOT_HEADER.size :]
+        if zlib.crc32(data) != checksum:
+            raise ValueError(f"corrupt snapshot in {self.snapshot_path}")
+        return index, term, data
+
+    def sync(self):
+        self.log.sync()
+        if self.state_changed:
+            state = {
+                "node_id": str(self.node_id),
+                "current_term": self.current_term,
+                "voted_for": None if self.voted_for is None else str(self.voted_for),
+            }
+            write_atomically(self.state_path, json.dumps(state).encode())
+            self.state_changed = False
+
+    def close(self):
+        self.log.close()
+
+
+def write_atomically(path, data):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as temporary_file:
+        temporary_file.write(data)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+    sync_directory(os.path.dirname(path))
+
+
+def sync_directory(directory):
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
@@ -0,0 +1,232 @@
+"""
+Parameter sweeps of seeded cluster simulations, spread over a process pool.
+
+A sweep runs every SimulationConfig once per seed. A worker is sent nothing but a config and a seed, rebuilds the
+cluster from them, and sends back a small dict of results, which run_sweep() yields as they come in. Runs are
+independent and deterministic, so apart from wall clock times the results don't depend on how many processes there
+are, and any run can be reproduced on its own with simulate(config, seed). summarize() aggregates them per config.
+
+    python -m src.sweep --sizes 3,5,9 --drops 0,0.05 --seeds 50 --set lease_ticks=0,400 --output results.jsonl
+    python -m src.sweep --sizes 3,9,15 --seeds 20 --set 'election_timeout_range=[1000,2000],[2000,4000]'
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations, product
+from typing import NamedTuple, Tuple
+
+from src.faults import FaultyServer, LinkFaults, run_clients
+from src.linearizability import History, check_history
+from src.raft import Node
+from src.state_machine import KeyValueStateMachine
+from src.storage import MemoryStorage
+
+# ticks a crashed leader stays down before it restarts, unless the next crash comes sooner
+RESTART_TICKS = 2000
+
+
+class SimulationConfig(NamedTuple):
+    """
+    One point of a sweep: a cluster whose links drop and delay messages, driven by closed-loop clients for `ticks`
+    ticks, with the leader crashed every `crash_every` ticks (never with 0). `node_settings` are (attribute, value)
+    pairs set on every node, such as (("lease_ticks", 400),).
+    """
+
+    cluster_size: int = 5
+    drop: float = 0.0
+    max_delay: int = 0
+    ticks: int = 20_000
+    clients: int = 5
+    keys: int = 5
+    crash_every: int = 5000
+    node_settings: Tuple = ()
+
+
+def simulate(config: SimulationConfig, seed: int) -> dict:
+    started = time.perf_counter()
+    random.seed(seed)
+    rng = random.Random(seed)
+    server = FaultyServer(
+        seed=seed, faults=LinkFaults(drop=config.drop, max_delay=config.max_delay), app_messages_limit=0
+    )
+    nodes = []
+    for i in range(config.cluster_size):
+        node = Node(server, MemoryStorage(node_id=uuid.UUID(int=i)), state_machine=KeyValueStateMachine())
+        for name, value in config.node_settings:
+            if not hasattr(node, name):
+                raise ValueError(f"nodes have no setting {name!r}")
+            setattr(node, name, value)
+        server.add_node(node)
+        nodes.append(node)
+
+    history = History()
+    failover = Failover(config.crash_every)
+    run_clients(server, history, config.ticks, config.clients, config.keys, rng=rng, on_tick=failover)
+
+    operations = history.operations()
+    return {
+        "config": config._asdict(),
+        "seed": seed,
+        "ticks": server.clock,
+        "elections": failover.elections,
+        "committed": max(node.commit_length for node in nodes),
+        "operations": sum(operation.ret != math.inf for operation in operations),
+        "linearizable": check_history(operations),
+        "diverged": committed_logs_diverge(nodes),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+class Failover:
+    """
+    The on_tick hook of a simulation: crashes the leader every `crash_every` ticks, restarts it RESTART_TICKS later,
+    and records how many ticks every leaderless stretch lasted in `elections`.
+    """
+
+    def __init__(self, crash_every):
+        self.crash_every = crash_every
+        self.crashed = None
+        self.restart_at = None
+        self.leaderless_since = 0
+        self.elections = []
+
+    def __call__(self, server):
+        if self.crashed is not None and server.clock >= self.restart_at:
+            self.restart(server)
+        if self.crash_every and server.clock and server.clock % self.crash_every == 0:
+            self.crash_leader(server)
+        self.time_election(server.leader(), server.clock)
+
+    def crash_leader(self, server):
+        leader = server.leader()
+        if leader is None:
+            return
+        if self.crashed is not None:
+            self.restart(server)
+        self.crashed, self.restart_at = leader.node_id, server.clock + RESTART_TICKS
+        server.crash(self.crashed)
+
+    def restart(self, server):
+        server.restart(self.crashed)
+        self.crashed = None
+
+    def time_election(self, leader, clock):
+        if leader is None:
+            if self.leaderless_since is None:
+                self.leaderless_since = clock
+        elif self.leaderless_since is not None:
+            self.elections.append(clock - self.leaderless_since)
+            self.leaderless_since = None
+
+
+def committed_logs_diverge(nodes):
+    # State Machine Safety: where two nodes both still have committed entries, they must be the same entries
+    for a, b in combinations(nodes, 2):
+        start = max(a.log.snapshot_index, b.log.snapshot_index)
+        end = min(a.commit_length, b.commit_length)
+        if start < end and a.log[start:end] != b.log[start:end]:
+            return True
+    return False
+
+
+def run_sweep(configs, seeds, processes=None):
+    """
+    Runs every config once per seed on `processes` worker processes (one per core by default, none with 1) and
+    yields each run's results as it finishes.
+    """
+    tasks = [(config, seed) for config in configs for seed in seeds]
+    if processes == 1:
+        for config, seed in tasks:
+            yield simulate(config, seed)
+        return
+    with ProcessPoolExecutor(processes) as pool:
+        for future in as_completed([pool.submit(simulate, config, seed) for config, seed in tasks]):
+            yield future.result()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def summarize(results) -> list:
+    """Aggregates results per config: election time percentiles in ticks, throughput and the seeds of unsafe runs."""
+    by_config = defaultdict(list)
+    for result in results:
+        by_config[json.dumps(result["config"])].append(result)
+    summaries = []
+    for runs in by_config.values():
+        elections = sorted(ticks for result in runs for ticks in result["elections"])
+        ticks = sum(result["ticks"] for result in runs)
+        seconds = sum(result["seconds"] for result in runs)
+        summaries.append(
+            {
+                "config": runs[0]["config"],
+                "runs": len(runs),
+                "elections": len(elections),
+                "election_ticks_p50": percentile(elections, 0.5),
+                "election_ticks_p99": percentile(elections, 0.99),
+                "election_ticks_max": elections[-1] if elections else None,
+                "commits_per_1000_ticks": 1000 * sum(result["committed"] for result in runs) / ticks,
+                "operations_per_1000_ticks": 1000 * sum(result["operations"] for result in runs) / ticks,
+                "simulated_ticks_per_second": ticks / seconds if seconds else None,
+                "unsafe_seeds": sorted(
+                    result["seed"] for result in runs if result["diverged"] or not result["linearizable"]
+                ),
+            }
+        )
+    return summaries
+
+
+def parse_values(text):
+    # a comma separated list of JSON values, which may be lists themselves
+    return json.loads(f"[{text}]")
+
+
+def parse_setting(text):
+    name, _, values = text.partition("=")
+    return [(name, value) for value in parse_values(values)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_values, default=[3, 5])
+    parser.add_argument("--drops", type=parse_values, default=[0.0])
+    parser.add_argument("--delays", type=parse_values, default=[0], help="maximum message delays in ticks")
+    parser.add_argument("--set", type=parse_setting, action="append", default=[], metavar="ATTRIBUTE=V1,V2")
+    parser.add_argument("--seeds", type=int, default=10, help="runs per config, with seeds counting from 0")
+    parser.add_argument("--ticks", type=int, default=SimulationConfig().ticks)
+    parser.add_argument("--crash-every", type=int, default=SimulationConfig().crash_every)
+    parser.add_argument("--processes", type=int, help="worker processes, one per core by default")
+    parser.add_argument("--output", help="append every run's results to this file as a line of JSON")
+    args = parser.parse_args(argv)
+
+    configs = [
+        SimulationConfig(size, drop, delay, args.ticks, crash_every=args.crash_every, node_settings=settings)
+        for size, drop, delay, settings in product(args.sizes, args.drops, args.delays, product(*args.set))
+    ]
+    results = []
+    output = open(args.output, "a") if args.output else None
+    try:
+        for result in run_sweep(configs, range(args.seeds), args.processes):
+            results.append(result)
+            if output is not None:
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+            print(f"\r{len(results)}/{len(configs) * args.seeds} runs", end="", file=sys.stderr, flush=True)
+    finally:
+        if output is not None:
+            output.close()
+    print(file=sys.stderr)
+    for summary in summarize(results):
+        print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+class Transport:
+    """
+    What a Node needs from the network it runs on: the ids of every member of the cluster (itself included), a way
+    to send a message to `message.destination` (everyone when that is None) and somewhere to hand committed entries.
+
+    Server is the in-memory implementation used by the simulation, TcpTransport in src.network the networked one.
+    """
+
+    def node_ids(self):
+        raise NotImplementedError
+
+    def broadcast_message(self, message):
+        raise NotImplementedError
+
+    def add_app_msgs(self, messages):
+        raise NotImplementedError
@@ -0,0 +1,29 @@
+import random
+
+from src.raft import Node, Role
+from src.state_machine import KeyValueStateMachine
+
+
+def start_cluster(server, size, seed=0, elect=True, make_node=None, **settings) -> list:
+    """
+    Seeds the random timeouts with `seed`, adds `size` nodes to `server` with `settings` set on each, and unless
+    `elect` is false runs the server until one of them leads. Nodes have a KeyValueStateMachine unless
+    `make_node(server)` makes them.
+    """
+    random.seed(seed)
+    nodes = []
+    for _ in range(size):
+        node = Node(server, state_machine=KeyValueStateMachine()) if make_node is None else make_node(server)
+        for name, value in settings.items():
+            setattr(node, name, value)
+        server.add_node(node)
+        nodes.append(node)
+    if elect:
+        server.run_until(lambda: any(node.current_role is Role.LEADER for node in nodes))
+    return nodes
+
+
+def split_leader(nodes):
+    """Returns the leader among `nodes` and the others."""
+    leader = next(node for node in nodes if node.current_role is Role.LEADER)
+    return leader, [node for node in nodes if node is not leader]
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from src.apply import ApplyStream
+from src.raft import Node, OverloadedError, Server
+from src.state_machine import KeyValueStateMachine
+from tests.cluster import split_leader, start_cluster
+
+
+class ApplyStreamTestCase(unittest.TestCase):
+    def start_cluster(self, capacity, max_unapplied_entries=None):
+        self.server = Server()
+        nodes = start_cluster(
+            self.server,
+            3,
+            make_node=lambda server: Node(
+                server, state_machine=KeyValueStateMachine(), apply_stream=ApplyStream(capacity)
+            ),
+            max_unapplied_entries=max_unapplied_entries,
+        )
+        leader, followers = split_leader(nodes)
+        # until the leader's no-op is applied, so that it counts against nobody's backlog
+        self.server.run_until(lambda: leader.last_applied)
+        return leader, followers
+
+    def test_slow_consumer_holds_back_applying(self):
+        leader, followers = self.start_cluster(capacity=4)
+        futures = leader.propose_many(("set", "x", i) for i in range(10))
+        self.server.run_for(100)
+        assert all(future.done() for future in futures)
+        # everything committed, but only what fits in the stream was applied
+        assert leader.commit_length == 11
+        assert leader.last_applied == 5
+        assert leader.state_machine.data == {"x": 3}
+        read = leader.read("x")
+        self.server.run_for(100)
+        assert not read.done()
+
+        # the stream has log indexes, the leader's no-op is at 0
+        assert [index for index, _ in leader.apply_stream.take(2)] == [1, 2]
+        assert leader.last_applied == 7
+        assert list(leader.apply_stream) == [(i + 1, ("set", "x", i)) for i in range(2, 10)]
+        assert leader.last_applied == 11
+        assert self.server.app_messages == []
+        # reads wait until what had committed when they came in is applied
+        self.server.run_for(100)
+        assert read.result() == 9
+
+    def test_backlog_limits_the_log(self):
+        leader, followers = self.start_cluster(capacity=2, max_unapplied_entries=6)
+        futures = leader.propose_many(("set", "x", i) for i in range(6))
+        self.server.run_for(100)
+        futures += leader.propose_many(("set", "x", i) for i in range(6, 8))
+        # the followers had applied nothing when the last two arrived, so they wait for a heartbeat
+        assert self.server.run_until(lambda: all(future.done() for future in futures), max_ticks=100000)
+        future = leader.propose(("set", "x", 8))
+        assert isinstance(future.exception(timeout=0), OverloadedError)
+        # the no-op and what fits in the stream
+        assert all(node.last_applied == 3 for node in [leader] + followers)
+
+        # a follower that doesn't consume stops accepting entries, the other one keeps the commits going
+        for node in [leader, followers[1]]:
+            list(node.apply_stream)
+        futures = leader.propose_many(("set", "y", i) for i in range(4))
+        self.server.run_for(100)
+        assert all(future.done() for future in futures)
+        assert len(followers[0].log) == followers[0].last_applied + 6 < len(leader.log)
+        list(followers[0].apply_stream)
+        assert self.server.run_until(lambda: len(followers[0].log) == len(leader.log), max_ticks=100000)
+
+    def test_lone_voter_read_waits_for_the_consumer(self):
+        leader, followers = self.start_cluster(capacity=2)
+        change = leader.change_membership([leader.node_id], [node.node_id for node in followers])
+        assert self.server.run_until(change.done, max_ticks=10000)
+        futures = leader.propose_many(("set", "x", i) for i in range(4))
+        self.server.run_for(100)
+        assert all(future.done() for future in futures)
+        # the leader is a quorum of its own and confirms every read round at once, but the read still has to wait
+        # for the stream to drain
+        read = leader.read("x")
+        assert not read.done()
+        assert [message for _, message in leader.apply_stream] == [("set", "x", i) for i in range(4)]
+        self.server.run_for(100)
+        assert read.result() == 3
+
+    def test_async_iteration(self):
+        leader, _ = self.start_cluster(capacity=2)
+        leader.propose_many(("set", "x", i) for i in range(8))
+
+        async def consume():
+            received = []
+            async for index, message in leader.apply_stream:
+                received.append(message)
+                if len(received) == 8:
+                    return received
+
+        async def run():
+            consumer = asyncio.ensure_future(consume())
+            while not consumer.done():
+                self.server.iterate()
+                await asyncio.sleep(0)
+            return consumer.result()
+
+        assert asyncio.run(run()) == [("set", "x", i) for i in range(8)]
+
+
+if __name__ == "__main__":
+    unittest.main()
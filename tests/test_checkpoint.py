@@ -0,0 +1,92 @@
+import random
+import unittest
+
+from src.faults import FaultyServer, LinkFaults
+from src.metrics import Metrics
+from src.raft import Node
+from tests.cluster import start_cluster
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FaultyServer(seed=0, faults=LinkFaults(drop=0.1, min_delay=1, max_delay=20))
+        start_cluster(self.server, 5)
+        futures = self.server.leader().propose_many(("set", "x", i) for i in range(100))
+        self.server.run_until(lambda: all(future.done() for future in futures), max_ticks=100000)
+
+    def outcome(self, server):
+        server.run_until(lambda: server.leader() is not None, max_ticks=100000)
+        leader = server.leader()
+        return server.clock, leader.node_id, leader.current_term
+
+    def test_forks_replay_the_same_continuation(self):
+        self.server.crash(self.server.leader().node_id)
+        checkpoint = self.server.checkpoint()
+        first = checkpoint.fork()
+        outcome = self.outcome(first)
+        assert self.outcome(checkpoint.fork()) == outcome
+        random.setstate(checkpoint.random_state)
+        assert self.outcome(self.server) == outcome
+        assert first.nodes[0] is not self.server.nodes[0]
+
+        # and a reseeded fork explores another one
+        outcomes = set()
+        for seed in range(10):
+            fork = checkpoint.fork()
+            random.seed(seed)
+            fork.random.seed(seed)
+            outcomes.add(self.outcome(fork))
+        assert len(outcomes) > 1
+
+    def test_logs_are_copied_on_write(self):
+        leader = self.server.leader()
+        applied = [node.state_machine.data.copy() for node in self.server.nodes]
+        fork = self.server.checkpoint().fork()
+        fork_leader = fork.leader()
+        assert fork_leader.node_id == leader.node_id and fork_leader is not leader
+        assert fork_leader.log.payloads is leader.log.payloads
+
+        future = fork_leader.propose(("set", "x", "fork"))
+        assert fork_leader.log.payloads is not leader.log.payloads
+        assert len(fork_leader.log) == len(leader.log) + 1
+        assert fork.run_until(future.done, max_ticks=100000)
+        assert [node.state_machine.data for node in self.server.nodes] == applied
+        assert fork_leader.state_machine.data == {"x": "fork"}
+
+        # the original can keep writing too, and ends up with its own columns
+        del leader.log[len(leader.log) - 1 :]
+        assert len(leader.log) == 100
+        assert len(fork_leader.log) == 102
+
+    def test_pending_requests_fork_their_futures(self):
+        leader = self.server.leader()
+        future = leader.propose(("set", "y", 1))
+        fork = self.server.checkpoint().fork()
+        index, forked = [(i, f) for _, i, f in fork.leader().proposal_futures][0]
+        assert forked is not future
+        assert fork.run_until(forked.done, max_ticks=100000)
+        assert forked.result() == index
+        assert not future.done()
+
+    def test_forks_have_their_own_metrics(self):
+        server = FaultyServer(seed=0, metrics=Metrics())
+        for node in start_cluster(server, 3, make_node=lambda server: Node(server, metrics=Metrics())):
+            node.enable_profiling()
+        fork = server.checkpoint().fork()
+        futures = fork.leader().propose_many(range(5))
+        assert fork.run_until(lambda: all(future.done() for future in futures), max_ticks=10000)
+
+        original, forked = server.metrics_snapshot(), fork.metrics_snapshot()
+        leader_id = str(fork.leader().node_id)
+        assert forked["nodes"][leader_id]["log_length"] == original["nodes"][leader_id]["log_length"] + 5
+        assert forked["nodes"][leader_id]["commit_length"] == fork.leader().commit_length
+        assert original["nodes"][leader_id]["commit_length"] == server.leader().commit_length
+        assert (
+            forked["nodes"][leader_id]["handle_message_seconds"]["count"]
+            > original["nodes"][leader_id]["handle_message_seconds"]["count"]
+        )
+        assert forked["server"]["message_queue_length"] == len(fork.message_queue)
+
+
+if __name__ == "__main__":
+    unittest.main()
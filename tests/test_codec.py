@@ -0,0 +1,103 @@
+import unittest
+import zlib
+from uuid import uuid4
+
+from src.codec import COMPRESSED, DecodeError, decode, encode, put_varint
+from src.membership import Configuration
+from src.messages import InstallSnapshot, LogMessage, LogRequest, LogResponse, VoteRequest, VoteResponse
+
+
+class CodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.leader_id, self.follower_id = uuid4(), uuid4()
+
+    def log_request(self, entries):
+        return LogRequest(
+            term=300,
+            leader_id=self.leader_id,
+            entries=entries,
+            previous_log_index=1 << 40,
+            previous_log_term=299,
+            commit_length=12,
+            to_node=self.follower_id,
+            read_round=7,
+        )
+
+    def test_messages_round_trip(self):
+        configuration = Configuration(frozenset([self.leader_id]), frozenset([self.follower_id]), frozenset([uuid4()]))
+        messages = [
+            self.log_request([]),
+            self.log_request([LogMessage(1, b"x" * 200), LogMessage(2, None), LogMessage(300, configuration)]),
+            LogResponse(self.follower_id, 300, False, 0, self.leader_id, 3, 299, 17, 12, 4096),
+            LogResponse(self.follower_id, 1, True, 5),
+            VoteRequest(self.leader_id, 2, 10, 1),
+            VoteResponse(self.follower_id, self.leader_id, 2, True),
+            VoteRequest(self.leader_id, 3, 10, 1, pre_vote=True),
+            VoteResponse(self.follower_id, self.leader_id, 3, False, pre_vote=True),
+            InstallSnapshot(3, self.leader_id, 100, 2, 0, b"snapshot", True, self.follower_id),
+        ]
+        for message in messages:
+            decoded = decode(encode(message))
+            assert type(decoded) is type(message)
+            assert decoded == message
+
+    def test_payloads_are_views_of_the_buffer(self):
+        data = bytearray(encode(self.log_request([LogMessage(1, b"abc"), LogMessage(1, b"def")])))
+        entries = decode(data).entries
+        assert isinstance(entries.payloads[0], memoryview)
+        assert entries.payloads[0].obj is data
+        data[data.index(b"abc")] = ord("x")
+        assert entries[0].message == b"xbc"
+
+    def test_large_batches_compress(self):
+        entries = [LogMessage(4, b"a repetitive payload " * 10) for _ in range(100)]
+        plain = encode(self.log_request(entries))
+        compressed = encode(self.log_request(entries), compress_over=1024)
+        assert len(compressed) < len(plain) // 10
+        assert decode(compressed) == decode(plain) == self.log_request(entries)
+        assert encode(self.log_request(entries[:1]), compress_over=1024) == encode(self.log_request(entries[:1]))
+
+    def compressed_request(self, count, length, block):
+        # a LogRequest with a hand-made compressed entry block: an empty one's encoding ends with its flags and count
+        data = bytearray(encode(self.log_request([]))[:-2])
+        data.append(COMPRESSED)
+        put_varint(data, count)
+        put_varint(data, length)
+        return bytes(data + zlib.compress(block))
+
+    def test_compressed_entries_must_match_their_header(self):
+        entries = [LogMessage(1, b"payload")] * 3
+        plain = encode(self.log_request(entries))
+        block = plain[len(encode(self.log_request([]))) :]
+        assert decode(self.compressed_request(3, len(block), block)) == self.log_request(entries)
+        for count, length, data in [
+            (3, len(block) - 1, block),
+            (3, len(block) + 1, block),
+            (2, len(block), block),
+            (3, len(block), block + b"\0"),
+            (0, 0, block),
+            # a block that inflates far beyond what it declares is turned down without inflating all of it
+            (1, 10, b"\0" * (1 << 24)),
+        ]:
+            with self.assertRaises(DecodeError):
+                decode(self.compressed_request(count, length, data))
+        with self.assertRaises(DecodeError):
+            decode(self.compressed_request(3, len(block), block)[:-1])
+
+    def test_bad_input(self):
+        with self.assertRaises(TypeError):
+            encode(self.log_request([LogMessage(1, "not bytes")]))
+        with self.assertRaises(ValueError):
+            encode(VoteRequest(self.leader_id, -1, 0, 0))
+        data = encode(self.log_request([LogMessage(1, b"payload")]))
+        for length in range(len(data)):
+            with self.assertRaises(DecodeError):
+                decode(data[:length])
+        with self.assertRaises(DecodeError):
+            decode(data + b"\0")
+        with self.assertRaises(DecodeError):
+            decode(b"\x02" + data[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import random
+import unittest
+
+from src.faults import FaultyServer, LinkFaults, run_clients
+from src.linearizability import History, check_history
+from src.messages import VoteRequest
+from src.raft import ELECTION_TIMEOUT_RANGE, Role
+from tests.cluster import start_cluster
+
+
+class FaultyServerTestCase(unittest.TestCase):
+    def start_cluster(self, size, seed=0, faults=LinkFaults(), elect=False, **settings):
+        server = FaultyServer(seed=seed, faults=faults)
+        return server, start_cluster(server, size, seed, elect=elect, **settings)
+
+    def vote_request(self, node):
+        return VoteRequest(candidate_id=node.node_id, term=1, last_log_index=0, last_log_term=0)
+
+    def test_dropped_links_deliver_nothing(self):
+        server, (a, b) = self.start_cluster(2)
+        server.set_link_faults(a.node_id, b.node_id, LinkFaults(drop=1.0))
+        server.broadcast_message(self.vote_request(a))
+        server.iterate()
+        assert b.current_term == 0
+
+    def test_delayed_messages_arrive_late(self):
+        server, (a, b) = self.start_cluster(2, faults=LinkFaults(min_delay=10, max_delay=10))
+        server.broadcast_message(self.vote_request(a))
+        server.iterate()
+        assert b.current_term == 0
+        assert server.ticks_until_delivery() == 9
+        server.run_for(9)
+        assert b.current_term == 0
+        server.iterate()
+        assert b.current_term == 1
+
+    def test_duplicates(self):
+        server, (a, b) = self.start_cluster(2, faults=LinkFaults(duplicate=1.0, min_delay=1, max_delay=1))
+        server.broadcast_message(self.vote_request(a))
+        server.iterate()
+        assert len(server.in_flight) == 2
+
+    def test_minority_partition_makes_no_progress(self):
+        server, nodes = self.start_cluster(5, elect=True)
+        leader = server.leader()
+        others = [node for node in nodes if node is not leader]
+        server.partition([leader.node_id, others[0].node_id], [node.node_id for node in others[1:]])
+        future = leader.propose(("set", "x", 1))
+        server.run_until(lambda: server.leader() not in (None, leader), max_ticks=1_000_000)
+        new_leader = server.leader()
+        assert new_leader in others[1:]
+        assert not future.done() or future.exception() is not None
+        server.heal()
+        assert server.run_until(lambda: leader.current_role is Role.FOLLOWER, max_ticks=1_000_000)
+
+    def test_crash_and_restart(self):
+        server, nodes = self.start_cluster(3, elect=True)
+        leader = server.leader()
+        futures = leader.propose_many([("set", i, i) for i in range(5)])
+        server.run_until(lambda: all(future.done() for future in futures))
+        server.crash(leader.node_id)
+        assert server.run_until(lambda: server.leader() not in (None, leader), max_ticks=1_000_000)
+        new_leader = server.leader()
+        assert server.run_until(lambda: new_leader.state_machine.data == {i: i for i in range(5)}, max_ticks=100_000)
+        server.restart(leader.node_id)
+        assert leader.current_role is Role.FOLLOWER
+        assert leader.last_applied == 0
+        assert leader.state_machine.data == {}
+        future = new_leader.propose(("set", "x", 1))
+        assert server.run_until(lambda: leader.state_machine.data.get("x") == 1, max_ticks=1_000_000)
+        # after both leaders' no-ops
+        assert future.result() == 7
+
+    def test_histories_stay_linearizable_under_faults(self):
+        for seed, lease_ticks in ((0, 0), (1, ELECTION_TIMEOUT_RANGE[0])):
+            faults = LinkFaults(drop=0.05, duplicate=0.05, max_delay=3, reorder=0.05)
+            server, nodes = self.start_cluster(5, seed, faults, lease_ticks=lease_ticks)
+            history = History()
+            rng = random.Random(seed)
+            run_clients(server, history, 5000, rng=rng)
+            server.partition([node.node_id for node in nodes[:2]], [node.node_id for node in nodes[2:]])
+            run_clients(server, history, 5000, rng=rng)
+            server.heal()
+            server.crash(nodes[2].node_id)
+            run_clients(server, history, 5000, rng=rng)
+            server.restart(nodes[2].node_id)
+            run_clients(server, history, 5000, rng=rng)
+
+            operations = history.operations()
+            assert sum(op.kind == "write" and op.ret != float("inf") for op in operations) > 100
+            assert check_history(operations)
+
+    def isolate_follower(self, pre_vote):
+        server, nodes = self.start_cluster(5, elect=True, pre_vote=pre_vote)
+        leader = server.leader()
+        follower = next(node for node in nodes if node is not leader)
+        server.partition([follower.node_id], [node.node_id for node in nodes if node is not follower])
+        server.run_for(10 * ELECTION_TIMEOUT_RANGE[1])
+        server.heal()
+        server.run_for(2 * ELECTION_TIMEOUT_RANGE[1])
+        return leader, follower
+
+    def test_rejoining_node_does_not_depose_the_leader(self):
+        leader, follower = self.isolate_follower(pre_vote=True)
+        assert leader.current_role is Role.LEADER
+        assert follower.current_term == leader.current_term == 1
+        assert follower.current_leader == leader.node_id
+
+        # without pre-votes the isolated node's term runs away and its return forces an election
+        leader, follower = self.isolate_follower(pre_vote=False)
+        assert follower.current_term > 2
+        assert leader.current_term == follower.current_term
+
+    def test_leader_cut_off_from_quorum_steps_down(self):
+        server, nodes = self.start_cluster(5, elect=True)
+        leader = server.leader()
+        others = [node for node in nodes if node is not leader]
+        server.partition([leader.node_id, others[0].node_id], [node.node_id for node in others[1:]])
+        future = leader.propose(("set", "x", 1))
+        assert server.run_until(
+            lambda: leader.current_role is Role.FOLLOWER,
+            max_ticks=ELECTION_TIMEOUT_RANGE[0] + leader.heartbeat_interval,
+        )
+        assert future.exception() is not None
+
+        # without check_quorum a leader on its own carries on
+        server.heal()
+        server.run_until(lambda: server.leader() is not None)
+        leader = server.leader()
+        leader.check_quorum = False
+        server.partition([leader.node_id], [node.node_id for node in nodes if node is not leader])
+        server.run_for(10 * ELECTION_TIMEOUT_RANGE[1])
+        assert leader.current_role is Role.LEADER
+
+    def test_failover_does_not_slow_down_with_cluster_size(self):
+        for size in (3, 9, 15):
+            server, nodes = self.start_cluster(size)
+            for _ in range(5):
+                server.run_until(lambda: server.leader() is not None)
+                server.run_for(ELECTION_TIMEOUT_RANGE[1])
+                leader = server.leader()
+                server.crash(leader.node_id)
+                # the followers notice within ELECTION_TIMEOUT_RANGE, whatever the cluster's size
+                assert server.run_until(lambda: server.leader() is not None, max_ticks=3 * ELECTION_TIMEOUT_RANGE[1])
+                server.restart(leader.node_id)
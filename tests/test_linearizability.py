@@ -0,0 +1,82 @@
+import math
+import random
+import time
+import unittest
+
+from src.linearizability import Operation, check_history, check_register
+
+
+def write(call, ret, value, key=0, client=0):
+    return Operation(client, call, ret, "write", key, value)
+
+
+def read(call, ret, value, key=0, client=0):
+    return Operation(client, call, ret, "read", key, value)
+
+
+def concurrent_history(count, clients, keys, seed):
+    # clients overlap freely; every operation takes effect at some instant between its call and its return
+    rng = random.Random(seed)
+    values = {}
+    time = 0
+    started, applied, operations = {}, {}, []
+    while len(operations) < count or started or applied:
+        time += 1
+        choice = rng.random()
+        idle = [client for client in range(clients) if client not in started and client not in applied]
+        if choice < 0.4 and idle and len(operations) + len(started) + len(applied) < count:
+            client = rng.choice(idle)
+            kind = "read" if rng.random() < 0.5 else "write"
+            started[client] = (time, kind, rng.randrange(keys), time)
+        elif choice < 0.7 and started:
+            client = rng.choice(list(started))
+            call, kind, key, value = started.pop(client)
+            if kind == "write":
+                values[key] = value
+            else:
+                value = values.get(key)
+            applied[client] = (call, kind, key, value)
+        elif applied:
+            client = rng.choice(list(applied))
+            call, kind, key, value = applied.pop(client)
+            operations.append(Operation(client, call, time, kind, key, value))
+    return operations
+
+
+class LinearizabilityTestCase(unittest.TestCase):
+    def test_sequential(self):
+        assert check_register([read(1, 2, None), write(3, 4, 1), read(5, 6, 1), write(7, 8, 2), read(9, 10, 2)])
+
+    def test_stale_read(self):
+        assert not check_register([write(1, 2, 1), write(3, 4, 2), read(5, 6, 1)])
+
+    def test_concurrent_read_sees_either_value(self):
+        assert check_register([write(1, 2, 1), write(3, 6, 2), read(4, 5, 1)])
+        assert check_register([write(1, 2, 1), write(3, 6, 2), read(4, 5, 2)])
+        assert not check_register([write(1, 2, 1), write(3, 6, 2), read(4, 5, 3)])
+
+    def test_reads_can_not_go_back_in_time(self):
+        assert not check_register([write(1, 6, 1), read(2, 3, 1), read(4, 5, None)])
+
+    def test_unknown_write_may_or_may_not_happen(self):
+        assert check_register([write(1, math.inf, 1), read(2, 3, None)])
+        assert check_register([write(1, math.inf, 1), read(2, 3, 1)])
+        assert check_register([write(1, math.inf, 1), read(2, 3, None), read(4, 5, 1)])
+        assert not check_register([write(1, math.inf, 1), read(2, 3, 1), read(4, 5, None)])
+
+    def test_keys_are_checked_independently(self):
+        assert check_history([write(1, 2, 1, key="a"), read(3, 4, None, key="b"), read(5, 6, 1, key="a")])
+        assert not check_history([write(1, 2, 1, key="a"), read(3, 4, 1, key="b")])
+
+    def test_large_history(self):
+        operations = concurrent_history(50_000, clients=8, keys=20, seed=1)
+        started = time.perf_counter()
+        assert check_history(operations)
+        assert time.perf_counter() - started < 10
+
+        # one stale read anywhere is caught
+        reads = [i for i, op in enumerate(operations) if op.kind == "read" and op.value is not None]
+        broken = list(operations)
+        i = reads[len(reads) // 2]
+        broken[i] = broken[i]._replace(value=-1)
+        assert not check_history(broken)
@@ -0,0 +1,153 @@
+import unittest
+
+from src.faults import FaultyServer
+from src.membership import Configuration
+from src.raft import Node, Role
+from src.state_machine import KeyValueStateMachine
+from tests.cluster import start_cluster
+
+
+class ConfigurationTestCase(unittest.TestCase):
+    def test_joint_quorum_needs_both_majorities(self):
+        configuration = Configuration(frozenset("cde"), old_voters=frozenset("abc"))
+        assert configuration.joint
+        assert configuration.members() == frozenset("abcde")
+        assert not configuration.has_quorum({"a", "b", "c"})
+        assert not configuration.has_quorum({"c", "d", "e"})
+        assert configuration.has_quorum({"a", "c", "d"})
+        lengths = {"a": 9, "b": 8, "c": 2, "d": 3, "e": 1}
+        assert configuration.quorum_length(lengths) == 2
+        assert configuration.final().quorum_length(lengths) == 2
+        assert configuration.final() == Configuration(frozenset("cde"))
+
+    def test_learners_never_count(self):
+        configuration = Configuration(frozenset("abc"), learners=frozenset("xy"))
+        assert not configuration.has_quorum({"a", "x", "y"})
+        assert configuration.quorum_length({"a": 5, "x": 5, "y": 5}) == 0
+        assert not configuration.is_voter("x")
+
+
+class MembershipTestCase(unittest.TestCase):
+    def start_cluster(self, size, seed=0):
+        self.server = FaultyServer(seed=seed)
+        nodes = start_cluster(self.server, size, seed)
+        # no change can start before the first leader's configuration commits
+        assert self.server.run_until(lambda: self.server.leader().commit_length > 0, max_ticks=10000)
+        return nodes
+
+    def join(self, count):
+        nodes = [Node(self.server, state_machine=KeyValueStateMachine(), joining=True) for _ in range(count)]
+        for node in nodes:
+            self.server.add_node(node)
+        return nodes
+
+    def change(self, voters, learners=()):
+        future = self.server.leader().change_membership(
+            [node.node_id for node in voters], [node.node_id for node in learners]
+        )
+        assert self.server.run_until(future.done, max_ticks=100000)
+        return future.result()
+
+    def test_learners_replicate_without_counting(self):
+        voters = self.start_cluster(3)
+        learners = self.join(2)
+        configuration = self.change(voters, learners)
+        assert configuration == Configuration(
+            frozenset(node.node_id for node in voters), frozenset(node.node_id for node in learners)
+        )
+        leader = self.server.leader()
+        future = leader.propose(("set", "x", 1))
+        self.server.run_until(lambda: all(node.state_machine.data == {"x": 1} for node in learners), max_ticks=10000)
+        assert future.done()
+
+        # with the other voters cut off the learners' acknowledgements don't make a quorum
+        followers = [node for node in voters if node is not leader]
+        self.server.partition(
+            [node.node_id for node in followers], [leader.node_id] + [node.node_id for node in learners]
+        )
+        commit_length = leader.commit_length
+        leader.propose(("set", "x", 2))
+        self.server.run_for(300)
+        assert all(len(node.log) == len(leader.log) for node in learners)
+        assert leader.commit_length == commit_length
+        assert all(node.state_machine.data == {"x": 1} for node in learners)
+
+    def test_joining_nodes_never_count_before_a_change(self):
+        voters = self.start_cluster(3)
+        leader = self.server.leader()
+        # the first leader's entry fixes the voters as the nodes there were when it was elected
+        assert leader.configuration == Configuration(frozenset(node.node_id for node in voters))
+        newcomers = self.join(3)
+        self.server.run_for(10000)
+        assert self.server.leader() is leader
+        future = leader.propose(("set", "x", 1))
+        assert self.server.run_until(future.done, max_ticks=10000)
+        assert future.result()
+        assert self.change(voters + newcomers).voters == frozenset(node.node_id for node in voters + newcomers)
+
+    def test_learners_never_stand_for_election(self):
+        voters = self.start_cluster(3)
+        (learner,) = self.join(1)
+        self.change(voters, [learner])
+        self.server.crash(self.server.leader().node_id)
+        self.server.run_until(lambda: self.server.leader() is not None, max_ticks=100000)
+        assert learner.current_role is Role.FOLLOWER
+        assert learner.voted_for != learner.node_id
+        assert learner.current_term == self.server.leader().current_term
+
+    def test_voters_are_replaced_while_proposals_commit(self):
+        voters = self.start_cluster(3)
+        newcomers = self.join(2)
+        self.change(voters, newcomers)
+        leader = self.server.leader()
+        futures = [leader.propose(("set", "x", i)) for i in range(20)]
+        change = leader.change_membership([node.node_id for node in voters[1:] + newcomers])
+        with self.assertRaises(ValueError):
+            leader.change_membership([node.node_id for node in voters])
+        futures += [leader.propose(("set", "y", i)) for i in range(20)]
+        assert self.server.run_until(lambda: change.done() and all(future.done() for future in futures), 100000)
+        assert change.result() == Configuration(frozenset(node.node_id for node in voters[1:] + newcomers))
+        assert [future.result() for future in futures] == sorted(future.result() for future in futures)
+
+        # the removed voter no longer counts: three of the four voters are enough to commit without it
+        self.server.crash(voters[0].node_id)
+        self.server.crash(voters[1].node_id)
+        self.server.run_until(lambda: self.server.leader() is not None and self.server.leader() is not voters[0])
+        leader = self.server.leader()
+        future = leader.propose(("set", "z", 1))
+        assert self.server.run_until(future.done, max_ticks=100000)
+        assert newcomers[0].configuration == change.result()
+
+    def test_removed_leader_steps_down(self):
+        voters = self.start_cluster(3)
+        leader = self.server.leader()
+        remaining = [node for node in voters if node is not leader]
+        configuration = self.change(remaining)
+        assert leader.current_role is Role.FOLLOWER
+        assert not leader.is_voter()
+        assert self.server.run_until(lambda: any(node.current_role is Role.LEADER for node in remaining), 100000)
+        new_leader = [node for node in remaining if node.current_role is Role.LEADER][0]
+        assert new_leader.configuration == configuration
+        assert leader.current_role is Role.FOLLOWER
+
+    def test_configuration_survives_snapshots(self):
+        voters = self.start_cluster(3)
+        for node in voters:
+            node.snapshot_threshold = 5
+        (learner,) = self.join(1)
+        self.server.crash(learner.node_id)
+        configuration = self.change(voters, [learner])
+        leader = self.server.leader()
+        for i in range(10):
+            leader.propose(("set", "x", i))
+        assert self.server.run_until(lambda: all(node.log.snapshot_index >= 5 for node in voters), max_ticks=100000)
+        assert all(node.configuration == configuration for node in voters)
+        self.server.restart(learner.node_id)
+        # every new leader adds a no-op, so wait for the data rather than an index
+        assert self.server.run_until(lambda: learner.state_machine.data == {"x": 9}, max_ticks=100000)
+        assert learner.log.snapshot_index > 0
+        assert learner.configuration == configuration
+
+
+if __name__ == "__main__":
+    unittest.main()
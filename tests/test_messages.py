@@ -0,0 +1,64 @@
+import unittest
+from uuid import uuid4
+
+from pydantic import ValidationError
+
+from src.messages import LogMessage, LogRequest, LogResponse, VoteRequest, VoteResponse, validate_message
+from src.raft import Node, Server
+
+
+class MessagesTestCase(unittest.TestCase):
+    def test_valid_messages_pass_validation(self):
+        leader_id, follower_id = uuid4(), uuid4()
+        messages = [
+            LogMessage(term=1, message="hello"),
+            LogRequest(
+                term=1,
+                leader_id=leader_id,
+                entries=[LogMessage(term=1, message="hello")],
+                previous_log_index=0,
+                previous_log_term=0,
+                commit_length=0,
+                to_node=follower_id,
+            ),
+            LogResponse(node_id=follower_id, term=1, success=True, acknowledged=1, to_node=leader_id),
+            VoteRequest(candidate_id=leader_id, term=1, last_log_index=0, last_log_term=0),
+            VoteResponse(node_id=follower_id, candidate_id=leader_id, term=1, vote_granted=True),
+        ]
+        for message in messages:
+            assert validate_message(message) is message
+
+    def test_malformed_messages_fail_validation(self):
+        with self.assertRaises(ValidationError):
+            validate_message(VoteRequest(candidate_id="not a uuid", term=1, last_log_index=0, last_log_term=0))
+        with self.assertRaises(ValidationError):
+            validate_message(LogResponse(node_id=uuid4(), term="1", success=True, acknowledged=0))
+        with self.assertRaises(ValidationError):
+            validate_message(
+                LogRequest(
+                    term=1,
+                    leader_id=uuid4(),
+                    entries=[LogMessage(term=None, message="hello")],
+                    previous_log_index=0,
+                    previous_log_term=0,
+                    commit_length=0,
+                    to_node=uuid4(),
+                )
+            )
+        with self.assertRaises(TypeError):
+            validate_message(("not", "a", "message"))
+
+    def test_strict_server_validates_messages(self):
+        message = VoteRequest(candidate_id=uuid4(), term="one", last_log_index=0, last_log_term=0)
+        Server().broadcast_message(message)
+        with self.assertRaises(ValidationError):
+            Server(strict=True).broadcast_message(message)
+
+    def test_strict_server_runs_election(self):
+        server = Server(strict=True)
+        nodes = [Node(server) for _ in range(3)]
+        for node in nodes:
+            server.add_node(node)
+        nodes[0].heartbeat_timeout = 1
+        server.run_for(10)
+        assert nodes[0].current_leader == nodes[0].node_id
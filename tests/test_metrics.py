@@ -0,0 +1,76 @@
+import unittest
+
+from src.metrics import NULL_METRICS, Histogram, Metrics
+from src.raft import Node, Server
+from tests.cluster import split_leader, start_cluster
+
+
+def profiled_node(server):
+    node = Node(server, metrics=Metrics())
+    node.enable_profiling()
+    return node
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            histogram.observe(value)
+        histogram.observe(7, count=5)
+        assert histogram.count == 10
+        assert histogram.sum == 0.5 + 5 + 5 + 50 + 500 + 35
+        assert histogram.counts == [1, 7, 1, 1]
+        assert histogram.quantile(0.5) == 10
+        assert histogram.quantile(1) == float("inf")
+
+    def test_registry_reuses_instruments(self):
+        metrics = Metrics()
+        metrics.counter("a").inc()
+        metrics.counter("a").inc(2)
+        metrics.gauge("b").set(4)
+        metrics.gauge("c", lambda: 7)
+        assert metrics.snapshot() == {"a": 3, "b": 4, "c": 7}
+
+    def test_null_metrics_record_nothing(self):
+        server = Server()
+        node = Node(server)
+        server.add_node(node)
+        node.handle_heartbeat_timeout_or_election_timeout()
+        assert node.metrics is NULL_METRICS
+        assert node.metrics.snapshot() == {}
+
+    def test_cluster_metrics(self):
+        server = Server(metrics=Metrics())
+        leader, _ = split_leader(start_cluster(server, 3, make_node=profiled_node))
+        leader.propose_many(range(10))
+        server.run_until(lambda: leader.commit_length == 11)
+
+        snapshot = server.metrics_snapshot()
+        leader_metrics = snapshot["nodes"][str(leader.node_id)]
+        assert leader_metrics["leaderships"] == 1
+        assert leader_metrics["is_leader"] == 1
+        # the leader's no-op counts as well
+        assert leader_metrics["commit_length"] == 11
+        assert leader_metrics["commit_latency_ticks"]["count"] == 11
+        assert leader_metrics["handle_message_seconds"]["count"] > 0
+        assert leader_metrics["tick_seconds"]["count"] == server.iterations_counter.value
+        assert sum(metrics["elections"] for metrics in snapshot["nodes"].values()) >= 1
+        assert snapshot["server"]["messages.VoteRequest"] >= 1
+        assert snapshot["server"]["messages.LogRequest"] >= 2
+        assert snapshot["server"]["message_queue_length"] == len(server.message_queue)
+        assert snapshot["server"]["iterations"] + snapshot["server"]["skipped_ticks"] == server.clock
+
+    def test_rejections_are_counted(self):
+        server = Server()
+        leader, _ = split_leader(start_cluster(server, 3, make_node=lambda server: Node(server, metrics=Metrics())))
+        for i in range(5):
+            leader.broadcast_log_message(i)
+        server.run_until(lambda: leader.commit_length == 6)
+        # a new, empty follower rejects until the leader has backed off to the start of its log
+        follower = Node(server)
+        server.add_node(follower)
+        leader.start_replication(follower.node_id)
+        leader.replicate_log(leader.node_id, follower.node_id)
+        server.run_until(lambda: len(follower.log) == 6)
+        assert leader.metrics.counter("log_responses_rejected").value >= 1
+        assert leader.metrics.counter("sent_length_backoffs").value >= 1
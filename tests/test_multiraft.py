@@ -0,0 +1,135 @@
+import unittest
+from collections import Counter
+
+from src.faults import FaultyServer
+from src.messages import Batch
+from src.multiraft import MEMBER_HEARTBEAT_TICKS, Member, add_groups
+from src.raft import Role, Server
+from src.state_machine import KeyValueStateMachine
+from src.storage import MemoryStorage
+from tests.cluster import start_cluster
+
+
+class BatchCountingServer(Server):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = Counter()
+        self.group_messages = 0
+
+    def broadcast_message(self, message):
+        self.batches[(message.member_id, message.to_node)] += 1
+        self.group_messages += len(message.messages)
+        super().broadcast_message(message)
+
+
+class MultiRaftTestCase(unittest.TestCase):
+    def start_cluster(self, members, groups, server=None, quiesce=True):
+        server = BatchCountingServer() if server is None else server
+        members = start_cluster(server, members, elect=False, make_node=lambda server: Member(server, quiesce=quiesce))
+        placement = add_groups(members, range(groups), state_machine=KeyValueStateMachine)
+        assert server.run_until(lambda: len(self.leaders(placement)) == groups, max_ticks=100000)
+        return server, members, placement
+
+    def leaders(self, placement):
+        return {
+            group_id: replica
+            for group_id, replicas in placement.items()
+            for replica in replicas
+            if replica.current_role is Role.LEADER
+        }
+
+    def test_groups_replicate_independently(self):
+        server, members, placement = self.start_cluster(3, 20)
+        for group_id, leader in self.leaders(placement).items():
+            leader.member.propose(group_id, ("set", "group", group_id))
+        # every group also commits its leader's no-op, so wait for the data rather than an index
+        assert server.run_until(
+            lambda: all(
+                replica.state_machine.data == {"group": group_id}
+                for group_id, replicas in placement.items()
+                for replica in replicas
+            ),
+            max_ticks=10000,
+        )
+
+    def test_heartbeats_are_coalesced_per_member_pair(self):
+        server, members, placement = self.start_cluster(3, 30, quiesce=False)
+        server.run_for(2000)
+        server.batches.clear()
+        server.group_messages = 0
+        intervals = 10
+        server.run_for(intervals * MEMBER_HEARTBEAT_TICKS)
+        assert len(server.batches) == 6
+        # one batch of heartbeats and one of responses each way per interval, however many groups there are
+        for count in server.batches.values():
+            assert count <= 2 * intervals + 2
+        assert server.group_messages >= 30 * 2 * intervals
+
+    def test_idle_groups_quiesce(self):
+        server, members, placement = self.start_cluster(3, 30)
+        server.run_for(2000)
+        server.batches.clear()
+        server.group_messages = 0
+        server.run_for(10 * MEMBER_HEARTBEAT_TICKS)
+        assert server.group_messages == 0
+        assert sum(server.batches.values()) == 6 * 10
+        assert len(self.leaders(placement)) == 30
+
+        # a proposal wakes its group up, and it goes back to sleep once everyone has caught up
+        group_id, leader = next(iter(self.leaders(placement).items()))
+        leader.member.propose(group_id, ("set", "x", 1))
+        server.run_until(lambda: all(replica.last_applied == 2 for replica in placement[group_id]), max_ticks=1000)
+        server.run_for(2 * MEMBER_HEARTBEAT_TICKS)
+        server.group_messages = 0
+        server.run_for(10 * MEMBER_HEARTBEAT_TICKS)
+        assert server.group_messages == 0
+
+    def test_groups_fail_over_when_a_member_crashes(self):
+        server, members, placement = self.start_cluster(3, 12, server=FaultyServer(seed=0))
+        crashed = members[0]
+        led = [group_id for group_id, leader in self.leaders(placement).items() if leader.member is crashed]
+        assert led
+        server.crash(crashed.node_id)
+
+        def new_leader(group_id):
+            for replica in placement[group_id]:
+                if replica.member is not crashed and replica.current_role is Role.LEADER:
+                    return replica
+
+        assert server.run_until(lambda: all(new_leader(group_id) for group_id in led), max_ticks=100000)
+        futures = [new_leader(group_id).member.propose(group_id, ("set", "x", group_id)) for group_id in led]
+        assert server.run_until(lambda: all(future.done() for future in futures), max_ticks=10000)
+        for group_id, future in zip(led, futures):
+            future.result()
+            assert new_leader(group_id).state_machine.data == {"x": group_id}
+
+        server.restart(crashed.node_id)
+        rejoined = [replica for group_id in led for replica in placement[group_id] if replica.member is crashed]
+        assert server.run_until(lambda: all(replica.state_machine.data for replica in rejoined), max_ticks=100000)
+        assert all(replica.current_role is Role.FOLLOWER for replica in rejoined)
+
+    def test_groups_recover_when_a_member_restarts_quickly(self):
+        server, members, placement = self.start_cluster(3, 20, server=FaultyServer(seed=0))
+        restarted = members[0]
+        led = [group_id for group_id, leader in self.leaders(placement).items() if leader.member is restarted]
+        assert led
+        server.crash(restarted.node_id)
+        server.run_for(300)
+        server.restart(restarted.node_id)
+        # its replicas are followers now, while the others still hear from its member well within an election timeout
+        assert server.run_until(lambda: len(self.leaders(placement)) == 20, max_ticks=100000)
+
+    def test_batches_validate_in_strict_mode(self):
+        server = BatchCountingServer(strict=True)
+        self.start_cluster(3, 5, server=server)
+        assert server.group_messages > 0
+
+    def test_replica_storage_must_carry_the_member_id(self):
+        member = Member(Server())
+        with self.assertRaises(ValueError):
+            member.add_group(0, [member.node_id], storage=MemoryStorage())
+        assert Batch(member_id=member.node_id, to_node=member.node_id, messages=[]).source == member.node_id
+
+
+if __name__ == "__main__":
+    unittest.main()
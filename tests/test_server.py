@@ -0,0 +1,119 @@
+import unittest
+from uuid import uuid4
+
+from src.raft import Node, Server, Role, VoteRequest, VoteResponse, LogRequest, LogResponse
+from tests.cluster import start_cluster
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = Server()
+        self.nodes = [Node(self.server) for _ in range(4)]
+        self.delivered = []
+        for node in self.nodes:
+            self.server.add_node(node)
+            node.handle_message = lambda message, node=node: self.delivered.append(node)
+
+    def test_node_index(self):
+        for node in self.nodes:
+            assert self.server.node_index[node.node_id] is node
+
+    def test_log_request_is_delivered_to_recipient_only(self):
+        recipient = self.nodes[2]
+        self.server.broadcast_message(
+            LogRequest(
+                term=1,
+                leader_id=self.nodes[0].node_id,
+                entries=[],
+                previous_log_index=0,
+                previous_log_term=0,
+                commit_length=0,
+                to_node=recipient.node_id,
+            )
+        )
+        self.server.iterate()
+        assert self.delivered == [recipient]
+
+    def test_vote_response_is_delivered_to_candidate_only(self):
+        candidate = self.nodes[1]
+        self.server.broadcast_message(
+            VoteResponse(node_id=self.nodes[3].node_id, candidate_id=candidate.node_id, term=1, vote_granted=True)
+        )
+        self.server.iterate()
+        assert self.delivered == [candidate]
+
+    def test_log_response_is_delivered_to_leader_only(self):
+        leader = self.nodes[0]
+        self.server.broadcast_message(
+            LogResponse(node_id=self.nodes[1].node_id, term=1, success=True, acknowledged=0, to_node=leader.node_id)
+        )
+        self.server.iterate()
+        assert self.delivered == [leader]
+
+    def test_vote_request_is_broadcast(self):
+        self.server.broadcast_message(
+            VoteRequest(candidate_id=self.nodes[0].node_id, term=1, last_log_index=0, last_log_term=0)
+        )
+        self.server.iterate()
+        assert self.delivered == self.nodes
+
+    def test_message_to_unknown_node_is_dropped(self):
+        self.server.broadcast_message(
+            LogResponse(node_id=self.nodes[1].node_id, term=1, success=True, acknowledged=0, to_node=uuid4())
+        )
+        self.server.iterate()
+        assert self.delivered == []
+        assert len(self.server.message_queue) == 0
+
+
+class SchedulerTestCase(unittest.TestCase):
+    @staticmethod
+    def build_cluster(seed, size):
+        server = Server()
+        start_cluster(server, size, seed, elect=False, make_node=Node)
+        return server
+
+    @staticmethod
+    def cluster_state(server):
+        return [
+            (
+                node.clock,
+                node.current_role,
+                node.current_term,
+                node.heartbeat_timeout,
+                node.election_timeout,
+                len(node.log),
+                node.commit_length,
+            )
+            for node in server.nodes
+        ]
+
+    def test_run_for_matches_iterate(self):
+        for seed in range(5):
+            stepped = self.build_cluster(seed, 5)
+            for _ in range(50000):
+                stepped.iterate()
+            scheduled = self.build_cluster(seed, 5)
+            scheduled.run_for(50000)
+            assert scheduled.clock == stepped.clock == 50000
+            assert self.cluster_state(scheduled) == self.cluster_state(stepped)
+
+    def test_run_until_leader(self):
+        stepped = self.build_cluster(7, 9)
+        while not any(node.current_role is Role.LEADER for node in stepped.nodes):
+            stepped.iterate()
+        scheduled = self.build_cluster(7, 9)
+        assert scheduled.run_until(lambda: any(node.current_role is Role.LEADER for node in scheduled.nodes))
+        assert scheduled.clock == stepped.clock
+        assert self.cluster_state(scheduled) == self.cluster_state(stepped)
+
+    def test_run_until_gives_up_after_max_ticks(self):
+        server = self.build_cluster(0, 3)
+        assert not server.run_until(lambda: False, max_ticks=1000)
+        assert server.clock == 1000
+        assert all(node.clock == 1000 for node in server.nodes)
+
+    def test_run_for_without_nodes(self):
+        server = Server()
+        server.run_for(100)
+        assert server.clock == 100
@@ -0,0 +1,24 @@
+import unittest
+
+from src.state_machine import KeyValueStateMachine, StateMachine
+
+
+class KeyValueStateMachineTestCase(unittest.TestCase):
+    def test_set_and_delete(self):
+        state_machine = KeyValueStateMachine()
+        state_machine.apply(("set", "a", 1))
+        state_machine.apply(("set", "b", 2))
+        state_machine.apply(("delete", "a"))
+        state_machine.apply("not a command")
+        assert state_machine.query("a") is None
+        assert state_machine.query("b") == 2
+
+    def test_snapshot_round_trip(self):
+        state_machine = KeyValueStateMachine()
+        for i in range(10):
+            state_machine.apply(("set", i, str(i)))
+        restored = KeyValueStateMachine()
+        restored.restore(state_machine.snapshot())
+        assert restored.data == state_machine.data
+        restored.restore(StateMachine().snapshot())
+        assert restored.data == {}
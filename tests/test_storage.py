@@ -0,0 +1,248 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src.membership import Configuration, pack_snapshot
+from src.raft import Node, Server, LogMessage
+from src.storage import FileStorage, LogEntries, MemoryLog, MemoryStorage, SegmentedLog
+from tests.cluster import split_leader, start_cluster
+
+
+class SegmentedLogTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def open_log(self):
+        log = SegmentedLog(self.directory, segment_bytes=256)
+        self.addCleanup(log.close)
+        return log
+
+    def test_append_and_read(self):
+        log = self.open_log()
+        entries = [LogMessage(term=i // 10 + 1, message=f"entry {i}") for i in range(100)]
+        log.extend(entries)
+        assert len(log) == 100
+        assert len(log.segments) > 1
+        assert log[0] == entries[0]
+        assert log[-1] == entries[-1]
+        assert log[40:60] == entries[40:60]
+        assert log.batch(40, 5, 1 << 20) == entries[40:45]
+        assert list(log) == entries
+
+    def test_reopen(self):
+        log = self.open_log()
+        entries = [LogMessage(term=1, message={"key": i}) for i in range(50)]
+        log.extend(entries)
+        log.sync()
+        log.close()
+        assert list(self.open_log()) == entries
+
+    def test_truncate_across_segments(self):
+        log = self.open_log()
+        entries = [LogMessage(term=1, message=f"entry {i}") for i in range(100)]
+        log.extend(entries)
+        segment_count = len(log.segments)
+        del log[7:]
+        assert list(log) == entries[:7]
+        assert len(log.segments) < segment_count
+        log.append(LogMessage(term=2, message="new"))
+        log.sync()
+        log.close()
+        assert list(self.open_log()) == entries[:7] + [LogMessage(term=2, message="new")]
+
+    def test_torn_write_is_discarded(self):
+        log = self.open_log()
+        log.extend([LogMessage(term=1, message="complete"), LogMessage(term=1, message="torn")])
+        log.sync()
+        path = log.segments[-1].path
+        log.close()
+        with open(path, "r+b") as segment:
+            segment.truncate(os.path.getsize(path) - 3)
+        log = self.open_log()
+        assert list(log) == [LogMessage(term=1, message="complete")]
+        log.append(LogMessage(term=1, message="again"))
+        assert log[1].message == "again"
+
+    def test_compact_drops_whole_segments(self):
+        log = self.open_log()
+        entries = [LogMessage(term=1, message=f"entry {i}") for i in range(100)]
+        log.extend(entries)
+        segments = len(log.segments)
+        log.compact(60, 1)
+        assert len(log.segments) < segments
+        assert len(log) == 100
+        assert log.snapshot_index == 60
+        assert log.term_at(59) == 1
+        assert log[60:] == entries[60:]
+        with self.assertRaises(IndexError):
+            log[59]
+        log.sync()
+        log.close()
+
+        reopened = self.open_log()
+        reopened.compact(60, 1)
+        assert reopened.snapshot_index == 60
+        assert reopened[60:] == entries[60:]
+
+    def test_compact_with_conflicting_term_resets(self):
+        log = self.open_log()
+        log.extend(LogMessage(term=1, message=i) for i in range(20))
+        log.compact(10, 2)
+        assert len(log) == 10
+        assert log.snapshot_index == 10
+        assert log.last_term == 2
+        log.append(LogMessage(term=2, message="after"))
+        assert log[10] == LogMessage(term=2, message="after")
+
+    def test_sync_is_grouped(self):
+        log = self.open_log()
+        log.sync()
+        with mock.patch("src.storage.os.fsync") as fsync:
+            log.extend([LogMessage(term=1, message="x")] * 5)
+            log.sync()
+            log.sync()
+        assert fsync.call_count == 1
+
+
+class MemoryLogTestCase(unittest.TestCase):
+    def test_compact_keeps_absolute_indexes(self):
+        log = MemoryLog()
+        entries = [LogMessage(term=i // 5 + 1, message=i) for i in range(20)]
+        log.extend(entries)
+        log.compact(12, 3)
+        assert len(log) == 20
+        assert log.term_at(11) == 3
+        assert log[12] == entries[12]
+        assert log[-1] == entries[-1]
+        assert list(log) == entries[12:]
+        with self.assertRaises(IndexError):
+            log[11]
+        del log[15:]
+        assert len(log) == 15
+        assert log.last_term == 3
+
+    def test_slices_are_columns(self):
+        entries = [LogMessage(term=i // 5 + 1, message=str(i)) for i in range(20)]
+        log = MemoryLog(entries)
+        batch = log[4:9]
+        assert isinstance(batch, LogEntries)
+        assert batch == entries[4:9]
+        assert list(batch.terms) == [1, 2, 2, 2, 2]
+        assert batch.payloads == ["4", "5", "6", "7", "8"]
+        assert batch[1] == entries[5]
+        del log[6:]
+        assert batch == entries[4:9]
+        copy = MemoryLog()
+        copy.extend(log[0:6])
+        assert copy == log
+        assert copy.total_bytes == 6
+
+    def test_batch_limits(self):
+        log = MemoryLog(LogMessage(term=1, message=b"x" * size) for size in (10, 20, 30, 40, 50))
+        assert len(log.batch(0, 64, 60)) == 3
+        assert len(log.batch(1, 64, 60)) == 2
+        assert len(log.batch(1, 1, 60)) == 1
+        assert len(log.batch(4, 64, 10)) == 1
+        assert len(log.batch(5, 64, 10)) == 0
+        log.compact(2, 1)
+        assert len(log.batch(2, 64, 75)) == 2
+        with self.assertRaises(IndexError):
+            log.batch(1, 64, 60)
+
+
+class FileStorageTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def start_cluster(self, size, elect=False):
+        server = Server()
+        storages = [FileStorage(os.path.join(self.directory, str(i))) for i in range(size)]
+        unused = iter(storages)
+        nodes = start_cluster(server, size, elect=elect, make_node=lambda server: Node(server, next(unused)))
+        return server, nodes, storages
+
+    def test_hard_state_survives_restart(self):
+        storage = FileStorage(self.directory)
+        node = Node(Server(), storage)
+        node.current_term = 3
+        node.voted_for = node.node_id
+        node.flush()
+        storage.close()
+
+        restarted = Node(Server(), FileStorage(self.directory))
+        assert restarted.node_id == node.node_id
+        assert restarted.current_term == 3
+        assert restarted.voted_for == node.node_id
+
+    def test_cluster_restart_keeps_committed_log(self):
+        server, nodes, storages = self.start_cluster(3, elect=True)
+        leader, _ = split_leader(nodes)
+        for i in range(10):
+            leader.broadcast_log_message(i)
+        server.run_until(lambda: leader.commit_length == 11, max_ticks=10000)
+        assert leader.last_applied == 11
+        assert list(range(10)) == [message for message in server.app_messages if message in range(10)][:10]
+        for storage in storages:
+            storage.close()
+
+        server, restarted, storages = self.start_cluster(3)
+        self.addCleanup(lambda: [storage.close() for storage in storages])
+        for before, after in zip(nodes, restarted):
+            assert after.node_id == before.node_id
+            assert after.current_term == before.current_term
+            assert after.voted_for == before.voted_for
+        bootstrap = Configuration(frozenset(node.node_id for node in nodes))
+        assert list(restarted[nodes.index(leader)].log) == [
+            LogMessage(term=leader.current_term, message=i) for i in [bootstrap, *range(10)]
+        ]
+
+    def test_snapshot_survives_restart(self):
+        storage = FileStorage(self.directory, segment_bytes=256)
+        storage.log.extend(LogMessage(term=1, message=i) for i in range(50))
+        storage.save_snapshot(30, 1, pack_snapshot(None, b"state at 30"))
+        storage.sync()
+        storage.close()
+
+        storage = FileStorage(self.directory, segment_bytes=256)
+        self.addCleanup(storage.close)
+        assert storage.load_snapshot() == (30, 1, pack_snapshot(None, b"state at 30"))
+        assert storage.log.snapshot_index == 30
+        assert storage.log[30:] == [LogMessage(term=1, message=i) for i in range(30, 50)]
+        node = Node(Server(), storage)
+        assert node.commit_length == node.last_applied == 30
+
+    def test_corrupt_snapshot_is_rejected(self):
+        storage = FileStorage(self.directory)
+        storage.save_snapshot(1, 1, b"state")
+        storage.close()
+        with open(os.path.join(self.directory, "snapshot"), "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"X")
+        with self.assertRaises(ValueError):
+            FileStorage(self.directory)
+
+    def test_messages_wait_for_sync(self):
+        server, nodes, storages = self.start_cluster(2)
+        self.addCleanup(lambda: [storage.close() for storage in storages])
+        # a pre-vote changes nothing durable and goes out straight away, the vote after it bumps the term
+        nodes[0].pre_vote = False
+        nodes[0].heartbeat_timeout = 1
+        with mock.patch("src.storage.os.fsync") as fsync:
+            nodes[0].tick()
+            assert len(server.message_queue) == 0
+            assert len(nodes[0].pending_messages) == 1
+            nodes[0].flush()
+            assert fsync.called
+        assert len(server.message_queue) == 1
+
+    def test_memory_storage_sends_immediately(self):
+        server = Server()
+        node = Node(server, MemoryStorage())
+        server.add_node(node)
+        node.heartbeat_timeout = 1
+        node.tick()
+        assert len(server.message_queue) == 1
@@ -0,0 +1,38 @@
+import unittest
+
+from src.sweep import SimulationConfig, run_sweep, simulate, summarize
+
+
+class SweepTestCase(unittest.TestCase):
+    def test_pool_results_match_a_sequential_run(self):
+        configs = [
+            SimulationConfig(cluster_size=3, ticks=3000, crash_every=1000),
+            SimulationConfig(cluster_size=5, drop=0.05, max_delay=5, ticks=3000, node_settings=(("lease_ticks", 400),)),
+        ]
+
+        def key(result):
+            return str(result["config"]), result["seed"]
+
+        def deterministic(results):
+            return sorted(({k: v for k, v in result.items() if k != "seconds"} for result in results), key=key)
+
+        sequential = list(run_sweep(configs, range(3), processes=1))
+        pooled = list(run_sweep(configs, range(3), processes=2))
+        assert len(pooled) == 6
+        assert deterministic(pooled) == deterministic(sequential)
+
+        summaries = summarize(pooled)
+        assert [summary["runs"] for summary in summaries] == [3, 3]
+        for summary in summaries:
+            assert summary["unsafe_seeds"] == []
+            assert summary["elections"] >= 3
+            assert summary["election_ticks_p50"] <= summary["election_ticks_max"]
+            assert summary["commits_per_1000_ticks"] > 0
+
+    def test_unknown_settings_are_rejected(self):
+        with self.assertRaises(ValueError):
+            simulate(SimulationConfig(ticks=10, node_settings=(("lease_tick", 400),)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()